@@ -0,0 +1,19 @@
+from controller.embed import insert_embedding_logic
+from services.bulk_load import get_bulk_load, record_loaded
+
+
+async def load_bulk_logic(session_id: str, texts: list[str]):
+    """
+    Embed texts and write them into a bulk-load session's shadow table.
+    Same dedup and response shape as /insert_embedding.
+    """
+    session = get_bulk_load(session_id)
+    if session is None or session["state"] != "loading":
+        return {
+            "status": "error",
+            "message": f"No bulk load {session_id} is accepting rows.",
+        }
+    result = await insert_embedding_logic(texts, knowledge_table=session["table"])
+    if result["status"] == "success":
+        record_loaded(session_id, result["rows"])
+    return result
@@ -1,18 +1,54 @@
-import psycopg2
-from services.ai import embed_text
-from services.db import save_message
+from typing import Optional
+import psycopg
+from services.db import (
+    KNOWLEDGE_TABLE,
+    find_existing_knowledge_hashes,
+    save_messages_bulk,
+)
+from services.embed import content_hash, embed_texts
+from services.maintenance import notify_ingest
+from services.metrics import increment
 
 
-async def insert_embedding_logic(texts: list[str]):
+async def insert_embedding_logic(
+    texts: list[str], knowledge_table: Optional[str] = None
+):
     """
     Convert an array of text to embeddings and insert them into the database.
+    Texts already stored as knowledge are skipped before embedding.
+    knowledge_table targets a bulk-load shadow table instead of the live one.
     """
+    table = knowledge_table or KNOWLEDGE_TABLE
     try:
+        existing = await find_existing_knowledge_hashes(
+            [content_hash(text) for text in texts], knowledge_table=table
+        )
+        pending = []
+        seen = set(existing)
         for text in texts:
-            print("@insert_embedding_logic", "inserting...", text)
-            await save_message(text, "system")
-        return {"status": "success", "message": "Embeddings inserted successfully."}
-    except psycopg2.Error as e:
+            text_hash = content_hash(text)
+            if text_hash in seen:
+                increment("dedup.knowledge_hits")
+                print("@insert_embedding_logic", "duplicate, skipping...", text)
+                continue
+            seen.add(text_hash)
+            pending.append(text)
+        print("@insert_embedding_logic", f"embedding {len(pending)} texts...")
+        embeddings = await embed_texts(pending)
+        rows = [
+            (text, "system", None, embedding["embedding"])
+            for text, embedding in zip(pending, embeddings)
+        ]
+        stats = await save_messages_bulk(rows, knowledge_table=table)
+        if knowledge_table is None:
+            notify_ingest(stats["rows"])
+        stats["duplicates"] += len(texts) - len(rows)
+        return {
+            "status": "success",
+            "message": "Embeddings inserted successfully.",
+            **stats,
+        }
+    except psycopg.Error as e:
         print("Database error:", e)
         return {
             "status": "error",
@@ -1,10 +1,25 @@
 from fastapi import FastAPI
 from dotenv import load_dotenv
+from services.chunker import load_tokenizer
 from services.clients import check_model
-from services.db import initialize_database
+from services.db import (
+    close_db_pool,
+    initialize_database,
+    open_db_pool,
+    report_vector_index_status,
+    start_hot_index_load,
+)
+from services.maintenance import (
+    start_maintenance_scheduler,
+    stop_maintenance_scheduler,
+)
+from services.reembed import start_reembed_if_stale, stop_reembed
 from routes.health import router as health_router
 from routes.message import router as message_router
 from routes.embed import router as embed_router
+from routes.metrics import router as metrics_router
+from routes.admin import router as admin_router
+from routes.bulk_load import router as bulk_load_router
 
 import httpx
 
@@ -31,12 +46,30 @@ async def test_model_server_connection():
 @app.on_event("startup")
 async def startup_event():
     print("🚀 Starting application...")
-    initialize_database()
+    await open_db_pool()
+    await initialize_database()
+    await report_vector_index_status()
+    await load_tokenizer()
+    start_hot_index_load()
+    start_maintenance_scheduler()
     await test_model_server_connection()
+    # After the model servers were checked, so the first batches are not wasted
+    await start_reembed_if_stale()
     print("✅ Startup complete!")
 
 
+# Release pooled database connections on shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_maintenance_scheduler()
+    await stop_reembed()
+    await close_db_pool()
+
+
 # Include routers
 app.include_router(health_router)
 app.include_router(message_router)
 app.include_router(embed_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
+app.include_router(bulk_load_router)
@@ -0,0 +1,72 @@
+from fastapi import APIRouter
+from services.clients import embed_pool
+from services.db import start_hot_index_load
+from services.embed import embed_cache_stats, invalidate_embed_cache
+from services.hot_index import hot_index_status
+from services.maintenance import get_maintenance_status, run_maintenance
+from services.reembed import get_reembed_status, start_reembed, stop_reembed
+
+router = APIRouter()
+
+
+@router.get("/admin/db/maintenance")
+async def maintenance_status():
+    """Table/index size and bloat indicators, vacuum/analyze times and maintenance history"""
+    return await get_maintenance_status()
+
+
+@router.post("/admin/db/maintenance/run")
+async def maintenance_run(force: bool = False):
+    """
+    Run one maintenance pass now. force analyzes every table and allows an
+    index rebuild outside quiet hours.
+    """
+    return await run_maintenance(force=force)
+
+
+@router.get("/admin/embed_cache")
+async def embed_cache_status():
+    """Entry counts and limits of the in-memory and on-disk embedding cache"""
+    return await embed_cache_stats()
+
+
+@router.post("/admin/embed_cache/invalidate")
+async def embed_cache_invalidate():
+    """Drop every cached embedding, e.g. after changing the embedding model"""
+    return await invalidate_embed_cache()
+
+
+@router.get("/admin/embed_backends")
+async def embed_backends_status():
+    """Load, error counts and ejection state of each embed server"""
+    return embed_pool.status()
+
+
+@router.get("/admin/hot_index")
+async def hot_index_state():
+    """Rows, IVF lists and memory of the in-process knowledge index"""
+    return hot_index_status()
+
+
+@router.post("/admin/hot_index/rebuild")
+async def hot_index_rebuild():
+    """Reload the hot index from Postgres in the background"""
+    return {"started": start_hot_index_load(), **hot_index_status()}
+
+
+@router.get("/admin/reembed")
+async def reembed_status():
+    """Knowledge rows per embedding model and the re-embed job's checkpoint"""
+    return await get_reembed_status()
+
+
+@router.post("/admin/reembed/start")
+async def reembed_start():
+    """Re-embed knowledge stored by other models with EMBED_MODEL_ID (resumable)"""
+    return {"started": start_reembed()}
+
+
+@router.post("/admin/reembed/stop")
+async def reembed_stop():
+    """Pause the re-embed job; it continues from its checkpoint when started again"""
+    return {"stopped": await stop_reembed()}
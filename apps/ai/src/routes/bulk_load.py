@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+from controller.bulk_load import load_bulk_logic
+from services.bulk_load import (
+    abort_bulk_load,
+    begin_bulk_load,
+    bulk_load_status,
+    finish_bulk_load,
+)
+
+router = APIRouter()
+
+
+@router.post("/bulk_load/begin")
+async def bulk_load_begin():
+    """
+    Start a bulk-load session. Rows loaded into it skip live index maintenance;
+    searches keep using the current table until the session finishes.
+    """
+    return await begin_bulk_load()
+
+
+@router.post("/bulk_load/{session_id}/load")
+async def bulk_load_load(session_id: str, texts: list[str]):
+    """Embed texts and add them to the session (same body as /insert_embedding)"""
+    return await load_bulk_logic(session_id, texts)
+
+
+@router.post("/bulk_load/{session_id}/finish")
+async def bulk_load_finish(session_id: str):
+    """Build the indexes in the background, then swap the loaded table in"""
+    return await finish_bulk_load(session_id)
+
+
+@router.post("/bulk_load/{session_id}/abort")
+async def bulk_load_abort(session_id: str):
+    """Discard a session that has not started building"""
+    return await abort_bulk_load(session_id)
+
+
+@router.get("/bulk_load/{session_id}")
+async def bulk_load_get(session_id: str):
+    """Session state, row counts and index build progress"""
+    return await bulk_load_status(session_id)
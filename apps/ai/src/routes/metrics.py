@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from services.metrics import snapshot
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """In-process counters, timers and histograms since the service started"""
+    return snapshot()
@@ -2,11 +2,15 @@ import os
 import base64
 import time
 from typing import Optional
-from services.embed import chunk_text, embed_text
+from services.chunker import chunk_text
+from services.context import assemble_context
+from services.embed import content_hash, embed_texts
 from services.audio import play_audio, text_to_speech_yapper
-from services.db import get_embeddings_from_db, get_recent_messages, save_message
+from services.db import get_retrieval_context, save_message
 from services.clients import model_main
 from services.logger import get_logger
+from services.metrics import SIZE_BUCKETS, histogram, track_request
+from utils.constants import CONTEXT_CONFIG
 
 
 def initialize_session_logging(session_id: str) -> str:
@@ -58,6 +62,8 @@ async def stream_response_logic(
     """
     # Get logger instance
     logger = get_logger()
+    # Counts this request's embed calls (cache misses sent to the embed server)
+    request_counters = track_request()
 
     try:
         # Setup session logging if not already done
@@ -92,20 +98,37 @@ async def stream_response_logic(
                 logger.log_error(f"Failed to save image: {str(e)}", "IMAGE_SAVE_ERROR")
 
         # Embedding and response generation logic
-        chunks = chunk_text(text, 768)
-        db_embeddings = []
+        chunks = chunk_text(text)
+        chunk_embeddings = await embed_texts(chunks)
+        # Knowledge candidates over all chunks and the last 30 messages in one round
+        # trip; vectors come along so context assembly can spot redundant chunks
+        db_embeddings, recent_messages = await get_retrieval_context(
+            chunk_embeddings,
+            query_texts=chunks,
+            session_id=session_id,
+            history_limit=30,
+            limit=CONTEXT_CONFIG["candidates"],
+            with_vectors=True,
+        )
+        # Vectors computed for retrieval are stored as-is instead of re-embedding
+        vectors = {
+            content_hash(chunk): embedding["embedding"]
+            for chunk, embedding in zip(chunks, chunk_embeddings)
+        }
         for chunk in chunks:
-            embedding = await embed_text(chunk)
-            chunk_db_embeddings = await get_embeddings_from_db(embedding)
-            db_embeddings.extend(chunk_db_embeddings)
-            await save_message(chunk, "user", session_id)
+            await save_message(
+                chunk, "user", session_id, embedding=vectors[content_hash(chunk)]
+            )
 
-        # Log embedding context
-        logger.log_embedding_context(len(db_embeddings))
+        # Diverse, relevant chunks within the token budget become the context
+        embedding_context, context_stats = assemble_context(db_embeddings)
 
-        # Convert embedding to a string representation for context
-        embedding_context = "\n".join(
-            [f"- {item['message']}" for item in db_embeddings]
+        # Log embedding context
+        logger.log_embedding_context(context_stats["chunks"])
+        logger.log_and_print(
+            f"🧩 [cyan]Context: {context_stats['chunks']} of "
+            f"{context_stats['candidates']} chunks, {context_stats['tokens']} tokens "
+            f"({context_stats['tokens_saved']} saved)[/cyan]"
         )
 
         if context:
@@ -134,9 +157,6 @@ async def stream_response_logic(
             {"role": "system", "content": system_prompt},
         ]
 
-        recent_messages = await get_recent_messages(
-            limit=30, session_id=session_id
-        )  # Fetch the last 30 messages
         recent_messages.reverse()  # Reverse the list to maintain chronological order
 
         # Log recent messages instead of printing
@@ -192,7 +212,12 @@ async def stream_response_logic(
         else:
             messages.append({"role": "user", "content": final_text})
 
-        await save_message(text, "user", session_id)
+        # A single-chunk message is the same text (up to whitespace) as its chunk,
+        # which is already saved
+        if len(chunks) != 1 or content_hash(chunks[0]) != content_hash(text):
+            await save_message(
+                text, "user", session_id, embedding=vectors.get(content_hash(text))
+            )
 
         # ---------------------------------------------------------
         #
@@ -232,7 +257,6 @@ async def stream_response_logic(
                     print(char, end="", flush=True)
                     yield char
 
-            embedding = await embed_text(text_response)
             await save_message(text_response, "assistant", session_id)
 
             if audioResponse:
@@ -258,7 +282,6 @@ async def stream_response_logic(
                 temperature=0.1,
             )
             content = response.choices[0].message.content
-            embedding = await embed_text(content)
             await save_message(content, "assistant", session_id)
 
             audio_file_path = None
@@ -285,6 +308,13 @@ async def stream_response_logic(
             # Log the complete response
             logger.log_ai_response(content, audio_file_path)
 
+        # Each distinct text should be embedded at most once per request
+        embedded = request_counters.get("embed.texts", 0)
+        histogram("embed.texts_per_request", embedded, SIZE_BUCKETS)
+        logger.log_and_print(
+            f"🧮 [cyan]Embedded {embedded} texts for this request[/cyan]"
+        )
+
     except Exception as e:
         logger.log_error(f"Error in stream_response_logic: {str(e)}", "STREAM_ERROR")
         error_message = f"I apologize, but I encountered an error while processing your request: {str(e)}"
@@ -0,0 +1,445 @@
+import asyncio
+import re
+import time
+import uuid
+from typing import Optional
+import psycopg
+from psycopg import sql
+from services.db import (
+    KNOWLEDGE_TABLE,
+    get_db_connection,
+    open_maintenance_connection,
+    start_hot_index_load,
+)
+from services.db_index import (
+    get_vector_index_status,
+    vector_index_name,
+    vector_index_sql,
+)
+from services.logger import get_logger
+from services.maintenance import notify_ingest, record_maintenance
+from services.metrics import observe
+from utils.constants import BULK_LOAD_CONFIG
+
+# Shadow tables are named {KNOWLEDGE_TABLE}_load_<session id>
+SHADOW_PREFIX = f"{KNOWLEDGE_TABLE}_load_"
+# The live table's unique content-hash index (see db._ensure_content_hashes)
+HASH_KEY = f"{KNOWLEDGE_TABLE}_content_hash_key"
+ACTIVE_STATES = ("loading", "building", "swapping")
+
+# pg_get_indexdef output: CREATE [UNIQUE] INDEX name ON schema.table USING ...
+_INDEX_DEF = re.compile(r"^CREATE (UNIQUE )?INDEX \S+ ON \S+ (USING .+)$")
+_ANN_METHOD = re.compile(r"^USING (hnsw|ivfflat) ")
+
+# One bulk load at a time: each one ends by replacing the live knowledge table
+_session: Optional[dict] = None
+_finish_task: Optional[asyncio.Task] = None
+
+logger = get_logger()
+
+
+async def _copyable_column_names(
+    connection: psycopg.AsyncConnection, table: str
+) -> list[str]:
+    """Columns of a table without generated columns (Postgres fills those in)"""
+    cursor = await connection.execute(
+        """
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0
+        AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum
+        """,
+        (table,),
+    )
+    return [row[0] for row in await cursor.fetchall()]
+
+
+async def _copyable_columns(
+    connection: psycopg.AsyncConnection, table: str
+) -> sql.Composed:
+    """Column list of a table without generated columns"""
+    names = await _copyable_column_names(connection, table)
+    return sql.SQL(", ").join(sql.Identifier(name) for name in names)
+
+
+async def _drop_stale_shadows(connection: psycopg.AsyncConnection):
+    """Drop shadow tables left behind by an aborted, failed or interrupted load"""
+    cursor = await connection.execute(
+        "SELECT tablename FROM pg_tables WHERE tablename LIKE %s",
+        (SHADOW_PREFIX + "%",),
+    )
+    for (table,) in await cursor.fetchall():
+        await connection.execute(
+            sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table))
+        )
+        logger.log_and_print(f"Bulk load: dropped stale shadow table {table}.")
+
+
+def _shadow_hash_key(shadow: str) -> str:
+    return f"{shadow}_content_hash_key"
+
+
+def get_bulk_load(session_id: str) -> Optional[dict]:
+    """The bulk-load session with this id, if it is the current one"""
+    if _session is None or _session["session_id"] != session_id:
+        return None
+    return _session
+
+
+async def begin_bulk_load() -> dict:
+    """
+    Start a bulk-load session. The live knowledge rows are copied into a shadow table
+    that has only the content-hash key, so loads skip ANN and full-text index upkeep.
+    Searches keep using the live table and its indexes until finish_bulk_load swaps.
+    The highest copied id is kept so the swap can tell live deletions from loaded rows.
+    """
+    global _session
+
+    if _session is not None and _session["state"] in ACTIVE_STATES:
+        return {
+            "status": "error",
+            "message": (
+                f"Bulk load {_session['session_id']} is already {_session['state']}."
+            ),
+        }
+
+    session_id = uuid.uuid4().hex[:8]
+    shadow = SHADOW_PREFIX + session_id
+    async with get_db_connection() as connection:
+        await _drop_stale_shadows(connection)
+        await connection.execute(
+            sql.SQL(
+                """
+                CREATE TABLE {shadow} (LIKE {live} INCLUDING ALL EXCLUDING INDEXES);
+                CREATE UNIQUE INDEX {hash_key} ON {shadow} (content_hash);
+                """
+            ).format(
+                shadow=sql.Identifier(shadow),
+                live=sql.Identifier(KNOWLEDGE_TABLE),
+                hash_key=sql.Identifier(_shadow_hash_key(shadow)),
+            )
+        )
+        columns = await _copyable_columns(connection, KNOWLEDGE_TABLE)
+        copied = await connection.execute(
+            sql.SQL("INSERT INTO {shadow} ({columns}) SELECT {columns} FROM {live}").format(
+                shadow=sql.Identifier(shadow),
+                columns=columns,
+                live=sql.Identifier(KNOWLEDGE_TABLE),
+            )
+        )
+        cursor = await connection.execute(
+            sql.SQL("SELECT COALESCE(max(id), 0) FROM {}").format(
+                sql.Identifier(shadow)
+            )
+        )
+        (copied_max_id,) = await cursor.fetchone()
+
+    _session = {
+        "session_id": session_id,
+        "table": shadow,
+        "state": "loading",
+        "copied_rows": copied.rowcount,
+        "copied_max_id": copied_max_id,
+        "loaded_rows": 0,
+        "started_at": time.time(),
+        "finished_at": None,
+        "error": None,
+    }
+    logger.log_and_print(
+        f"Bulk load {session_id}: copied {copied.rowcount} live rows into {shadow}."
+    )
+    return {"status": "success", **_session}
+
+
+def record_loaded(session_id: str, rows: int):
+    """Count rows written into the shadow table by a load step"""
+    session = get_bulk_load(session_id)
+    if session is not None:
+        session["loaded_rows"] += rows
+
+
+async def _build_shadow_indexes(
+    connection: psycopg.AsyncConnection, shadow: str
+) -> dict[str, str]:
+    """
+    Recreate every valid index of the live table on the shadow table, except ANN
+    indexes superseded by the managed one, which is built if the live table lacks
+    it. Shadow indexes get short numbered names (a shadow prefix on a long live name
+    could pass the 63-character identifier limit and be truncated). The shadow's own
+    content-hash key takes the place of the live one instead of being duplicated;
+    copies of it left on the live table by earlier loads are not mirrored.
+    Returns {shadow index name: live index name} for the swap.
+    """
+    managed = vector_index_name(KNOWLEDGE_TABLE)
+    hash_key = _shadow_hash_key(shadow)
+    cursor = await connection.execute(
+        "SELECT pg_get_indexdef(to_regclass(%s))", (hash_key,)
+    )
+    (hash_key_definition,) = await cursor.fetchone()
+    hash_key_method = _INDEX_DEF.match(hash_key_definition).group(2)
+    renames: dict[str, str] = {}
+    cursor = await connection.execute(
+        """
+        SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisprimary
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s) AND i.indisvalid
+        """,
+        (KNOWLEDGE_TABLE,),
+    )
+    for index_name, definition, primary in await cursor.fetchall():
+        match = _INDEX_DEF.match(definition)
+        if not match:
+            logger.log_and_print(
+                f"Bulk load: cannot mirror index {index_name}, skipping."
+            )
+            continue
+        if _ANN_METHOD.match(match.group(2)) and index_name != managed:
+            logger.log_and_print(
+                f"Bulk load: not mirroring superseded vector index {index_name}."
+            )
+            continue
+        if match.group(1) and match.group(2) == hash_key_method:
+            if index_name == HASH_KEY:
+                renames[hash_key] = index_name
+            else:
+                logger.log_and_print(
+                    f"Bulk load: not mirroring redundant hash key {index_name}."
+                )
+            continue
+        name = f"{shadow}_{len(renames)}"
+        renames[name] = index_name
+        started = time.perf_counter()
+        await connection.execute(
+            sql.SQL("CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ").format(
+                unique=sql.SQL(match.group(1) or ""),
+                name=sql.Identifier(name),
+                table=sql.Identifier(shadow),
+            )
+            + sql.SQL(match.group(2))
+        )
+        if primary:
+            await connection.execute(
+                sql.SQL(
+                    "ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY USING INDEX {}"
+                ).format(
+                    sql.Identifier(shadow), sql.Identifier(name), sql.Identifier(name)
+                )
+            )
+        seconds = time.perf_counter() - started
+        observe("bulk_load.index_build", seconds)
+        logger.log_and_print(f"Bulk load: built {name} in {seconds:.1f}s.")
+
+    # Under any other name, the shadow's key becomes the live one
+    renames.setdefault(hash_key, HASH_KEY)
+    # The live ANN index may be missing (still building, or VECTOR_INDEX_TYPE changed)
+    if managed not in renames.values():
+        name = f"{shadow}_{len(renames)}"
+        statement = vector_index_sql(shadow, name=name)
+        if statement is not None:
+            await connection.execute(statement)
+            renames[name] = managed
+    return renames
+
+
+async def _swap_into_place(
+    connection: psycopg.AsyncConnection,
+    shadow: str,
+    renames: dict[str, str],
+    copied_max_id: int,
+) -> int:
+    """
+    Atomically replace the live table with the shadow table. Writers are blocked
+    (readers are not) while changes made to the live table during the load are
+    carried over: new rows are inserted, live rows updated since they were copied
+    (e.g. rewritten by the re-embed job) overwrite their shadow copies, and copied
+    rows (id up to copied_max_id) no longer in the live table are deleted.
+    Readers only wait for the final renames.
+    Returns the number of carried-over (inserted, updated or deleted) rows.
+    """
+    retired = f"{KNOWLEDGE_TABLE}_retired"
+    async with connection.transaction():
+        await connection.execute(
+            sql.SQL("LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE").format(
+                sql.Identifier(KNOWLEDGE_TABLE)
+            )
+        )
+        names = await _copyable_column_names(connection, KNOWLEDGE_TABLE)
+        columns = sql.SQL(", ").join(sql.Identifier(name) for name in names)
+        updated_columns = [name for name in names if name != "id"]
+        # Rows loaded into the shadow table have higher ids than any copied row
+        deleted = await connection.execute(
+            sql.SQL(
+                """
+                DELETE FROM {shadow} s
+                WHERE s.id <= %s
+                  AND NOT EXISTS (SELECT 1 FROM {live} k WHERE k.id = s.id)
+                """
+            ).format(
+                shadow=sql.Identifier(shadow), live=sql.Identifier(KNOWLEDGE_TABLE)
+            ),
+            (copied_max_id,),
+        )
+        updated = await connection.execute(
+            sql.SQL(
+                """
+                UPDATE {shadow} s SET ({columns}) = ROW({live_columns})
+                FROM {live} k
+                WHERE s.id = k.id
+                  AND ({shadow_columns}) IS DISTINCT FROM ({live_columns})
+                """
+            ).format(
+                shadow=sql.Identifier(shadow),
+                live=sql.Identifier(KNOWLEDGE_TABLE),
+                columns=sql.SQL(", ").join(
+                    sql.Identifier(name) for name in updated_columns
+                ),
+                shadow_columns=sql.SQL(", ").join(
+                    sql.Identifier("s", name) for name in updated_columns
+                ),
+                live_columns=sql.SQL(", ").join(
+                    sql.Identifier("k", name) for name in updated_columns
+                ),
+            )
+        )
+        carried = await connection.execute(
+            sql.SQL(
+                """
+                INSERT INTO {shadow} ({columns})
+                SELECT {columns} FROM {live} k
+                WHERE NOT EXISTS (SELECT 1 FROM {shadow} s WHERE s.id = k.id)
+                ON CONFLICT (content_hash) DO NOTHING
+                """
+            ).format(
+                shadow=sql.Identifier(shadow),
+                live=sql.Identifier(KNOWLEDGE_TABLE),
+                columns=columns,
+            )
+        )
+        cursor = await connection.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id')", (KNOWLEDGE_TABLE,)
+        )
+        (sequence,) = await cursor.fetchone()
+        # Keep the id sequence alive when the old table is dropped
+        await connection.execute(
+            sql.SQL("ALTER SEQUENCE {} OWNED BY {}.id").format(
+                sql.SQL(sequence), sql.Identifier(shadow)
+            )
+        )
+        await connection.execute(
+            sql.SQL(
+                """
+                ALTER TABLE {live} RENAME TO {retired};
+                ALTER TABLE {shadow} RENAME TO {live};
+                DROP TABLE {retired};
+                """
+            ).format(
+                live=sql.Identifier(KNOWLEDGE_TABLE),
+                retired=sql.Identifier(retired),
+                shadow=sql.Identifier(shadow),
+            )
+        )
+        # The live indexes went with the dropped table, freeing their names
+        for shadow_name, live_name in renames.items():
+            await connection.execute(
+                sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                    sql.Identifier(shadow_name), sql.Identifier(live_name)
+                )
+            )
+    return carried.rowcount + updated.rowcount + deleted.rowcount
+
+
+async def _finish(session: dict):
+    shadow = session["table"]
+    connection = await open_maintenance_connection()
+    try:
+        await connection.execute(
+            """
+            SELECT set_config('maintenance_work_mem', %s, false),
+                   set_config('max_parallel_maintenance_workers', %s, false)
+            """,
+            (
+                BULK_LOAD_CONFIG["maintenance_work_mem"],
+                str(BULK_LOAD_CONFIG["parallel_workers"]),
+            ),
+        )
+        started = time.perf_counter()
+        renames = await _build_shadow_indexes(connection, shadow)
+        await connection.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(shadow)))
+        build_seconds = time.perf_counter() - started
+
+        session["state"] = "swapping"
+        carried = await _swap_into_place(
+            connection, shadow, renames, session["copied_max_id"]
+        )
+        cursor = await connection.execute(
+            sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(KNOWLEDGE_TABLE))
+        )
+        (total,) = await cursor.fetchone()
+
+        session["state"] = "done"
+        session["carried_rows"] = carried
+        logger.log_and_print(
+            f"Bulk load {session['session_id']}: swapped in {total} rows "
+            f"({session['loaded_rows']} loaded, {carried} written meanwhile), "
+            f"indexes built in {build_seconds:.1f}s."
+        )
+        await record_maintenance(
+            "reindex", vector_index_name(KNOWLEDGE_TABLE), build_seconds, total
+        )
+        notify_ingest(session["loaded_rows"])
+        # The live table was replaced wholesale: reload the in-process copy
+        start_hot_index_load()
+    except psycopg.Error as e:
+        session["state"] = "failed"
+        session["error"] = str(e)
+        logger.log_and_print(f"Bulk load {session['session_id']} failed: {e}")
+    finally:
+        session["finished_at"] = time.time()
+        await connection.close()
+
+
+async def finish_bulk_load(session_id: str) -> dict:
+    """
+    Stop accepting loads and, in the background, build the shadow table's indexes
+    (with BULK_LOAD_MAINTENANCE_WORK_MEM) and swap it in for the live table.
+    Poll bulk_load_status for progress.
+    """
+    global _finish_task
+
+    session = get_bulk_load(session_id)
+    if session is None or session["state"] != "loading":
+        return {"status": "error", "message": f"No bulk load {session_id} is loading."}
+    session["state"] = "building"
+    _finish_task = asyncio.create_task(_finish(session))
+    return {"status": "success", **session}
+
+
+async def abort_bulk_load(session_id: str) -> dict:
+    """Discard a session that has not started swapping, dropping its shadow table"""
+    session = get_bulk_load(session_id)
+    if session is None or session["state"] in ("building", "swapping"):
+        return {
+            "status": "error",
+            "message": f"Bulk load {session_id} cannot be aborted now.",
+        }
+    async with get_db_connection() as connection:
+        await connection.execute(
+            sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(session["table"]))
+        )
+    if session["state"] == "loading":
+        session["state"] = "aborted"
+    return {"status": "success", **session}
+
+
+async def bulk_load_status(session_id: str) -> dict:
+    """Session state, row counts and index build progress while building"""
+    session = get_bulk_load(session_id)
+    if session is None:
+        return {"status": "error", "message": f"Unknown bulk load {session_id}."}
+    status = {"status": "success", **session, "build_progress": None}
+    if session["state"] == "building":
+        async with get_db_connection() as connection:
+            index = await get_vector_index_status(connection, session["table"])
+        status["build_progress"] = index["build_progress"]
+    return status
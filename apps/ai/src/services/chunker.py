@@ -0,0 +1,215 @@
+import asyncio
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Iterator, Optional
+from tokenizers import Tokenizer
+from services.logger import get_logger
+from services.metrics import increment
+from utils.constants import CHUNKER_CONFIG
+
+logger = get_logger()
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+")
+# Without a tokenizer every word and punctuation mark counts as at least one token
+_WORDISH = re.compile(r"\w+|[^\w\s]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+# [CLS]/[SEP] (BERT-style) added by the embed server around every input
+_special_tokens = 2
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded, _special_tokens
+
+    if _tokenizer_loaded:
+        return _tokenizer
+    _tokenizer_loaded = True
+    name = CHUNKER_CONFIG["tokenizer"]
+    if not name:
+        return None
+    try:
+        if os.path.exists(name):
+            tokenizer = Tokenizer.from_file(name)
+        else:
+            tokenizer = Tokenizer.from_pretrained(name)
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        _special_tokens = tokenizer.num_special_tokens_to_add(False)
+        _tokenizer = tokenizer
+    except Exception as e:
+        logger.log_and_print(
+            f"⚠️ Could not load tokenizer {name} ({e}); "
+            "chunk sizes use a conservative estimate"
+        )
+    return _tokenizer
+
+
+async def load_tokenizer():
+    """
+    Load the tokenizer at startup, off the event loop: a Hugging Face id may have to
+    be downloaded, which would otherwise stall the first request that counts tokens.
+    Raises ValueError when EMBED_CHUNK_TOKENS does not fit EMBED_CONTEXT_TOKENS.
+    """
+    if await asyncio.to_thread(_get_tokenizer) is not None:
+        logger.log_and_print(f"🔤 Tokenizer loaded: {CHUNKER_CONFIG['tokenizer']}")
+    if CHUNKER_CONFIG["max_tokens"] > token_limit():
+        raise ValueError(
+            f"EMBED_CHUNK_TOKENS={CHUNKER_CONFIG['max_tokens']} does not fit "
+            f"EMBED_CONTEXT_TOKENS={CHUNKER_CONFIG['context_tokens']} "
+            f"(minus {_special_tokens} special tokens)"
+        )
+
+
+@lru_cache(maxsize=CHUNKER_CONFIG["count_cache_size"])
+def count_tokens(text: str) -> int:
+    """Tokens the embedding model produces for `text`, excluding special tokens"""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return max(math.ceil(len(text) / 3), len(_WORDISH.findall(text)))
+
+
+def token_limit() -> int:
+    """Largest input, in tokens, that fits the embed server's context"""
+    _get_tokenizer()
+    return CHUNKER_CONFIG["context_tokens"] - _special_tokens
+
+
+def _split_by_tokens(text: str, limit: int, overlap: int) -> Iterator[str]:
+    """Hard-split a passage with no usable sentence boundary into windows of `limit`"""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        step = max(1, limit - overlap)
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        for first in range(0, len(offsets), step):
+            last = min(first + limit, len(offsets))
+            yield text[offsets[first][0] : offsets[last - 1][1]]
+            if last == len(offsets):
+                return
+        return
+
+    # Estimated counts: take the longest run of words that still fits
+    words = text.split()
+    start = 0
+    while start < len(words):
+        low, high = start + 1, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(" ".join(words[start:middle])) <= limit:
+                low = middle
+            else:
+                high = middle - 1
+        piece = " ".join(words[start:low])
+        if count_tokens(piece) > limit:
+            # A single oversized "word" (e.g. a long URL or base64 blob);
+            # the estimate never exceeds one token per character
+            width = limit
+            for offset in range(0, len(piece), width):
+                yield piece[offset : offset + width]
+        else:
+            yield piece
+        if low == len(words):
+            return
+        back = low
+        while overlap and back - 1 > start:
+            if count_tokens(" ".join(words[back - 1 : low])) > overlap:
+                break
+            back -= 1
+        start = back
+
+
+def _sentences(text: str) -> Iterator[tuple[str, bool]]:
+    """(sentence, starts_paragraph) pairs in reading order"""
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        first = True
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            sentence = sentence.strip()
+            if sentence:
+                yield sentence, first
+                first = False
+
+
+def _join(window: list[tuple[str, int, bool]]) -> str:
+    parts = []
+    for index, (sentence, _, starts_paragraph) in enumerate(window):
+        if index:
+            parts.append("\n\n" if starts_paragraph else " ")
+        parts.append(sentence)
+    return "".join(parts)
+
+
+def _emit(chunk: str, limit: int) -> Iterator[str]:
+    # Joined text can tokenize slightly differently from its sentences; recheck
+    if count_tokens(chunk) <= limit:
+        yield chunk
+    else:
+        yield from _split_by_tokens(chunk, limit, 0)
+
+
+def iter_chunks(
+    text: str,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Lazily split text into chunks of at most max_tokens (default EMBED_CHUNK_TOKENS)
+    embedding-model tokens, capped so no chunk exceeds the embed server's context.
+    Chunks end on sentence boundaries and keep paragraph breaks; consecutive
+    chunks share up to overlap_tokens of trailing sentences. Only a sentence that
+    alone exceeds the limit is cut mid-sentence.
+    """
+    limit = min(max_tokens or CHUNKER_CONFIG["max_tokens"], token_limit())
+    if overlap_tokens is None:
+        overlap_tokens = CHUNKER_CONFIG["overlap_tokens"]
+    overlap = min(overlap_tokens, limit // 2)
+
+    window: list[tuple[str, int, bool]] = []
+    size = 0
+    for sentence, starts_paragraph in _sentences(text):
+        tokens = count_tokens(sentence)
+        if tokens > limit:
+            if window:
+                yield from _emit(_join(window), limit)
+                window, size = [], 0
+            increment("chunker.split_sentences")
+            yield from _split_by_tokens(sentence, limit, overlap)
+            continue
+        # +1 per sentence for the separator it is joined with
+        if window and size + tokens + 1 > limit:
+            yield from _emit(_join(window), limit)
+            tail: list[tuple[str, int, bool]] = []
+            tail_size = 0
+            for item in reversed(window):
+                if tail_size + item[1] + 1 > overlap:
+                    break
+                tail.insert(0, item)
+                tail_size += item[1] + 1
+            while tail and tail_size + tokens + 1 > limit:
+                tail_size -= tail.pop(0)[1] + 1
+            window, size = tail, tail_size
+        window.append((sentence, tokens, starts_paragraph))
+        size += tokens + 1
+    if window:
+        yield from _emit(_join(window), limit)
+
+
+def chunk_text(
+    text: str,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+) -> list[str]:
+    """iter_chunks collected into a list (for callers that embed all chunks at once)"""
+    return list(iter_chunks(text, max_tokens, overlap_tokens))
+
+
+def fit_to_limit(text: str) -> str:
+    """Truncate text to the embed server's context so it is never rejected as too long"""
+    limit = token_limit()
+    if count_tokens(text) <= limit:
+        return text
+    increment("chunker.truncated_inputs")
+    return next(_split_by_tokens(text, limit, 0))
@@ -1,9 +1,19 @@
 from typing import Literal
-from utils.constants import MODEL_PORT
+from utils.constants import EMBED_POOL_CONFIG, MODEL_PORT
 from openai import AsyncOpenAI
+from services.embed_pool import EmbedPool
 
 model_main = AsyncOpenAI(base_url=MODEL_PORT["main"], api_key="no-key")
-model_embed = AsyncOpenAI(base_url=MODEL_PORT["embed"], api_key="no-key")
+embed_pool = EmbedPool(
+    EMBED_POOL_CONFIG["urls"],
+    inflight_per_backend=EMBED_POOL_CONFIG["inflight_per_backend"],
+    eject_after=EMBED_POOL_CONFIG["eject_after_failures"],
+    eject_seconds=EMBED_POOL_CONFIG["eject_seconds"],
+    deadline_seconds=EMBED_POOL_CONFIG["deadline_seconds"],
+    hedge_percentile=EMBED_POOL_CONFIG["hedge_percentile"],
+    hedge_min_seconds=EMBED_POOL_CONFIG["hedge_min_seconds"],
+)
+model_embed = embed_pool.backends[0].client
 
 
 model_clients = {
@@ -12,7 +22,24 @@ model_clients = {
 }
 
 
+async def _check_embed_backends() -> bool:
+    """Probe every embed server; unreachable ones start out ejected"""
+    reachable = False
+    for backend in embed_pool.backends:
+        try:
+            response = await backend.client.models.list()
+            models = [m.id for m in response.data]
+            print(f"Connection successful ({backend.url}). Models:", models)
+            reachable = True
+        except Exception as e:
+            print(f"Connection failed ({backend.url}):", e)
+            embed_pool.eject(backend, e)
+    return reachable
+
+
 async def check_model(model: Literal["main", "embed"] = "main"):
+    if model == "embed":
+        return await _check_embed_backends()
     try:
         client = model_clients[model]
         response = await client.models.list()
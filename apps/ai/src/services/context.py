@@ -0,0 +1,105 @@
+from typing import Optional
+import numpy as np
+from services.chunker import count_tokens
+from services.metrics import SIZE_BUCKETS, histogram, increment
+from services.vector import as_vector
+from utils.constants import CONTEXT_CONFIG
+
+
+def _line(hit: dict) -> str:
+    return f"- {hit['message']}"
+
+
+def _relevance(hit: dict) -> float:
+    """Cosine similarity to the query; hits carry cosine distance"""
+    return 1.0 - float(hit["similarity"])
+
+
+def _unit_rows(hits: list[dict]) -> Optional[np.ndarray]:
+    """Unit-length candidate vectors, or None if any hit came without one"""
+    if any(hit.get("embedding") is None for hit in hits):
+        return None
+    matrix = np.stack([as_vector(hit["embedding"]) for hit in hits])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def mmr_order(
+    hits: list[dict], mmr_lambda: float, duplicate_similarity: float
+) -> tuple[list[dict], int]:
+    """
+    Candidates in Maximal Marginal Relevance order: each pick maximizes
+    lambda * relevance - (1 - lambda) * (similarity to the closest chunk picked so
+    far). Candidates at least duplicate_similarity to a picked chunk are dropped.
+    Without vectors, plain relevance order. Returns (ordered hits, duplicates dropped).
+    """
+    ranked = sorted(hits, key=_relevance, reverse=True)
+    if len(ranked) < 2:
+        return ranked, 0
+    vectors = _unit_rows(ranked)
+    if vectors is None:
+        return ranked, 0
+    relevance = np.array([_relevance(hit) for hit in ranked])
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(len(ranked))
+    remaining = np.ones(len(ranked), dtype=bool)
+    order = []
+    while remaining.any():
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[~remaining] = -np.inf
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        remaining[pick] = False
+        redundancy = np.maximum(redundancy, similarity[pick])
+        remaining &= redundancy < duplicate_similarity
+    return [ranked[i] for i in order], len(ranked) - len(order)
+
+
+def assemble_context(hits: list[dict]) -> tuple[str, dict]:
+    """
+    Knowledge context for the prompt from over-fetched candidates: drop those below
+    CONTEXT_MIN_SIMILARITY, order the rest by MMR, then add chunks in that order
+    while they fit CONTEXT_TOKEN_BUDGET, up to CONTEXT_MAX_CHUNKS.
+    Returns (context text, stats). stats["tokens_saved"] compares with the plain
+    top CONTEXT_MAX_CHUNKS candidates by similarity, as retrieval alone would give.
+    Tokens are counted with the embedding model's tokenizer (an estimate for the
+    main model).
+    """
+    max_chunks = CONTEXT_CONFIG["max_chunks"]
+    relevant = [
+        hit for hit in hits if _relevance(hit) >= CONTEXT_CONFIG["min_similarity"]
+    ]
+    ordered, duplicates = mmr_order(
+        relevant, CONTEXT_CONFIG["mmr_lambda"], CONTEXT_CONFIG["duplicate_similarity"]
+    )
+
+    lines = []
+    tokens = 0
+    for hit in ordered:
+        if len(lines) == max_chunks:
+            break
+        line = _line(hit)
+        cost = count_tokens(line)
+        # A long chunk that does not fit may leave room for a shorter one after it
+        if tokens + cost > CONTEXT_CONFIG["token_budget"]:
+            continue
+        lines.append(line)
+        tokens += cost
+
+    baseline = sum(
+        count_tokens(_line(hit))
+        for hit in sorted(hits, key=_relevance, reverse=True)[:max_chunks]
+    )
+    stats = {
+        "candidates": len(hits),
+        "below_similarity": len(hits) - len(relevant),
+        "duplicates": duplicates,
+        "chunks": len(lines),
+        "tokens": tokens,
+        "tokens_saved": max(0, baseline - tokens),
+    }
+    increment("context.tokens_saved", stats["tokens_saved"])
+    increment("context.duplicates_dropped", duplicates)
+    histogram("context.chunks", len(lines), SIZE_BUCKETS)
+    return "\n".join(lines), stats
@@ -1,150 +1,1286 @@
-from typing import Optional
-import psycopg2
-from services.embed import chunk_text, embed_text
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable, Optional, Union
+import numpy as np
+import psycopg
+from psycopg import sql
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from pgvector import Vector
+from pgvector.psycopg import register_vector_async
+from services.db_index import (
+    EMBEDDING_DIM,
+    apply_search_tuning,
+    get_vector_index_status,
+    hybrid_search_sql,
+    knowledge_search_sql,
+    multi_knowledge_search_sql,
+    pgvector_requirement,
+    resolve_storage_mode,
+    superseded_vector_indexes,
+    truncated_column,
+    truncated_column_sql,
+    vector_index_sql,
+)
+from services.db_partition import (
+    convert_to_partitioned,
+    ensure_partitions,
+    expired_partitions,
+    is_partitioned,
+    retire_partition,
+)
+from services.embed import content_hash, embed_text
+from services.hot_index import (
+    HotIndex,
+    abort_hot_index_load,
+    add_to_hot_index,
+    begin_hot_index_load,
+    finish_hot_index_load,
+    fits_budget,
+    hot_index_enabled,
+    search_hot_index,
+)
 from services.logger import get_logger
-from utils.constants import DB_CONFIG
+from services.metrics import increment, timed
+from services.vector import as_vector, normalize_vector, register_vector_dumper
+from utils.constants import (
+    CONVERSATION_PARTITION_CONFIG,
+    DB_CONFIG,
+    DB_POOL_CONFIG,
+    EMBED_MODEL_ID,
+    HYBRID_SEARCH_CONFIG,
+    VECTOR_INDEX_CONFIG,
+    VECTOR_STORAGE_CONFIG,
+)
 
-# Global database connection
-_db_connection = None
+# Global connection pool, opened on startup and closed on shutdown
+_db_pool: Optional[AsyncConnectionPool] = None
+# Caps how many DB operations may run at once across all requests
+_db_semaphore: Optional[asyncio.Semaphore] = None
+_db_pool_lock = asyncio.Lock()
+# Background ANN index build, kept referenced so it is not garbage collected
+_index_build_task: Optional[asyncio.Task] = None
+# Background load of the in-process hot index
+_hot_index_task: Optional[asyncio.Task] = None
+
+# Crawled knowledge (searched by similarity) and chat turns (read by session) live apart
+KNOWLEDGE_TABLE = "knowledge_chunks"
+CONVERSATION_TABLE = "conversation_messages"
+
+# Hot queries are parsed and planned once per pooled connection
+PREPARE = DB_POOL_CONFIG["prepare_statements"]
+
+# Rows checked per transaction when rescaling stored vectors to unit length, and
+# how far from 1 a norm may be before the vector counts as unnormalized
+_NORMALIZE_BATCH_ROWS = 5000
+_UNIT_NORM_TOLERANCE = 1e-3
 
 logger = get_logger()
 
 
-def get_db_connection():
-    """Get a database cursor using a persistent connection from constants.py"""
-    global _db_connection
+def _conninfo() -> str:
+    return make_conninfo(
+        host=DB_CONFIG["host"],
+        port=DB_CONFIG["port"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        dbname=DB_CONFIG["database"],
+    )
 
-    # Check if connection exists and is still valid
-    if _db_connection is None or _db_connection.closed:
-        logger.log_and_print("Creating new database connection...")
-        logger.log_and_print("DB Config:", DB_CONFIG)
 
-        _db_connection = psycopg2.connect(
-            host=DB_CONFIG["host"],
-            port=DB_CONFIG["port"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            database=DB_CONFIG["database"],
-        )
+async def _configure_connection(connection: psycopg.AsyncConnection):
+    """Register pgvector types on each new pooled connection so vectors travel as binary"""
+    try:
+        await register_vector_async(connection)
+    except psycopg.ProgrammingError:
+        # Fresh database: create the extension before initialize_database runs
+        await connection.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        await connection.commit()
+        await register_vector_async(connection)
+    register_vector_dumper(connection)
+    await connection.commit()
 
-    return _db_connection.cursor()
 
+def _as_vector(vector) -> Union[Vector, np.ndarray]:
+    """Coerce a raw embedding to float32 so psycopg sends it with the binary dumper"""
+    return vector if isinstance(vector, Vector) else as_vector(vector)
 
-def get_db_connection_instance():
-    """Get the actual database connection instance for commit/rollback operations"""
-    global _db_connection
 
-    # Check if connection exists and is still valid
-    if _db_connection is None or _db_connection.closed:
-        logger.log_and_print("Creating new database connection...")
-        logger.log_and_print("DB Config:", DB_CONFIG)
+async def open_db_pool() -> AsyncConnectionPool:
+    """Open the global async connection pool using DB_CONFIG and DB_POOL_CONFIG"""
+    async with _db_pool_lock:
+        if _db_pool is not None:
+            return _db_pool
+        return await _create_db_pool()
 
-        _db_connection = psycopg2.connect(
-            host=DB_CONFIG["host"],
-            port=DB_CONFIG["port"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            database=DB_CONFIG["database"],
-        )
 
-    return _db_connection
+async def _create_db_pool() -> AsyncConnectionPool:
+    global _db_pool, _db_semaphore
+
+    logger.log_and_print("Opening database connection pool...")
+    logger.log_and_print(
+        f"DB Config: host={DB_CONFIG['host']} port={DB_CONFIG['port']} "
+        f"database={DB_CONFIG['database']} pool={DB_POOL_CONFIG}"
+    )
+
+    pool = AsyncConnectionPool(
+        _conninfo(),
+        min_size=DB_POOL_CONFIG["min_size"],
+        max_size=DB_POOL_CONFIG["max_size"],
+        timeout=DB_POOL_CONFIG["acquire_timeout"],
+        max_lifetime=DB_POOL_CONFIG["max_lifetime"],
+        max_idle=DB_POOL_CONFIG["max_idle"],
+        configure=_configure_connection,
+        check=AsyncConnectionPool.check_connection,
+        name="ai-db",
+        open=False,
+    )
+    await pool.open(wait=True, timeout=DB_POOL_CONFIG["acquire_timeout"])
+
+    _db_pool = pool
+    _db_semaphore = asyncio.Semaphore(DB_POOL_CONFIG["max_concurrent_operations"])
+    return _db_pool
+
 
+async def close_db_pool():
+    """Close the global connection pool, waiting for in-use connections to return"""
+    global _db_pool, _db_semaphore
 
-def initialize_database():
-    """Function to initialize the database and create tables"""
+    if _db_pool is None:
+        return
+
+    logger.log_and_print("Closing database connection pool...")
+    await _db_pool.close()
+    _db_pool = None
+    _db_semaphore = None
+
+
+@asynccontextmanager
+async def get_db_connection() -> AsyncIterator[psycopg.AsyncConnection]:
+    """
+    Borrow a connection from the pool for the duration of the block.
+    The transaction is committed on success and rolled back on error.
+    Opens the pool lazily for scripts that run outside the FastAPI app (e.g. the crawler).
+    """
+    if _db_pool is None or _db_semaphore is None:
+        await open_db_pool()
+
+    async with _db_semaphore:
+        async with _db_pool.connection() as connection:
+            yield connection
+
+
+async def open_maintenance_connection() -> psycopg.AsyncConnection:
+    """
+    Open a dedicated autocommit connection outside the pool for long-running DDL
+    (e.g. CREATE INDEX CONCURRENTLY) so it never holds a pooled slot. Caller closes it.
+    """
+    return await psycopg.AsyncConnection.connect(_conninfo(), autocommit=True)
+
+
+async def initialize_database(storage_mode: Optional[str] = None):
+    """
+    Function to initialize the database and create tables.
+    storage_mode (full | halfvec | binary | truncated) selects how knowledge vectors
+    are indexed; defaults to VECTOR_STORAGE_MODE. The truncated mode adds a second,
+    generated vector column with the leading VECTOR_TRUNCATED_DIM dimensions.
+    """
     try:
         logger.log_and_print("Attempting to connect to the database...")
-        connection = get_db_connection_instance()
-        cursor = connection.cursor()
+        partitioned = CONVERSATION_PARTITION_CONFIG["enabled"]
+        async with get_db_connection() as connection:
+            await connection.execute(
+                sql.SQL(
+                    """
+                    CREATE EXTENSION IF NOT EXISTS vector;
+                    CREATE TABLE IF NOT EXISTS knowledge_chunks (
+                        id BIGSERIAL PRIMARY KEY,
+                        message TEXT NOT NULL,
+                        embedding vector(768),
+                        embedding_model TEXT,
+                        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );
+                    CREATE TABLE IF NOT EXISTS conversation_messages (
+                        id BIGSERIAL,
+                        session_id TEXT NOT NULL DEFAULT 'default_session',
+                        role TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        embedding vector(768),
+                        embedding_model TEXT,
+                        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY {primary_key}
+                    ) {partitioning};
+                    """
+                ).format(
+                    # A partitioned table's primary key must include the partition key
+                    primary_key=sql.SQL("(id, created_at)" if partitioned else "(id)"),
+                    partitioning=sql.SQL(
+                        "PARTITION BY RANGE (created_at)" if partitioned else ""
+                    ),
+                )
+            )
+            await _ensure_pgvector_version(connection, storage_mode)
+            await _ensure_conversation_partitioning(connection)
+            await connection.execute(
+                """
+                -- History reads are a range scan over one session's newest rows
+                CREATE INDEX IF NOT EXISTS conversation_messages_session_created_idx
+                    ON conversation_messages (session_id, created_at DESC)
+                    INCLUDE (role);
+                """
+            )
+            await _migrate_legacy_messages(connection)
+            await _ensure_content_hashes(connection)
+            await _ensure_text_search(connection)
+            await _ensure_embedding_model(connection)
+            if resolve_storage_mode(storage_mode) == "truncated":
+                await _ensure_truncated_column(connection)
+        logger.log_and_print("Database connection successful and table initialized.")
+        await ensure_vector_index(storage_mode)
+    except psycopg.Error as e:
+        logger.log_and_print(
+            f"Failed to connect to the database or initialize table: {e}"
+        )
 
-        # Example table schema
-        cursor.execute(
-            """
-            CREATE EXTENSION IF NOT EXISTS vector;
-            CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                sessionId TEXT DEFAULT 'default_session',
-                message TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'system',
-                embedding vector(768),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            """
+
+async def _pgvector_version(connection: psycopg.AsyncConnection) -> str:
+    cursor = await connection.execute(
+        "SELECT extversion FROM pg_extension WHERE extname = 'vector'"
+    )
+    (version,) = await cursor.fetchone()
+    return version
+
+
+def _version_tuple(version: str) -> tuple[int, ...]:
+    return tuple(int(part) for part in version.split(".") if part.isdigit())
+
+
+async def _ensure_pgvector_version(
+    connection: psycopg.AsyncConnection, storage_mode: Optional[str] = None
+):
+    """
+    Update the vector extension when the configured features need a newer release
+    than the database has: CREATE EXTENSION IF NOT EXISTS never upgrades a database
+    created with an older image. Raises RuntimeError when the server has no new
+    enough release installed.
+    """
+    requirement = pgvector_requirement(storage_mode)
+    if requirement is None:
+        return
+    minimum, setting = requirement
+    wanted = ".".join(str(part) for part in minimum)
+    installed = await _pgvector_version(connection)
+    if _version_tuple(installed) >= minimum:
+        return
+    logger.log_and_print(
+        f"Updating pgvector {installed} ({setting} needs {wanted} or later)..."
+    )
+    try:
+        async with connection.transaction():
+            await connection.execute("ALTER EXTENSION vector UPDATE")
+    except psycopg.Error as e:
+        logger.log_and_print(f"Could not update pgvector: {e}")
+    installed = await _pgvector_version(connection)
+    if _version_tuple(installed) < minimum:
+        raise RuntimeError(
+            f"{setting} needs pgvector {wanted} or later, but the database has "
+            f"{installed} and no newer release is installed on the server. Upgrade "
+            "the server's pgvector package (or image), or change the setting."
         )
+    logger.log_and_print(f"pgvector updated to {installed}.")
 
-        connection.commit()
-        cursor.close()
-        logger.log_and_print("Database connection successful and table initialized.")
-    except psycopg2.Error as e:
+
+async def _ensure_conversation_partitioning(connection: psycopg.AsyncConnection):
+    """
+    Make sure conversation_messages is partitioned (converting a plain table from an
+    older schema in place) and that the current and upcoming partitions exist.
+    """
+    if not CONVERSATION_PARTITION_CONFIG["enabled"]:
+        return
+    if await is_partitioned(connection, CONVERSATION_TABLE):
+        await ensure_partitions(connection, CONVERSATION_TABLE)
+        return
+
+    logger.log_and_print("Converting conversation_messages to a partitioned table...")
+    archive = await convert_to_partitioned(connection, CONVERSATION_TABLE)
+    if archive:
         logger.log_and_print(
-            "Failed to connect to the database or initialize table:", e
+            f"Older conversation history kept in partition {archive}."
         )
 
 
-async def get_embeddings_from_db(embedding: dict):
+async def _migrate_legacy_messages(connection: psycopg.AsyncConnection):
     """
-    Fetch embeddings and similarity scores from the database based on the user message.
+    Move rows from the old single `messages` table into the split tables.
+    Runs in the caller's transaction; the old table is kept as `messages_legacy`.
     """
-    cursor = get_db_connection()
+    cursor = await connection.execute("SELECT to_regclass('messages') IS NOT NULL")
+    (legacy_exists,) = await cursor.fetchone()
+    if not legacy_exists:
+        return
 
-    cursor.execute(
+    logger.log_and_print("Migrating legacy messages table...")
+    knowledge = await connection.execute(
+        """
+        INSERT INTO knowledge_chunks (message, embedding, embedding_model, created_at)
+        SELECT message, embedding, %s, COALESCE(created_at, CURRENT_TIMESTAMP)
+        FROM messages
+        WHERE role = 'system'
+        ORDER BY id
+        """,
+        (EMBED_MODEL_ID,),
+    )
+    if await is_partitioned(connection, CONVERSATION_TABLE):
+        # Old history needs partitions covering its timestamps before it can be copied
+        cursor = await connection.execute(
+            "SELECT min(created_at) FROM messages WHERE role <> 'system'"
+        )
+        (oldest,) = await cursor.fetchone()
+        await ensure_partitions(connection, CONVERSATION_TABLE, since=oldest)
+    conversation = await connection.execute(
         """
-        SELECT message, embedding <=> %s::vector AS similarity
+        INSERT INTO conversation_messages
+            (session_id, role, message, embedding, embedding_model, created_at)
+        SELECT COALESCE(sessionId, 'default_session'), role, message, embedding, %s,
+               COALESCE(created_at, CURRENT_TIMESTAMP)
         FROM messages
-        WHERE role ='system'
-        ORDER BY similarity ASC
-        LIMIT 3
+        WHERE role <> 'system'
+        ORDER BY id
         """,
-        (embedding["embedding"],),
+        (EMBED_MODEL_ID,),
+    )
+    await connection.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    logger.log_and_print(
+        f"Migrated {knowledge.rowcount} knowledge chunks and "
+        f"{conversation.rowcount} conversation messages; old table kept as messages_legacy."
+    )
+
+
+# SQL twin of services.embed.content_hash, used to backfill existing rows
+_SQL_CONTENT_HASH = (
+    "encode(sha256(convert_to("
+    "btrim(regexp_replace(message, '\\s+', ' ', 'g')), 'UTF8')), 'hex')"
+)
+
+
+async def _ensure_content_hashes(connection: psycopg.AsyncConnection):
+    """
+    Add the normalized content hash used for deduplication. Knowledge chunks get a
+    unique index (existing duplicates are removed, oldest row kept); conversation turns
+    get a plain index because repeating a message is legitimate history, but its
+    stored vector can still be reused instead of embedding again. save_message skips
+    a turn identical to the session's latest one, so a turn is not stored twice.
+    """
+    await connection.execute(
+        """
+        ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS content_hash TEXT;
+        ALTER TABLE conversation_messages ADD COLUMN IF NOT EXISTS content_hash TEXT;
+        """
+    )
+
+    cursor = await connection.execute(
+        """
+        SELECT to_regclass('knowledge_chunks_content_hash_key') IS NOT NULL,
+               to_regclass('conversation_messages_content_hash_idx') IS NOT NULL
+        """
+    )
+    knowledge_indexed, conversation_indexed = await cursor.fetchone()
+
+    if not knowledge_indexed:
+        logger.log_and_print("Backfilling knowledge content hashes...")
+        await connection.execute(
+            f"UPDATE knowledge_chunks SET content_hash = {_SQL_CONTENT_HASH} "
+            "WHERE content_hash IS NULL"
+        )
+        removed = await connection.execute(
+            """
+            DELETE FROM knowledge_chunks newer
+            USING knowledge_chunks older
+            WHERE newer.content_hash = older.content_hash
+            AND newer.id > older.id
+            """
+        )
+        await connection.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS knowledge_chunks_content_hash_key
+                ON knowledge_chunks (content_hash)
+            """
+        )
+        logger.log_and_print(
+            f"Removed {removed.rowcount} duplicate knowledge chunks."
+        )
+
+    if not conversation_indexed:
+        logger.log_and_print("Backfilling conversation content hashes...")
+        await connection.execute(
+            f"UPDATE conversation_messages SET content_hash = {_SQL_CONTENT_HASH} "
+            "WHERE content_hash IS NULL"
+        )
+        await connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS conversation_messages_content_hash_idx
+                ON conversation_messages (content_hash)
+            """
+        )
+
+
+async def _ensure_text_search(connection: psycopg.AsyncConnection):
+    """
+    Add the generated tsvector column and GIN index used by hybrid retrieval.
+    The column is maintained by Postgres, so no write path needs to change.
+    """
+    await connection.execute(
+        sql.SQL(
+            """
+            ALTER TABLE knowledge_chunks ADD COLUMN IF NOT EXISTS search_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector({}::regconfig, message)) STORED;
+            CREATE INDEX IF NOT EXISTS knowledge_chunks_search_tsv_idx
+                ON knowledge_chunks USING gin (search_tsv);
+            """
+        ).format(sql.Literal(HYBRID_SEARCH_CONFIG["text_search_config"]))
+    )
+
+
+async def _ensure_embedding_model(connection: psycopg.AsyncConnection):
+    """
+    Add the column recording which model produced each vector. Rows that predate it
+    are attributed to the configured EMBED_MODEL_ID through a constant default, which
+    Postgres applies without rewriting the table; writers always set it explicitly.
+    Vectors stored without a model (e.g. copied by an older legacy migration) are
+    attributed the same way, so retrieval does not filter them out.
+    """
+    for table in (KNOWLEDGE_TABLE, CONVERSATION_TABLE):
+        cursor = await connection.execute(
+            """
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = to_regclass(%s)
+            AND attname = 'embedding_model' AND NOT attisdropped
+            """,
+            (table,),
+        )
+        if await cursor.fetchone():
+            backfill = await connection.execute(
+                sql.SQL(
+                    """
+                    UPDATE {table} SET embedding_model = %s
+                    WHERE embedding_model IS NULL AND embedding IS NOT NULL
+                    """
+                ).format(table=sql.Identifier(table)),
+                (EMBED_MODEL_ID,),
+            )
+            if backfill.rowcount:
+                logger.log_and_print(
+                    f"Attributed {backfill.rowcount} {table} vectors without a model "
+                    f"to {EMBED_MODEL_ID}."
+                )
+            continue
+        logger.log_and_print(
+            f"Recording embedding model for {table} (existing rows: {EMBED_MODEL_ID})."
+        )
+        await connection.execute(
+            sql.SQL(
+                """
+                ALTER TABLE {table} ADD COLUMN embedding_model TEXT DEFAULT {model};
+                ALTER TABLE {table} ALTER COLUMN embedding_model DROP DEFAULT;
+                """
+            ).format(table=sql.Identifier(table), model=sql.Literal(EMBED_MODEL_ID))
+        )
+
+
+async def _ensure_truncated_column(connection: psycopg.AsyncConnection):
+    """Add the leading-dimensions column searched first by the truncated storage mode"""
+    name = truncated_column()
+    cursor = await connection.execute(
+        """
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = %s AND NOT attisdropped
+        """,
+        (KNOWLEDGE_TABLE, name),
+    )
+    if await cursor.fetchone():
+        return
+    logger.log_and_print(
+        f"Adding {name} to {KNOWLEDGE_TABLE} (rewrites the table once)..."
+    )
+    await connection.execute(truncated_column_sql(KNOWLEDGE_TABLE))
+
+
+async def ensure_vector_index(storage_mode: Optional[str] = None):
+    """
+    Create the managed ANN index on knowledge embeddings if it is missing, then drop
+    ANN indexes it supersedes (other storage mode, index type or metric).
+    The work runs CONCURRENTLY in the background so startup and writes are not
+    blocked; use report_vector_index_status() to follow its progress.
+    """
+    global _index_build_task
+
+    statement = vector_index_sql(
+        KNOWLEDGE_TABLE, concurrently=True, storage_mode=storage_mode
+    )
+    if statement is None:
+        logger.log_and_print("Vector index disabled (VECTOR_INDEX_TYPE=none).")
+        return
+
+    async with get_db_connection() as connection:
+        status = await get_vector_index_status(
+            connection, KNOWLEDGE_TABLE, storage_mode=storage_mode
+        )
+        superseded = await superseded_vector_indexes(
+            connection, KNOWLEDGE_TABLE, status["name"]
+        )
+    ready = status["present"] and status["valid"]
+    if ready and not superseded:
+        return
+    if _index_build_task is not None and not _index_build_task.done():
+        return
+
+    _index_build_task = asyncio.create_task(
+        _build_vector_index(None if ready else statement, status, superseded)
+    )
+
+
+async def _normalize_stored_vectors(connection: psycopg.AsyncConnection) -> int:
+    """
+    Rescale knowledge vectors stored before VECTOR_NORMALIZE was on: inner-product
+    search ranks non-unit vectors wrongly. Runs before a new index is built, in
+    batches by id so each one commits on its own. Returns the rows rescaled.
+    """
+    last_id = 0
+    rescaled = 0
+    while True:
+        cursor = await connection.execute(
+            sql.SQL(
+                """
+                WITH batch AS (
+                    SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s
+                ),
+                rescaled AS (
+                    UPDATE {table} t SET embedding = l2_normalize(t.embedding)
+                    FROM batch b
+                    WHERE t.id = b.id AND t.embedding IS NOT NULL
+                    AND abs(vector_norm(t.embedding) - 1) > %s
+                    RETURNING 1
+                )
+                SELECT (SELECT max(id) FROM batch), (SELECT count(*) FROM rescaled)
+                """
+            ).format(table=sql.Identifier(KNOWLEDGE_TABLE)),
+            (last_id, _NORMALIZE_BATCH_ROWS, _UNIT_NORM_TOLERANCE),
+        )
+        batch_last, batch_rescaled = await cursor.fetchone()
+        if batch_last is None:
+            return rescaled
+        last_id = batch_last
+        rescaled += batch_rescaled
+
+
+async def _build_vector_index(
+    statement: Optional[sql.Composed], status: dict, superseded: list[str]
+):
+    connection = await open_maintenance_connection()
+    try:
+        await connection.execute(
+            "SELECT set_config('maintenance_work_mem', %s, false)",
+            (VECTOR_INDEX_CONFIG["maintenance_work_mem"],),
+        )
+        if statement is not None:
+            if status["present"]:
+                # An invalid index is left behind by an interrupted concurrent build
+                await connection.execute(
+                    sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                        sql.Identifier(status["name"])
+                    )
+                )
+            if VECTOR_STORAGE_CONFIG["normalize"]:
+                rescaled = await _normalize_stored_vectors(connection)
+                if rescaled:
+                    logger.log_and_print(
+                        f"Normalized {rescaled} knowledge vectors stored at other "
+                        "lengths."
+                    )
+            logger.log_and_print(f"Building vector index {status['name']}...")
+            await connection.execute(statement)
+            logger.log_and_print(f"Vector index {status['name']} is ready.")
+        # Dropped only now: until the new index was ready they kept search indexed
+        for name in superseded:
+            await connection.execute(
+                sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                    sql.Identifier(name)
+                )
+            )
+            logger.log_and_print(f"Dropped superseded vector index {name}.")
+    except psycopg.Error as e:
+        logger.log_and_print(f"Failed to build vector index {status['name']}: {e}")
+    finally:
+        await connection.close()
+
+
+async def run_partition_maintenance() -> dict:
+    """
+    Create upcoming conversation partitions and retire the ones that have aged past
+    CONVERSATION_RETENTION_DAYS. Removing old history is a detach/drop of whole
+    partitions, never a bulk DELETE.
+    """
+    created: list[str] = []
+    retired: list[str] = []
+    try:
+        async with get_db_connection() as connection:
+            if not await is_partitioned(connection, CONVERSATION_TABLE):
+                return {"created": created, "retired": retired}
+            created = await ensure_partitions(connection, CONVERSATION_TABLE)
+            expired = await expired_partitions(
+                connection,
+                CONVERSATION_TABLE,
+                CONVERSATION_PARTITION_CONFIG["retention_days"],
+            )
+        for name in created:
+            logger.log_and_print(f"Created conversation partition {name}.")
+        increment("partitions.created", len(created))
+
+        if expired:
+            action = CONVERSATION_PARTITION_CONFIG["retention_action"]
+            connection = await open_maintenance_connection()
+            try:
+                for name in expired:
+                    await retire_partition(connection, CONVERSATION_TABLE, name, action)
+                    retired.append(name)
+                    increment("partitions.retired")
+                    logger.log_and_print(
+                        f"Retention: {'dropped' if action == 'drop' else 'detached'} "
+                        f"conversation partition {name}."
+                    )
+            finally:
+                await connection.close()
+    except psycopg.Error as e:
+        logger.log_and_print(f"Partition maintenance failed: {e}")
+    return {"created": created, "retired": retired}
+
+
+async def report_vector_index_status() -> Optional[dict]:
+    """Log whether the ANN index is present, valid and still building"""
+    try:
+        async with get_db_connection() as connection:
+            status = await get_vector_index_status(connection, KNOWLEDGE_TABLE)
+    except psycopg.Error as e:
+        logger.log_and_print(f"Failed to read vector index status: {e}")
+        return None
+
+    if status["build_progress"]:
+        progress = status["build_progress"]
+        logger.log_and_print(
+            f"⏳ Vector index {status['name']} building: {progress['phase']} "
+            f"(blocks {progress['blocks']}, tuples {progress['tuples']})"
+        )
+    elif status["present"] and status["valid"]:
+        logger.log_and_print(
+            f"✅ Vector index {status['name']} present ({status['size']})"
+        )
+    else:
+        logger.log_and_print(
+            f"⚠️ Vector index {status['name']} missing; similarity search will scan the table"
+        )
+    return status
+
+
+async def load_hot_index():
+    """
+    Read this model's knowledge vectors from Postgres into the in-process hot index
+    and swap it in. Searches keep using the previous copy (or SQL) until it is ready.
+    """
+    if not hot_index_enabled():
+        return
+    begin_hot_index_load()
+    started = time.perf_counter()
+    try:
+        async with get_db_connection() as connection:
+            cursor = await connection.execute(
+                """
+                SELECT count(*), COALESCE(sum(octet_length(message)), 0)
+                FROM knowledge_chunks
+                WHERE embedding_model = %s AND embedding IS NOT NULL
+                """,
+                (EMBED_MODEL_ID,),
+            )
+            rows, text_bytes = await cursor.fetchone()
+            if not fits_budget(rows, EMBEDDING_DIM, text_bytes):
+                abort_hot_index_load("over_budget")
+                return
+            index = HotIndex(EMBEDDING_DIM, capacity=rows)
+            # Binary results decode each vector with one buffer copy
+            cursor = connection.cursor(binary=True)
+            async for row_id, message, embedding in cursor.stream(
+                """
+                SELECT id, message, embedding FROM knowledge_chunks
+                WHERE embedding_model = %s AND embedding IS NOT NULL
+                """,
+                (EMBED_MODEL_ID,),
+            ):
+                index.add(row_id, message, embedding)
+    except psycopg.Error as e:
+        abort_hot_index_load("failed")
+        logger.log_and_print(f"Failed to load the hot index: {e}")
+        return
+    await finish_hot_index_load(index, time.perf_counter() - started)
+
+
+def start_hot_index_load() -> bool:
+    """
+    (Re)load the hot index in the background, e.g. after a bulk load or re-embed
+    replaced many vectors. Returns False if disabled or a load is already running.
+    """
+    global _hot_index_task
+
+    if not hot_index_enabled():
+        return False
+    if _hot_index_task is not None and not _hot_index_task.done():
+        return False
+    _hot_index_task = asyncio.create_task(load_hot_index())
+    return True
+
+
+def _uses_hybrid(query_text: Optional[str], hybrid: Optional[bool]) -> bool:
+    use_hybrid = HYBRID_SEARCH_CONFIG["enabled"] if hybrid is None else hybrid
+    return use_hybrid and bool(query_text)
+
+
+def _from_hot_index(
+    embeddings: list[dict],
+    query_texts: list[Optional[str]],
+    limit: int,
+    hybrid: Optional[bool],
+    sql_options: tuple,
+    with_vectors: bool = False,
+) -> Optional[list[dict]]:
+    """
+    Fused knowledge hits from the hot index, or None when the query must run in SQL:
+    hybrid queries and calls tuning a SQL index (storage mode, ef_search, probes).
+    """
+    if any(option is not None for option in sql_options):
+        return None
+    if any(_uses_hybrid(query_text, hybrid) for query_text in query_texts):
+        return None
+    return search_hot_index(
+        [embedding["embedding"] for embedding in embeddings],
+        limit,
+        with_vectors=with_vectors,
+    )
+
+
+def _search_statement(
+    embedding: dict,
+    query_text: Optional[str],
+    limit: int,
+    storage_mode: Optional[str],
+    hybrid: Optional[bool],
+    with_vectors: bool = False,
+) -> tuple[sql.Composed, dict, bool]:
+    """Knowledge search query and parameters for one query vector; flags hybrid"""
+    mode = resolve_storage_mode(storage_mode)
+    use_hybrid = _uses_hybrid(query_text, hybrid)
+    query = _as_vector(embedding["embedding"])
+    if use_hybrid:
+        candidates = max(limit, HYBRID_SEARCH_CONFIG["candidates"])
+        return (
+            hybrid_search_sql(
+                KNOWLEDGE_TABLE, storage_mode=mode, with_vectors=with_vectors
+            ),
+            {
+                "query": query,
+                "query_text": query_text,
+                "model": EMBED_MODEL_ID,
+                "limit": limit,
+                "candidates": candidates,
+                # Over-fetched through a compact index (unused for full vectors)
+                "vector_candidates": candidates * VECTOR_STORAGE_CONFIG["overfetch"],
+                "vector_weight": HYBRID_SEARCH_CONFIG["vector_weight"],
+                "lexical_weight": HYBRID_SEARCH_CONFIG["lexical_weight"],
+                "rrf_k": HYBRID_SEARCH_CONFIG["rrf_k"],
+            },
+            True,
+        )
+    return (
+        knowledge_search_sql(KNOWLEDGE_TABLE, storage_mode=mode),
+        {
+            "query": query,
+            "model": EMBED_MODEL_ID,
+            "limit": limit,
+            "candidates": limit * VECTOR_STORAGE_CONFIG["overfetch"],
+        },
+        False,
     )
-    results = cursor.fetchall()
-    resultsFinal = [{"message": row[0], "similarity": row[1]} for row in results]
 
-    cursor.close()
-    return resultsFinal
 
+def _search_results(
+    rows: list[tuple], hybrid: bool, with_vectors: bool = False
+) -> list[dict]:
+    results = []
+    for row in rows:
+        hit = {"message": row[0], "similarity": row[1]}
+        if hybrid:
+            hit["score"] = row[2]
+        if with_vectors:
+            # Stored vectors come last (see with_vectors in db_index)
+            hit["embedding"] = row[-1]
+        results.append(hit)
+    return results
 
-async def save_message(message: str, role: str, session_id: Optional[str] = None):
+
+def _fused_search_statement(
+    embeddings: list[dict],
+    limit: int,
+    storage_mode: Optional[str],
+    with_vectors: bool = False,
+) -> tuple[sql.Composed, dict]:
+    """One knowledge search for all query vectors, fused into a single top-k"""
+    mode = resolve_storage_mode(storage_mode)
+    return (
+        multi_knowledge_search_sql(
+            KNOWLEDGE_TABLE, storage_mode=mode, with_vectors=with_vectors
+        ),
+        {
+            # One vector[] parameter, so the statement is the same for any count
+            "queries": [as_vector(embedding["embedding"]) for embedding in embeddings],
+            "model": EMBED_MODEL_ID,
+            "limit": limit,
+            "candidates": (
+                limit if mode == "full" else limit * VECTOR_STORAGE_CONFIG["overfetch"]
+            ),
+        },
+    )
+
+
+def _hit_rank(hit: dict, hybrid: bool) -> float:
+    """Sort key, lower is better: fused RRF score for hybrid hits, else distance"""
+    return -hit["score"] if hybrid else hit["similarity"]
+
+
+def _fuse_hits(hit_lists: list[list[dict]], limit: int, hybrid: bool) -> list[dict]:
+    """One top-k over several queries' hits; a message keeps only its best hit"""
+    best: dict[str, dict] = {}
+    for hits in hit_lists:
+        for hit in hits:
+            current = best.get(hit["message"])
+            if current is None or _hit_rank(hit, hybrid) < _hit_rank(current, hybrid):
+                best[hit["message"]] = hit
+    return sorted(best.values(), key=lambda hit: _hit_rank(hit, hybrid))[:limit]
+
+
+async def get_embeddings_from_db(
+    embedding: dict,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    storage_mode: Optional[str] = None,
+    limit: int = 3,
+    query_text: Optional[str] = None,
+    hybrid: Optional[bool] = None,
+):
+    """
+    Fetch embeddings and similarity scores from the database based on the user message.
+    ef_search (HNSW) / probes (IVFFlat) trade recall for latency for this query only.
+    storage_mode picks the index to search; halfvec/binary/truncated over-fetch and
+    re-rank the candidates with the full vectors.
+    With hybrid (default HYBRID_SEARCH_ENABLED) and query_text, full-text matches are
+    fused with the vector ranking; results then also carry the fused RRF `score`.
+    Plain vector queries are answered by the hot index when it is loaded, unless
+    storage_mode, ef_search or probes ask for a specific SQL index.
+    """
+    hits = _from_hot_index(
+        [embedding], [query_text], limit, hybrid, (storage_mode, ef_search, probes)
+    )
+    if hits is not None:
+        return hits
+    statement, params, use_hybrid = _search_statement(
+        embedding, query_text, limit, storage_mode, hybrid
+    )
+    async with get_db_connection() as connection:
+        await apply_search_tuning(
+            connection, ef_search=ef_search, probes=probes, prepare=PREPARE
+        )
+        with timed("db.hybrid_search" if use_hybrid else "db.similarity_search"):
+            cursor = await connection.execute(statement, params, prepare=PREPARE)
+            results = await cursor.fetchall()
+    return _search_results(results, use_hybrid)
+
+
+async def get_retrieval_context(
+    embeddings: list[dict],
+    query_texts: Optional[list[Optional[str]]] = None,
+    session_id: Optional[str] = None,
+    history_limit: int = 30,
+    limit: int = 3,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    storage_mode: Optional[str] = None,
+    hybrid: Optional[bool] = None,
+    with_vectors: bool = False,
+) -> tuple[list[dict], list[dict]]:
+    """
+    Fused top-k knowledge for all query vectors (e.g. the chunks of a long message)
+    plus the session's most recent turns, in a single database round trip.
+    Vector queries run as one statement over every query vector; a knowledge chunk
+    matched by several of them is returned once with its best similarity, and the
+    limit applies to the whole input rather than to each vector. Queries with text,
+    when hybrid search is on, run one hybrid statement each in the same pipeline;
+    hits are fused by RRF score, or by distance if some queries had no text.
+    Returns (knowledge hits, recent messages newest first) in the shapes of
+    get_embeddings_from_db and get_recent_messages. Vectors whose embedding failed
+    are skipped; when the hot index answers, only the history is fetched.
+    with_vectors adds each hit's stored vector as "embedding" (for diversification).
+    """
+    effective_session_id = session_id if session_id is not None else "default_session"
+    texts = query_texts or [None] * len(embeddings)
+    queries = [
+        (embedding, query_text)
+        for embedding, query_text in zip(embeddings, texts)
+        if _has_embedding(embedding["embedding"])
+    ]
+    # Decided per query: a chunk without text can only be searched by its vector
+    lexical = [q for q in queries if _uses_hybrid(q[1], hybrid)]
+    vector_only = [q for q in queries if not _uses_hybrid(q[1], hybrid)]
+    knowledge = None
+    if queries:
+        knowledge = _from_hot_index(
+            [embedding for embedding, _ in queries],
+            [query_text for _, query_text in queries],
+            limit,
+            hybrid,
+            (storage_mode, ef_search, probes),
+            with_vectors=with_vectors,
+        )
+    try:
+        async with get_db_connection() as connection:
+            with timed("db.retrieval_context"):
+                async with connection.pipeline():
+                    await apply_search_tuning(
+                        connection, ef_search=ef_search, probes=probes, prepare=PREPARE
+                    )
+                    searches = []
+                    if knowledge is None:
+                        for embedding, query_text in lexical:
+                            statement, params, _ = _search_statement(
+                                embedding,
+                                query_text,
+                                limit,
+                                storage_mode,
+                                hybrid,
+                                with_vectors=with_vectors,
+                            )
+                            cursor = await connection.execute(
+                                statement, params, prepare=PREPARE
+                            )
+                            searches.append((cursor, True))
+                    if knowledge is None and vector_only:
+                        statement, params = _fused_search_statement(
+                            [embedding for embedding, _ in vector_only],
+                            limit,
+                            storage_mode,
+                            with_vectors=with_vectors,
+                        )
+                        cursor = await connection.execute(
+                            statement, params, prepare=PREPARE
+                        )
+                        searches.append((cursor, False))
+                    history_cursor = await connection.execute(
+                        _RECENT_MESSAGES_SQL,
+                        (effective_session_id, history_limit),
+                        prepare=PREPARE,
+                    )
+                # Leaving the pipeline block syncs once; every result is now buffered
+                hit_lists = [
+                    _search_results(await cursor.fetchall(), use_hybrid, with_vectors)
+                    for cursor, use_hybrid in searches
+                ]
+                history = _recent_messages(await history_cursor.fetchall())
+    except psycopg.Error as e:
+        logger.log_and_print(f"Database error while fetching retrieval context: {e}")
+        return knowledge or [], []
+    if knowledge is None:
+        # Fused RRF scores only compare among hybrid hits; mixed lists use distance
+        knowledge = _fuse_hits(hit_lists, limit, bool(lexical) and not vector_only)
+    return knowledge, history
+
+
+async def find_embedding_by_hash(
+    connection: psycopg.AsyncConnection, message_hash: str
+) -> tuple[bool, Optional[Vector]]:
+    """
+    Look up a stored vector for a content hash.
+    Returns (already_in_knowledge, vector) where vector is None when not found or
+    when it was produced by a different embedding model than EMBED_MODEL_ID.
+    """
+    with timed("db.find_by_hash"):
+        cursor = await connection.execute(
+            """
+            (SELECT true,
+                    CASE WHEN embedding_model = %(model)s THEN embedding END
+             FROM knowledge_chunks
+             WHERE content_hash = %(hash)s AND embedding IS NOT NULL LIMIT 1)
+            UNION ALL
+            (SELECT false, embedding FROM conversation_messages
+             WHERE content_hash = %(hash)s AND embedding IS NOT NULL
+             AND embedding_model = %(model)s LIMIT 1)
+            LIMIT 1
+            """,
+            {"hash": message_hash, "model": EMBED_MODEL_ID},
+            prepare=PREPARE,
+        )
+        row = await cursor.fetchone()
+    if row is None:
+        return False, None
+    vector = row[1]
+    if vector is not None and VECTOR_STORAGE_CONFIG["normalize"]:
+        # Conversation vectors may predate VECTOR_NORMALIZE; knowledge must be unit
+        vector = normalize_vector(as_vector(vector))
+    return row[0], vector
+
+
+async def find_existing_knowledge_hashes(
+    hashes: list[str], knowledge_table: str = KNOWLEDGE_TABLE
+) -> set[str]:
+    """Subset of the given content hashes that are already stored as knowledge"""
+    if not hashes:
+        return set()
+    async with get_db_connection() as connection:
+        cursor = await connection.execute(
+            sql.SQL("SELECT content_hash FROM {} WHERE content_hash = ANY(%s)").format(
+                sql.Identifier(knowledge_table)
+            ),
+            (hashes,),
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+
+async def save_message(
+    message: str,
+    role: str,
+    session_id: Optional[str] = None,
+    embedding: Optional[np.ndarray] = None,
+):
     """
     Save a (already pre-chunked upstream) message and its embedding to the database.
     Upstream pipeline (e.g. test_search.py) is responsible for chunking.
+    Role 'system' is crawled knowledge; every other role is a conversation turn.
+    Identical knowledge is never stored twice, and a stored vector for the same
+    text is reused instead of calling the embed server.
+    Pass `embedding` when the caller already embedded this text (e.g. for retrieval)
+    to skip both the lookup and the embed call.
     """
-    connection = get_db_connection_instance()
-    cursor = connection.cursor()
     effective_session_id = session_id if session_id is not None else "default_session"
     logger.log_and_print(
         f"Saving message to database for session: {effective_session_id}"
     )
+    message_hash = content_hash(message)
     try:
-        print(f"Embedding message... Length: {len(message)}")
-        embedding = await embed_text(message)
-        cursor.execute(
-            """
-            INSERT INTO messages (message, role, embedding, sessionId)
-            VALUES (%s, %s, %s, %s);
-            """,
-            (message, role, embedding["embedding"], effective_session_id),
-        )
-        connection.commit()
-        # chunks = chunk_text(message, 768)
-        # for chunk in chunks:
-        #     embedding = await embed_text(chunk)
-        #     if not chunk or embedding is None:
-        #         logger.log_and_print("Chunk or embedding is None, skipping save.")
-        #         return
-        #     cursor.execute(
-        #         """
-        #         INSERT INTO messages (message, role, embedding, sessionId)
-        #         VALUES (%s, %s, %s, %s);
-        #         """,
-        #         (chunk, role, embedding["embedding"], effective_session_id),
-        #     )
-        #     connection.commit()
-    except psycopg2.Error as e:
-        logger.log_and_print("Database error:", e)
-        connection.rollback()
-    finally:
-        cursor.close()
+        if _has_embedding(embedding):
+            vector = embedding
+            increment("dedup.embedding_passed")
+        else:
+            async with get_db_connection() as connection:
+                in_knowledge, vector = await find_embedding_by_hash(
+                    connection, message_hash
+                )
+            if role == "system" and in_knowledge:
+                increment("dedup.knowledge_hits")
+                logger.log_and_print("Knowledge chunk already stored, skipping save.")
+                return
+            if vector is not None:
+                increment("dedup.embedding_reused")
+            else:
+                print(f"Embedding message... Length: {len(message)}")
+                # Embed before borrowing a connection so the pool is not held during the HTTP call
+                vector = (await embed_text(message))["embedding"]
+
+        if not _has_embedding(vector):
+            logger.log_and_print("Embedding failed, skipping save.")
+            return
+
+        inserted = None
+        async with get_db_connection() as connection:
+            with timed("db.insert_message"):
+                if role == "system":
+                    cursor = await connection.execute(
+                        """
+                        INSERT INTO knowledge_chunks
+                            (message, content_hash, embedding, embedding_model)
+                        VALUES (%s, %s, %b, %s)
+                        ON CONFLICT (content_hash) DO NOTHING
+                        RETURNING id;
+                        """,
+                        (message, message_hash, _as_vector(vector), EMBED_MODEL_ID),
+                        prepare=PREPARE,
+                    )
+                    inserted = await cursor.fetchone()
+                else:
+                    # The same turn saved twice in a row (e.g. a message and its
+                    # only chunk) is stored once; a repeat after a reply is history
+                    await connection.execute(
+                        """
+                        INSERT INTO conversation_messages
+                            (session_id, role, message, content_hash, embedding,
+                             embedding_model)
+                        SELECT %(session)s, %(role)s, %(message)s, %(hash)s,
+                               %(embedding)b, %(model)s
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM (
+                                SELECT role, content_hash FROM conversation_messages
+                                WHERE session_id = %(session)s
+                                ORDER BY created_at DESC
+                                LIMIT 1
+                            ) AS latest
+                            WHERE latest.role = %(role)s
+                            AND latest.content_hash = %(hash)s
+                        );
+                        """,
+                        {
+                            "session": effective_session_id,
+                            "role": role,
+                            "message": message,
+                            "hash": message_hash,
+                            "embedding": _as_vector(vector),
+                            "model": EMBED_MODEL_ID,
+                        },
+                        prepare=PREPARE,
+                    )
+        if inserted:
+            # Committed: mirror the new knowledge row in the hot index
+            if not add_to_hot_index([(inserted[0], message, as_vector(vector))]):
+                start_hot_index_load()
+    except psycopg.Error as e:
+        logger.log_and_print(f"Database error: {e}")
+
+
+def _has_embedding(vector) -> bool:
+    """False for missing vectors and the [-1] sentinel embed_text returns on failure"""
+    if vector is None:
+        return False
+    if isinstance(vector, Vector):
+        return vector.dimensions() > 1
+    return len(vector) > 1
+
+
+async def save_messages_bulk(
+    rows: Iterable[tuple[str, str, Optional[str], np.ndarray]],
+    knowledge_table: str = KNOWLEDGE_TABLE,
+) -> dict:
+    """
+    Save many already-embedded messages in a single transaction using COPY.
+    Each row is (message, role, session_id, vector); rows whose embedding failed
+    upstream are skipped. Knowledge is staged and merged with ON CONFLICT so
+    duplicates (in the batch or already stored) are dropped.
+    knowledge_table redirects knowledge rows (e.g. into a bulk-load shadow table).
+    Returns row count, elapsed seconds and rows/sec.
+    """
+    started = time.perf_counter()
+    knowledge_rows = {}
+    knowledge_submitted = 0
+    conversation_rows = []
+    skipped = 0
+    for message, role, session_id, vector in rows:
+        if not message or not _has_embedding(vector):
+            skipped += 1
+            continue
+        message_hash = content_hash(message)
+        if role == "system":
+            knowledge_submitted += 1
+            knowledge_rows.setdefault(
+                message_hash, (message, message_hash, _as_vector(vector))
+            )
+        else:
+            effective_session_id = (
+                session_id if session_id is not None else "default_session"
+            )
+            conversation_rows.append(
+                (
+                    effective_session_id,
+                    role,
+                    message,
+                    message_hash,
+                    _as_vector(vector),
+                    EMBED_MODEL_ID,
+                )
+            )
+
+    knowledge_written = 0
+    merged_rows: list[tuple[int, str]] = []
+    async with get_db_connection() as connection:
+        cursor = connection.cursor()
+        if knowledge_rows:
+            await connection.execute(
+                """
+                CREATE TEMP TABLE incoming_knowledge (
+                    message TEXT, content_hash TEXT, embedding vector(768)
+                ) ON COMMIT DROP
+                """
+            )
+            async with cursor.copy(
+                "COPY incoming_knowledge (message, content_hash, embedding) "
+                "FROM STDIN (FORMAT BINARY)"
+            ) as copy:
+                copy.set_types(["text", "text", "vector"])
+                for row in knowledge_rows.values():
+                    await copy.write_row(row)
+            merged = await connection.execute(
+                sql.SQL(
+                    """
+                    INSERT INTO {} (message, content_hash, embedding, embedding_model)
+                    SELECT message, content_hash, embedding, %s FROM incoming_knowledge
+                    ON CONFLICT (content_hash) DO NOTHING
+                    RETURNING id, content_hash
+                    """
+                ).format(sql.Identifier(knowledge_table)),
+                (EMBED_MODEL_ID,),
+            )
+            merged_rows = await merged.fetchall()
+            knowledge_written = len(merged_rows)
+        if conversation_rows:
+            async with cursor.copy(
+                "COPY conversation_messages "
+                "(session_id, role, message, content_hash, embedding, embedding_model) "
+                "FROM STDIN (FORMAT BINARY)"
+            ) as copy:
+                copy.set_types(["text", "text", "text", "text", "vector", "text"])
+                for row in conversation_rows:
+                    await copy.write_row(row)
+
+    if knowledge_table == KNOWLEDGE_TABLE:
+        # Committed: mirror the new knowledge rows in the hot index
+        new_rows = []
+        for row_id, message_hash in merged_rows:
+            message, _, vector = knowledge_rows[message_hash]
+            new_rows.append((row_id, message, vector))
+        if not add_to_hot_index(new_rows):
+            start_hot_index_load()
+    duplicates = knowledge_submitted - knowledge_written
+    if duplicates:
+        increment("dedup.knowledge_hits", duplicates)
+    written = knowledge_written + len(conversation_rows)
+    elapsed = time.perf_counter() - started
+    rows_per_sec = written / elapsed if elapsed > 0 else 0.0
+    logger.log_and_print(
+        f"Bulk saved {written} messages in {elapsed:.3f}s "
+        f"({rows_per_sec:.1f} rows/sec, {skipped} skipped, {duplicates} duplicates)"
+    )
+    return {
+        "rows": written,
+        "skipped": skipped,
+        "duplicates": duplicates,
+        "seconds": elapsed,
+        "rows_per_sec": rows_per_sec,
+    }
+
+
+_RECENT_MESSAGES_SQL = """
+    SELECT message, role, created_at
+    FROM conversation_messages
+    WHERE session_id = %s
+    AND role IN ('user', 'assistant')
+    ORDER BY created_at DESC
+    LIMIT %s
+"""
+
+
+def _recent_messages(rows: list[tuple]) -> list[dict]:
+    return [{"message": row[0], "role": row[1], "created_at": row[2]} for row in rows]
 
 
 async def get_recent_messages(limit: int, session_id: Optional[str] = None):
@@ -152,27 +1288,18 @@ async def get_recent_messages(limit: int, session_id: Optional[str] = None):
     Fetch the most recent messages and their roles from the database.
     Filters messages from users and assistant, sorted by latest date.
     """
-    cursor = get_db_connection()
     effective_session_id = session_id if session_id is not None else "default_session"
-    logger.log_and_print("Fetching recent messages for session:", effective_session_id)
+    logger.log_and_print(f"Fetching recent messages for session: {effective_session_id}")
     try:
-        cursor.execute(
-            """
-            SELECT message, role, created_at
-            FROM messages
-            WHERE role IN ('user', 'assistant')
-            AND sessionId = %s
-            ORDER BY created_at DESC
-            LIMIT %s
-            """,
-            (effective_session_id, limit),
-        )
-        results = cursor.fetchall()
-        return [
-            {"message": row[0], "role": row[1], "created_at": row[2]} for row in results
-        ]
-    except psycopg2.Error as e:
-        logger.log_and_print("Database error while fetching recent messages:", e)
+        async with get_db_connection() as connection:
+            with timed("db.recent_messages"):
+                cursor = await connection.execute(
+                    _RECENT_MESSAGES_SQL,
+                    (effective_session_id, limit),
+                    prepare=PREPARE,
+                )
+                results = await cursor.fetchall()
+        return _recent_messages(results)
+    except psycopg.Error as e:
+        logger.log_and_print(f"Database error while fetching recent messages: {e}")
         return []
-    finally:
-        cursor.close()
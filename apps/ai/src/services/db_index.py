@@ -0,0 +1,516 @@
+from typing import Optional
+import psycopg
+from psycopg import sql
+from utils.constants import (
+    HYBRID_SEARCH_CONFIG,
+    VECTOR_INDEX_CONFIG,
+    VECTOR_STORAGE_CONFIG,
+)
+
+# Matches the vector(768) columns created in initialize_database
+EMBEDDING_DIM = 768
+STORAGE_MODES = ("full", "halfvec", "binary", "truncated")
+
+
+def resolve_storage_mode(storage_mode: Optional[str] = None) -> str:
+    """Return the requested storage mode, defaulting to VECTOR_STORAGE_MODE"""
+    mode = (storage_mode or VECTOR_STORAGE_CONFIG["mode"]).lower()
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown vector storage mode: {mode}")
+    return mode
+
+
+def _truncated_dim(dims: Optional[int] = None) -> int:
+    dims = dims or VECTOR_STORAGE_CONFIG["truncated_dim"]
+    if not 0 < dims < EMBEDDING_DIM:
+        raise ValueError(
+            f"Truncated dimension must be between 1 and {EMBEDDING_DIM - 1}"
+        )
+    return dims
+
+
+def truncated_column(column: str = "embedding", dims: Optional[int] = None) -> str:
+    """Name of the generated column holding the leading dims of `column`"""
+    return f"{column}_{_truncated_dim(dims)}"
+
+
+def truncated_column_sql(
+    table: str, column: str = "embedding", dims: Optional[int] = None
+) -> sql.Composed:
+    """
+    Add the generated column searched by the truncated storage mode: the first dims
+    dimensions of `column`, re-normalized. Postgres keeps it in sync on every write.
+    At 4 bytes per dimension it stays inline in the row while the full vector is
+    TOASTed, so the first stage never reads full vectors. Adding it rewrites the table.
+    """
+    dims = _truncated_dim(dims)
+    return sql.SQL(
+        "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} vector({dims}) "
+        "GENERATED ALWAYS AS (l2_normalize(subvector({column}, 1, {dims}))) STORED"
+    ).format(
+        table=sql.Identifier(table),
+        name=sql.Identifier(truncated_column(column, dims)),
+        column=sql.Identifier(column),
+        dims=sql.Literal(dims),
+    )
+
+
+def pgvector_requirement(
+    storage_mode: Optional[str] = None,
+) -> Optional[tuple[tuple[int, ...], str]]:
+    """
+    Oldest pgvector release the configured vector features need, with the setting
+    that needs it; None when any release will do. halfvec, binary_quantize,
+    subvector and l2_normalize arrived in 0.7.0, HNSW in 0.5.0.
+    """
+    mode = resolve_storage_mode(storage_mode)
+    if mode != "full":
+        return (0, 7, 0), f"VECTOR_STORAGE_MODE={mode}"
+    if VECTOR_STORAGE_CONFIG["normalize"]:
+        return (0, 7, 0), "VECTOR_NORMALIZE=true"
+    if VECTOR_INDEX_CONFIG["type"] == "hnsw":
+        return (0, 5, 0), "VECTOR_INDEX_TYPE=hnsw"
+    return None
+
+
+def vector_metric(storage_mode: Optional[str] = None) -> str:
+    """Distance the managed index orders by for a storage mode: ip, cosine or hamming"""
+    mode = resolve_storage_mode(storage_mode)
+    if mode == "binary":
+        return "hamming"
+    # The truncated column is always unit length
+    if mode == "truncated" or VECTOR_STORAGE_CONFIG["normalize"]:
+        return "ip"
+    return "cosine"
+
+
+def _search_operands(
+    storage_mode: str,
+    column: str,
+    dims: Optional[int] = None,
+    query: Optional[sql.Composable] = None,
+) -> dict:
+    """
+    Indexed expression, operator class, distance operator and query expression
+    for a storage mode. Normalized vectors use inner product (cheaper than cosine).
+    `query` is the full query vector expression (default the %(query)b parameter).
+    """
+    metric = vector_metric("full")
+    operator = "<#>" if metric == "ip" else "<=>"
+    column_sql = sql.Identifier(column)
+    query = query or sql.SQL("%(query)b::vector")
+    if storage_mode == "truncated":
+        dims = _truncated_dim(dims)
+        return {
+            "expression": sql.Identifier(truncated_column(column, dims)),
+            # The generated column is always unit length
+            "opclass": "vector_ip_ops",
+            "operator": "<#>",
+            "query": sql.SQL("l2_normalize(subvector({}, 1, {}))").format(
+                query, sql.Literal(dims)
+            ),
+        }
+    if storage_mode == "halfvec":
+        return {
+            "expression": sql.SQL("({}::halfvec({}))").format(
+                column_sql, sql.Literal(EMBEDDING_DIM)
+            ),
+            "opclass": f"halfvec_{metric}_ops",
+            "operator": operator,
+            "query": sql.SQL("{}::halfvec({})").format(
+                query, sql.Literal(EMBEDDING_DIM)
+            ),
+        }
+    if storage_mode == "binary":
+        return {
+            "expression": sql.SQL("(binary_quantize({})::bit({}))").format(
+                column_sql, sql.Literal(EMBEDDING_DIM)
+            ),
+            "opclass": "bit_hamming_ops",
+            "operator": "<~>",
+            "query": sql.SQL("binary_quantize({})::bit({})").format(
+                query, sql.Literal(EMBEDDING_DIM)
+            ),
+        }
+    return {
+        "expression": column_sql,
+        "opclass": f"vector_{metric}_ops",
+        "operator": operator,
+        "query": query,
+    }
+
+
+def vector_index_name(
+    table: str,
+    column: str = "embedding",
+    storage_mode: Optional[str] = None,
+    dims: Optional[int] = None,
+) -> str:
+    """
+    Name of the managed ANN index for the given table/column and storage mode. The
+    metric is part of it, so toggling VECTOR_NORMALIZE asks for a new index instead
+    of accepting one built with the other operator class.
+    """
+    mode = resolve_storage_mode(storage_mode)
+    if mode == "truncated":
+        column = truncated_column(column, dims)
+    metric = vector_metric(mode)
+    return f"{table}_{column}_{mode}_{metric}_{VECTOR_INDEX_CONFIG['type']}_idx"
+
+
+def vector_index_sql(
+    table: str,
+    column: str = "embedding",
+    where: Optional[str] = None,
+    concurrently: bool = False,
+    storage_mode: Optional[str] = None,
+    dims: Optional[int] = None,
+    name: Optional[str] = None,
+) -> Optional[sql.Composed]:
+    """
+    Build the CREATE INDEX statement for the configured ANN index type and storage mode.
+    Returns None when VECTOR_INDEX_TYPE is 'none'. dims overrides VECTOR_TRUNCATED_DIM
+    for the truncated mode, whose column must exist (see truncated_column_sql).
+    name overrides vector_index_name (e.g. for an index renamed later).
+    """
+    index_type = VECTOR_INDEX_CONFIG["type"]
+    if index_type == "hnsw":
+        options = sql.SQL("m = {}, ef_construction = {}").format(
+            sql.Literal(VECTOR_INDEX_CONFIG["m"]),
+            sql.Literal(VECTOR_INDEX_CONFIG["ef_construction"]),
+        )
+    elif index_type == "ivfflat":
+        options = sql.SQL("lists = {}").format(
+            sql.Literal(VECTOR_INDEX_CONFIG["lists"])
+        )
+    elif index_type == "none":
+        return None
+    else:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE: {index_type}")
+
+    mode = resolve_storage_mode(storage_mode)
+    operands = _search_operands(mode, column, dims)
+    statement = sql.SQL(
+        "CREATE INDEX {concurrently} IF NOT EXISTS {name} ON {table} "
+        "USING {method} ({expression} {opclass}) WITH ({options})"
+    ).format(
+        concurrently=sql.SQL("CONCURRENTLY" if concurrently else ""),
+        name=sql.Identifier(name or vector_index_name(table, column, mode, dims)),
+        table=sql.Identifier(table),
+        method=sql.SQL(index_type),
+        expression=operands["expression"],
+        opclass=sql.SQL(operands["opclass"]),
+        options=options,
+    )
+    if where:
+        statement += sql.SQL(" WHERE ") + sql.SQL(where)
+    return statement
+
+
+def _model_filter(match_model: bool) -> sql.SQL:
+    # Vectors from different embedding models are not comparable
+    return sql.SQL("WHERE embedding_model = %(model)s" if match_model else "")
+
+
+def knowledge_search_sql(
+    table: str,
+    column: str = "embedding",
+    storage_mode: Optional[str] = None,
+    match_model: bool = True,
+    dims: Optional[int] = None,
+) -> sql.Composed:
+    """
+    Top-k similarity query for a storage mode, taking %(query)b (a pgvector Vector,
+    sent in binary), %(limit)s, %(candidates)s and, with match_model, %(model)s
+    (only rows embedded by that model are searched). Quantized and truncated modes
+    over-fetch candidates through the compact index and re-rank them by exact
+    cosine distance on the full vectors.
+    `similarity` is always the exact cosine distance (lower is closer).
+    """
+    mode = resolve_storage_mode(storage_mode)
+    operands = _search_operands(mode, column, dims)
+    nearest = sql.SQL(
+        """
+        SELECT message, {column} <=> %(query)b::vector AS similarity
+        FROM {table}
+        {model_filter}
+        ORDER BY {expression} {operator} {query}
+        LIMIT {limit}
+        """
+    )
+    params = {
+        "column": sql.Identifier(column),
+        "table": sql.Identifier(table),
+        "model_filter": _model_filter(match_model),
+        "expression": operands["expression"],
+        "operator": sql.SQL(operands["operator"]),
+        "query": operands["query"],
+    }
+    if mode == "full":
+        return nearest.format(limit=sql.SQL("%(limit)s"), **params)
+
+    candidates = nearest.format(limit=sql.SQL("%(candidates)s"), **params)
+    return sql.SQL(
+        """
+        SELECT message, similarity
+        FROM ({candidates}) AS candidates
+        ORDER BY similarity ASC
+        LIMIT %(limit)s
+        """
+    ).format(candidates=candidates)
+
+
+def multi_knowledge_search_sql(
+    table: str,
+    column: str = "embedding",
+    storage_mode: Optional[str] = None,
+    match_model: bool = True,
+    dims: Optional[int] = None,
+    with_vectors: bool = False,
+) -> sql.Composed:
+    """
+    Fused top-k over several query vectors in one statement, taking %(queries)b
+    (a list of vectors, sent as one binary vector[]), %(limit)s, %(candidates)s and,
+    with match_model, %(model)s. Every query runs its own indexed nearest-neighbour
+    scan through a LATERAL join (%(candidates)s rows each: the limit for full
+    vectors, over-fetched for the compact modes). Rows found by several queries are
+    kept once with their best exact cosine distance, then ranked together.
+    with_vectors adds each row's stored vector as a third column.
+    """
+    mode = resolve_storage_mode(storage_mode)
+    operands = _search_operands(mode, column, dims, query=sql.SQL("q.query"))
+    return sql.SQL(
+        """
+        SELECT message, min(similarity) AS similarity{stored}
+        FROM unnest(%(queries)b::vector[]) AS q(query)
+        CROSS JOIN LATERAL (
+            SELECT id, message, {column} <=> q.query AS similarity{stored_column}
+            FROM {table}
+            {model_filter}
+            ORDER BY {expression} {operator} {query}
+            LIMIT %(candidates)s
+        ) AS hits
+        GROUP BY id, message
+        ORDER BY similarity ASC
+        LIMIT %(limit)s
+        """
+    ).format(
+        # Every row of a group is the same chunk, so any of its vectors will do
+        stored=sql.SQL(", (array_agg(stored))[1]" if with_vectors else ""),
+        stored_column=sql.SQL(", {} AS stored").format(sql.Identifier(column))
+        if with_vectors
+        else sql.SQL(""),
+        column=sql.Identifier(column),
+        table=sql.Identifier(table),
+        model_filter=_model_filter(match_model),
+        expression=operands["expression"],
+        operator=sql.SQL(operands["operator"]),
+        query=operands["query"],
+    )
+
+
+def hybrid_search_sql(
+    table: str,
+    column: str = "embedding",
+    storage_mode: Optional[str] = None,
+    match_model: bool = True,
+    with_vectors: bool = False,
+) -> sql.Composed:
+    """
+    Single-statement hybrid query fusing the vector ranking and the full-text ranking
+    (ts_rank_cd with length normalization over the search_tsv GIN index) by
+    reciprocal rank fusion. Takes %(query)b, %(query_text)s, %(candidates)s,
+    %(limit)s, %(vector_weight)s, %(lexical_weight)s, %(rrf_k)s and, with
+    match_model, %(model)s (both rankings only consider that model's rows).
+    Quantized and truncated modes also take %(vector_candidates)s: that many rows
+    are over-fetched through the compact index and re-ranked by exact cosine
+    distance on the full vectors before the top %(candidates)s enter the fusion.
+    Query terms are OR-ed so a single exact identifier is enough to match.
+    with_vectors adds each row's stored vector as a fourth column.
+    """
+    mode = resolve_storage_mode(storage_mode)
+    operands = _search_operands(mode, column)
+    nearest = sql.SQL(
+        """
+        SELECT id, {expression} {operator} {query} AS distance
+        FROM {table}
+        {model_filter}
+        ORDER BY distance
+        LIMIT {limit}
+        """
+    )
+    nearest_params = {
+        "table": sql.Identifier(table),
+        "model_filter": _model_filter(match_model),
+        "expression": operands["expression"],
+        "operator": sql.SQL(operands["operator"]),
+        "query": operands["query"],
+    }
+    if mode == "full":
+        vector_candidates = nearest.format(
+            limit=sql.SQL("%(candidates)s"), **nearest_params
+        )
+    else:
+        vector_candidates = sql.SQL(
+            """
+            SELECT r.id, r.{column} <=> %(query)b::vector AS distance
+            FROM ({nearest}) AS approximate
+            JOIN {table} r ON r.id = approximate.id
+            ORDER BY distance
+            LIMIT %(candidates)s
+            """
+        ).format(
+            nearest=nearest.format(
+                limit=sql.SQL("%(vector_candidates)s"), **nearest_params
+            ),
+            column=sql.Identifier(column),
+            table=sql.Identifier(table),
+        )
+    return sql.SQL(
+        """
+        WITH vector_hits AS (
+            SELECT id, row_number() OVER (ORDER BY distance) AS rank
+            FROM ({vector_candidates}) AS nearest
+        ),
+        text_query AS (
+            SELECT to_tsquery(
+                {ts_config},
+                replace(plainto_tsquery({ts_config}, %(query_text)s)::text, ' & ', ' | ')
+            ) AS terms
+        ),
+        lexical_hits AS (
+            SELECT id, row_number() OVER (ORDER BY text_rank DESC) AS rank
+            FROM (
+                SELECT t.id, ts_rank_cd(t.search_tsv, q.terms, 1) AS text_rank
+                FROM {table} t, text_query q
+                WHERE t.search_tsv @@ q.terms {lexical_model_filter}
+                ORDER BY text_rank DESC
+                LIMIT %(candidates)s
+            ) AS matched
+        ),
+        fused AS (
+            SELECT COALESCE(v.id, l.id) AS id,
+                   COALESCE(%(vector_weight)s::float8 / (%(rrf_k)s + v.rank), 0)
+                   + COALESCE(%(lexical_weight)s::float8 / (%(rrf_k)s + l.rank), 0)
+                   AS score
+            FROM vector_hits v
+            FULL OUTER JOIN lexical_hits l ON l.id = v.id
+        )
+        SELECT k.message, k.{column} <=> %(query)b::vector AS similarity, f.score{vector}
+        FROM fused f
+        JOIN {table} k ON k.id = f.id
+        ORDER BY f.score DESC
+        LIMIT %(limit)s
+        """
+    ).format(
+        vector_candidates=vector_candidates,
+        vector=sql.SQL(", k.{}").format(sql.Identifier(column))
+        if with_vectors
+        else sql.SQL(""),
+        column=sql.Identifier(column),
+        table=sql.Identifier(table),
+        lexical_model_filter=sql.SQL(
+            "AND t.embedding_model = %(model)s" if match_model else ""
+        ),
+        ts_config=sql.SQL("{}::regconfig").format(
+            sql.Literal(HYBRID_SEARCH_CONFIG["text_search_config"])
+        ),
+    )
+
+
+async def apply_search_tuning(
+    connection: psycopg.AsyncConnection,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    prepare: Optional[bool] = None,
+):
+    """
+    Set the per-query ANN search parameters for the current transaction only.
+    Falls back to the VECTOR_INDEX_CONFIG defaults when not given.
+    """
+    index_type = VECTOR_INDEX_CONFIG["type"]
+    if index_type == "hnsw":
+        value = ef_search or VECTOR_INDEX_CONFIG["ef_search"]
+        await connection.execute(
+            "SELECT set_config('hnsw.ef_search', %s, true)", (str(value),),
+            prepare=prepare,
+        )
+    elif index_type == "ivfflat":
+        value = probes or VECTOR_INDEX_CONFIG["probes"]
+        await connection.execute(
+            "SELECT set_config('ivfflat.probes', %s, true)", (str(value),),
+            prepare=prepare,
+        )
+
+
+async def superseded_vector_indexes(
+    connection: psycopg.AsyncConnection, table: str, keep: str
+) -> list[str]:
+    """
+    ANN (hnsw/ivfflat) indexes on the table other than `keep`: left over from another
+    storage mode, index type or metric, or from before indexes were named per mode.
+    """
+    cursor = await connection.execute(
+        """
+        SELECT c.relname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am a ON a.oid = c.relam
+        WHERE i.indrelid = to_regclass(%s)
+        AND a.amname IN ('hnsw', 'ivfflat') AND c.relname <> %s
+        """,
+        (table, keep),
+    )
+    return [row[0] for row in await cursor.fetchall()]
+
+
+async def get_vector_index_status(
+    connection: psycopg.AsyncConnection,
+    table: str,
+    column: str = "embedding",
+    storage_mode: Optional[str] = None,
+) -> dict:
+    """
+    Report whether the managed ANN index exists and is valid, its size,
+    and the progress of any CREATE INDEX currently running on the table.
+    """
+    name = vector_index_name(table, column, storage_mode)
+    cursor = await connection.execute(
+        """
+        SELECT i.indisvalid, pg_get_indexdef(i.indexrelid),
+               pg_size_pretty(pg_relation_size(i.indexrelid))
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s
+        """,
+        (name,),
+    )
+    index_row = await cursor.fetchone()
+
+    cursor = await connection.execute(
+        """
+        SELECT p.phase, p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+        FROM pg_stat_progress_create_index p
+        WHERE p.relid = to_regclass(%s)
+        """,
+        (table,),
+    )
+    progress_row = await cursor.fetchone()
+
+    status = {
+        "name": name,
+        "type": VECTOR_INDEX_CONFIG["type"],
+        "storage_mode": resolve_storage_mode(storage_mode),
+        "present": index_row is not None,
+        "valid": bool(index_row and index_row[0]),
+        "definition": index_row[1] if index_row else None,
+        "size": index_row[2] if index_row else None,
+        "build_progress": None,
+    }
+    if progress_row:
+        phase, blocks_done, blocks_total, tuples_done, tuples_total = progress_row
+        status["build_progress"] = {
+            "phase": phase,
+            "blocks": f"{blocks_done}/{blocks_total}",
+            "tuples": f"{tuples_done}/{tuples_total}",
+        }
+    return status
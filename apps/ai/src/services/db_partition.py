@@ -0,0 +1,257 @@
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+import psycopg
+from psycopg import sql
+from utils.constants import CONVERSATION_PARTITION_CONFIG
+
+PARTITION_INTERVALS = ("day", "week", "month")
+
+# Upper bound of a range partition as shown by pg_get_expr(relpartbound)
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def _interval() -> str:
+    interval = CONVERSATION_PARTITION_CONFIG["interval"]
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f"Unknown CONVERSATION_PARTITION_INTERVAL: {interval}")
+    return interval
+
+
+def period_start(at: datetime, interval: Optional[str] = None) -> datetime:
+    """Start of the partition period containing `at`"""
+    interval = interval or _interval()
+    day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "day":
+        return day
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(start: datetime, interval: Optional[str] = None) -> datetime:
+    """Start of the partition period following the one starting at `start`"""
+    interval = interval or _interval()
+    if interval == "day":
+        return start + timedelta(days=1)
+    if interval == "week":
+        return start + timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def partition_name(table: str, start: datetime) -> str:
+    """Name of the partition of `table` whose range starts at `start`"""
+    return f"{table}_p{start:%Y%m%d}"
+
+
+async def is_partitioned(connection: psycopg.AsyncConnection, table: str) -> bool:
+    cursor = await connection.execute(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,)
+    )
+    row = await cursor.fetchone()
+    return bool(row and row[0])
+
+
+async def _database_now(connection: psycopg.AsyncConnection) -> datetime:
+    # created_at defaults to the server's CURRENT_TIMESTAMP, so bounds follow its clock
+    cursor = await connection.execute("SELECT LOCALTIMESTAMP")
+    (now,) = await cursor.fetchone()
+    return now
+
+
+async def ensure_partitions(
+    connection: psycopg.AsyncConnection,
+    table: str,
+    since: Optional[datetime] = None,
+) -> list[str]:
+    """
+    Create any missing partitions of `table` from the period containing `since`
+    (default now) through CONVERSATION_PARTITION_PREMAKE periods ahead.
+    Returns the names of the partitions created.
+    """
+    now = await _database_now(connection)
+    start = period_start(min(since, now) if since else now)
+    end = period_start(now)
+    for _ in range(CONVERSATION_PARTITION_CONFIG["premake"]):
+        end = next_period(end)
+
+    cursor = await connection.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        """,
+        (table,),
+    )
+    existing = {row[0] for row in await cursor.fetchall()}
+
+    created = []
+    while start <= end:
+        upper = next_period(start)
+        name = partition_name(table, start)
+        if name not in existing:
+            await connection.execute(
+                sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} "
+                    "FOR VALUES FROM ({}) TO ({})"
+                ).format(
+                    sql.Identifier(name),
+                    sql.Identifier(table),
+                    sql.Literal(start),
+                    sql.Literal(upper),
+                )
+            )
+            created.append(name)
+        start = upper
+    return created
+
+
+async def convert_to_partitioned(
+    connection: psycopg.AsyncConnection, table: str
+) -> Optional[str]:
+    """
+    Turn an existing plain `table` into a table range-partitioned by created_at.
+    Rows from the current period onwards move into regular partitions; older rows stay
+    in the original heap, attached as a single `{table}_archive` partition that the
+    retention job can drop as a whole. Runs in the caller's transaction.
+    Returns the archive partition name, or None when there was nothing to archive.
+    """
+    archive = f"{table}_archive"
+    await connection.execute(
+        sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+            sql.Identifier(table), sql.Identifier(archive)
+        )
+    )
+    # Free the index names so the parent can use them; attach adopts matching indexes
+    cursor = await connection.execute(
+        """
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary
+        """,
+        (archive,),
+    )
+    for (index_name,) in await cursor.fetchall():
+        await connection.execute(
+            sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                sql.Identifier(index_name),
+                sql.Identifier(index_name.replace(table, archive, 1)),
+            )
+        )
+    await connection.execute(
+        sql.SQL("ALTER TABLE {} RENAME CONSTRAINT {} TO {}").format(
+            sql.Identifier(archive),
+            sql.Identifier(f"{table}_pkey"),
+            sql.Identifier(f"{archive}_pkey"),
+        )
+    )
+
+    # LIKE copies the columns and the id sequence default, so rows keep their ids
+    await connection.execute(
+        sql.SQL(
+            """
+            CREATE TABLE {table} (LIKE {archive} INCLUDING DEFAULTS)
+                PARTITION BY RANGE (created_at);
+            ALTER TABLE {table} ADD PRIMARY KEY (id, created_at);
+            ALTER SEQUENCE {sequence} OWNED BY {table}.id;
+            """
+        ).format(
+            table=sql.Identifier(table),
+            archive=sql.Identifier(archive),
+            sequence=sql.Identifier(f"{table}_id_seq"),
+        )
+    )
+    await ensure_partitions(connection, table)
+
+    cutoff = period_start(await _database_now(connection))
+    await connection.execute(
+        sql.SQL(
+            """
+            WITH moved AS (
+                DELETE FROM {archive} WHERE created_at >= %s RETURNING *
+            )
+            INSERT INTO {table} SELECT * FROM moved
+            """
+        ).format(table=sql.Identifier(table), archive=sql.Identifier(archive)),
+        (cutoff,),
+    )
+
+    cursor = await connection.execute(
+        sql.SQL("SELECT EXISTS (SELECT 1 FROM {})").format(sql.Identifier(archive))
+    )
+    (has_rows,) = await cursor.fetchone()
+    if not has_rows:
+        await connection.execute(
+            sql.SQL("DROP TABLE {}").format(sql.Identifier(archive))
+        )
+        return None
+
+    await connection.execute(
+        sql.SQL(
+            "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (MINVALUE) TO ({})"
+        ).format(sql.Identifier(table), sql.Identifier(archive), sql.Literal(cutoff))
+    )
+    return archive
+
+
+async def expired_partitions(
+    connection: psycopg.AsyncConnection, table: str, retention_days: int
+) -> list[str]:
+    """
+    Partitions of `table` whose whole range is older than retention_days,
+    oldest first. Returns nothing when retention_days is 0 (keep forever).
+    """
+    if retention_days <= 0:
+        return []
+    now = await _database_now(connection)
+    cutoff = now - timedelta(days=retention_days)
+
+    cursor = await connection.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        """,
+        (table,),
+    )
+    expired = []
+    for name, bound in await cursor.fetchall():
+        match = _UPPER_BOUND.search(bound or "")
+        if not match:
+            continue
+        upper = datetime.fromisoformat(match.group(1))
+        if upper <= cutoff:
+            expired.append((upper, name))
+    return [name for _, name in sorted(expired)]
+
+
+async def retire_partition(
+    connection: psycopg.AsyncConnection, table: str, partition: str, action: str
+):
+    """
+    Detach an expired partition without blocking writers, then drop it when
+    action is 'drop'. With 'detach' it is left as a standalone table for archiving.
+    Needs an autocommit connection (DETACH ... CONCURRENTLY cannot run in a transaction).
+    """
+    cursor = await connection.execute(
+        "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(%s)",
+        (partition,),
+    )
+    row = await cursor.fetchone()
+    if row is not None:
+        # A detach interrupted mid-way must be finalized rather than restarted
+        mode = "FINALIZE" if row[0] else "CONCURRENTLY"
+        await connection.execute(
+            sql.SQL("ALTER TABLE {} DETACH PARTITION {} {}").format(
+                sql.Identifier(table), sql.Identifier(partition), sql.SQL(mode)
+            )
+        )
+    if action == "drop":
+        await connection.execute(
+            sql.SQL("DROP TABLE {}").format(sql.Identifier(partition))
+        )
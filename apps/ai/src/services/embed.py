@@ -1,29 +1,255 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import Optional
 from urllib import response
-from utils.constants import MODEL_PORT
-from services.clients import model_embed
+import numpy as np
+from utils.constants import (
+    EMBED_BATCH_CONFIG,
+    EMBED_CACHE_CONFIG,
+    EMBED_COALESCE_CONFIG,
+    EMBED_ENCODING_FORMAT,
+    EMBED_MODEL_ID,
+    MODEL_PORT,
+    VECTOR_STORAGE_CONFIG,
+)
+from services.chunker import count_tokens, fit_to_limit
+from services.clients import embed_pool
+from services.db_index import EMBEDDING_DIM
+from services.embed_batcher import EmbedCoalescer
+from services.embed_cache import (
+    cache_key,
+    cache_stats,
+    get_cached,
+    invalidate_cache,
+    model_signature,
+    put_cached,
+)
+from services.embed_pool import EmbedUnavailable
+from services.metrics import increment, observe
+from services.vector import as_vector, decode_base64, normalize_vector
+
+# Returned in place of a vector when embedding fails
+EMBED_FAILED = np.array([-1], dtype=np.float32)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace runs and trim, so formatting-only differences hash equally"""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def content_hash(text: str) -> str:
+    """
+    SHA-256 hex digest of the normalized text.
+    Must stay in sync with the SQL backfill in services/db.py (_ensure_content_hashes).
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _item_vector(item) -> np.ndarray:
+    embedding = item["embedding"] if isinstance(item, dict) else item.embedding
+    if isinstance(embedding, str):
+        return decode_base64(embedding)
+    # llama.cpp's native endpoint nests the pooled vector one level deeper
+    if embedding and isinstance(embedding[0], list):
+        embedding = embedding[0]
+    return as_vector(embedding)
+
+
+def _response_vectors(response) -> list[np.ndarray]:
+    """Vectors of an embeddings response in input order (OpenAI or llama.cpp shape)"""
+    items = list(getattr(response, "data", None) or response)
+    if all(getattr(item, "index", None) is not None for item in items):
+        items.sort(key=lambda item: item.index)
+    vectors = [_item_vector(item) for item in items]
+    if VECTOR_STORAGE_CONFIG["normalize"]:
+        vectors = [normalize_vector(vector) for vector in vectors]
+    return vectors
+
+
+async def _embed_batch(inputs: list[str]) -> list[np.ndarray]:
+    """One embeddings request for a list of texts; raises on any failure"""
+    started = time.perf_counter()
+    response = await embed_pool.create_embeddings(
+        input=[fit_to_limit(text) for text in inputs],
+        encoding_format=EMBED_ENCODING_FORMAT,
+        model="",
+    )
+    vectors = _response_vectors(response)
+    if len(vectors) != len(inputs):
+        raise ValueError(f"expected {len(inputs)} embeddings, got {len(vectors)}")
+    observe("embed.batch", time.perf_counter() - started)
+    increment("embed.requests")
+    increment("embed.batched_texts", len(inputs))
+    return vectors
+
+
+# Concurrent embed_text calls from different requests share embeddings requests
+_coalescer = (
+    EmbedCoalescer(
+        _embed_batch,
+        window_ms=EMBED_COALESCE_CONFIG["window_ms"],
+        max_batch_size=EMBED_COALESCE_CONFIG["max_batch_size"],
+        max_inflight=EMBED_COALESCE_CONFIG["max_inflight"] * len(embed_pool.backends),
+    )
+    if EMBED_COALESCE_CONFIG["enabled"]
+    else None
+)
+
+
+# Vector space of the configured model; cached vectors from any other one are ignored
+_CACHE_SIGNATURE = model_signature(
+    EMBED_MODEL_ID, EMBEDDING_DIM, VECTOR_STORAGE_CONFIG["normalize"]
+)
+
+
+def _cache_key(text: str) -> str:
+    return cache_key(content_hash(text), _CACHE_SIGNATURE)
+
+
+async def embed_cache_stats() -> dict:
+    return {"enabled": EMBED_CACHE_CONFIG["enabled"], **(await cache_stats())}
+
+
+async def invalidate_embed_cache() -> dict:
+    """Forget every cached vector, e.g. after swapping the model behind EMBED_MODEL_ID"""
+    return await invalidate_cache(_CACHE_SIGNATURE)
 
 
 async def embed_text(text: str) -> dict:
     """
     Generate embedding for the given text using nomic-embed-text with Ollama.
     """
+    key = _cache_key(text) if EMBED_CACHE_CONFIG["enabled"] else None
+    if key is not None:
+        cached = await get_cached([key], _CACHE_SIGNATURE)
+        if key in cached:
+            return {"embedding": cached[key]}
+    # Texts sent to the embed server (per request: services.metrics.track_request)
+    increment("embed.texts")
     try:
-        response = await model_embed.embeddings.create(
-            input=text, encoding_format="float", model=""
-        )
-        vector = response[0].embedding[0]
-        return {"embedding": vector}
+        if _coalescer is not None:
+            vector = await _coalescer.embed(text)
+        else:
+            response = await embed_pool.create_embeddings(
+                input=fit_to_limit(text),
+                encoding_format=EMBED_ENCODING_FORMAT,
+                model="",
+            )
+            increment("embed.requests")
+            vector = _response_vectors(response)[0]
     except Exception as e:
         print(f"Error generating embedding: {e}")
-        return {"embedding": [-1]}
-
-
-def chunk_text(text: str, chunk_size: int = 768, overlap: int = 50):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
-    return chunks
+        return {"embedding": EMBED_FAILED}
+    if key is not None:
+        put_cached({key: vector}, _CACHE_SIGNATURE)
+    return {"embedding": vector}
+
+
+def pack_batches(
+    texts: list[str],
+    max_batch_tokens: Optional[int] = None,
+    max_batch_size: Optional[int] = None,
+) -> list[list[int]]:
+    """
+    Group text positions into consecutive batches that stay under the token and
+    size limits. A text larger than max_batch_tokens gets a batch of its own.
+    """
+    max_tokens = max_batch_tokens or EMBED_BATCH_CONFIG["max_batch_tokens"]
+    max_size = max_batch_size or EMBED_BATCH_CONFIG["max_batch_size"]
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+    for position, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (
+            current_tokens + tokens > max_tokens or len(current) >= max_size
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(position)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def embed_texts(
+    texts: list[str],
+    max_batch_tokens: Optional[int] = None,
+    max_batch_size: Optional[int] = None,
+    use_cache: bool = True,
+) -> list[dict]:
+    """
+    Embed many texts with one request per size-bounded batch instead of one per text.
+    Results keep the input order and have embed_text's shape. If a batch is rejected,
+    its texts are retried one by one so a single bad input only fails itself;
+    failed items get the [-1] sentinel and an "error" message.
+    Batches are sent concurrently and spread over the configured embed servers.
+    Cached texts are served without a request; only the misses are sent.
+    use_cache=False skips the cache both ways (e.g. for one-off backfills).
+    """
+    results: list[dict] = [{"embedding": EMBED_FAILED} for _ in texts]
+    uncached = list(range(len(texts)))
+    keys: list[str] = []
+    if use_cache and EMBED_CACHE_CONFIG["enabled"] and texts:
+        keys = [_cache_key(text) for text in texts]
+        cached = await get_cached(keys, _CACHE_SIGNATURE)
+        uncached = []
+        for position, key in enumerate(keys):
+            if key in cached:
+                results[position] = {"embedding": cached[key]}
+            else:
+                uncached.append(position)
+
+    pending = [texts[position] for position in uncached]
+    increment("embed.texts", len(pending))
+    # Batches run concurrently; the pool spreads them over the embed servers
+    slots = asyncio.Semaphore(embed_pool.capacity())
+
+    async def embed_batch(batch: list[int]):
+        inputs = [texts[position] for position in batch]
+        async with slots:
+            try:
+                vectors = await _embed_batch(inputs)
+            except Exception as e:
+                print(f"Error generating batch embedding ({len(inputs)} texts): {e}")
+                # Retrying texts one by one only helps when an input was rejected
+                if len(inputs) == 1 or isinstance(e, EmbedUnavailable):
+                    for position in batch:
+                        results[position] = {
+                            "embedding": EMBED_FAILED,
+                            "error": str(e),
+                        }
+                    return
+                for position in batch:
+                    try:
+                        vector = (await _embed_batch([texts[position]]))[0]
+                        results[position] = {"embedding": vector}
+                    except Exception as item_error:
+                        results[position] = {
+                            "embedding": EMBED_FAILED,
+                            "error": str(item_error),
+                        }
+                return
+        for position, vector in zip(batch, vectors):
+            results[position] = {"embedding": vector}
+
+    await asyncio.gather(
+        *(
+            embed_batch([uncached[index] for index in batch])
+            for batch in pack_batches(pending, max_batch_tokens, max_batch_size)
+        )
+    )
+
+    if keys:
+        put_cached(
+            {
+                keys[position]: results[position]["embedding"]
+                for position in uncached
+                if "error" not in results[position]
+            },
+            _CACHE_SIGNATURE,
+        )
+    return results
@@ -0,0 +1,115 @@
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable, Optional
+import numpy as np
+from services.embed_pool import EmbedUnavailable
+from services.metrics import SIZE_BUCKETS, histogram, increment
+
+# Sends one embeddings request for a list of texts and returns vectors in order
+BatchSender = Callable[[list[str]], Awaitable[list[np.ndarray]]]
+
+
+class EmbedCoalescer:
+    """
+    Merges concurrent single-text embedding calls into batched requests.
+    Callers await a future; a background task collects pending texts for up to
+    window_ms (or until max_batch_size are waiting), sends them as one request
+    and hands each caller its own vector. At most max_inflight batches are sent
+    at once; while all slots are busy, waiting texts keep accumulating.
+    """
+
+    def __init__(
+        self,
+        send: BatchSender,
+        window_ms: float,
+        max_batch_size: int,
+        max_inflight: int,
+    ):
+        self.send = send
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_inflight = max(1, max_inflight)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _reset(self, loop: asyncio.AbstractEventLoop):
+        # State is bound to one event loop; scripts may call asyncio.run repeatedly
+        self._loop = loop
+        self._pending: list[tuple[str, asyncio.Future, float]] = []
+        self._arrived = asyncio.Event()
+        self._full = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._dispatches: set[asyncio.Task] = set()
+        # Run detached from the first caller's context so request-scoped metrics
+        # (services.metrics.track_request) are not charged for other requests' batches
+        self._worker = contextvars.Context().run(loop.create_task, self._run())
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed one text as part of the next batch"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker.done():
+            self._reset(loop)
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self._arrived.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._arrived.wait()
+            remaining = self.window - (time.perf_counter() - self._pending[0][2])
+            if remaining > 0 and len(self._pending) < self.max_batch_size:
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            await self._slots.acquire()
+
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            self._full.clear()
+            if len(self._pending) >= self.max_batch_size:
+                self._full.set()
+            if not self._pending:
+                self._arrived.clear()
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list[tuple[str, asyncio.Future, float]]):
+        try:
+            sent_at = time.perf_counter()
+            for _, _, queued_at in batch:
+                histogram("embed.coalesce.queue_wait_ms", (sent_at - queued_at) * 1000)
+            histogram("embed.coalesce.batch_size", len(batch), SIZE_BUCKETS)
+            increment("embed.coalesce.batches")
+            try:
+                vectors = await self.send([text for text, _, _ in batch])
+                if len(vectors) != len(batch):
+                    raise ValueError(
+                        f"expected {len(batch)} embeddings, got {len(vectors)}"
+                    )
+                results = list(zip(batch, vectors))
+            except Exception as e:
+                if len(batch) == 1 or isinstance(e, EmbedUnavailable):
+                    results = [(item, e) for item in batch]
+                else:
+                    # One bad input must not fail the other callers' texts
+                    results = []
+                    for item in batch:
+                        try:
+                            results.append((item, (await self.send([item[0]]))[0]))
+                        except Exception as item_error:
+                            results.append((item, item_error))
+            for (_, future, _), result in results:
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._slots.release()
@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+import numpy as np
+from services.logger import get_logger
+from services.metrics import increment
+from services.vector import from_blob, to_blob
+from utils.constants import EMBED_CACHE_CONFIG
+
+# Hot tier: most recently used vectors, bounded by EMBED_CACHE_MEMORY_ENTRIES
+_memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+# Persistent tier: SQLite file that survives restarts, opened on first use. It is
+# only touched from one worker thread, so disk I/O never blocks the event loop and
+# writes are serialized without a lock.
+_disk: Optional[sqlite3.Connection] = None
+_disk_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-cache")
+_disk_writes = 0
+# last_used times of disk hits not yet written, flushed with the next write
+_touched: dict[str, int] = {}
+
+# Check the on-disk size limit every this many writes
+_EVICT_EVERY = 256
+# Flush pending last_used updates once this many have accumulated
+_TOUCH_BATCH = 256
+
+logger = get_logger()
+
+
+def model_signature(model_id: str, dimension: int, normalized: bool) -> str:
+    """Identifies the vector space; entries from another signature are never served"""
+    return f"{model_id}:{dimension}:{'unit' if normalized else 'raw'}"
+
+
+def cache_key(text_hash: str, signature: str) -> str:
+    """Cache key for a normalized-text hash in the given vector space"""
+    return hashlib.sha256(f"{signature}\0{text_hash}".encode("utf-8")).hexdigest()
+
+
+def _open_disk(signature: str) -> Optional[sqlite3.Connection]:
+    global _disk
+
+    if _disk is not None or not EMBED_CACHE_CONFIG["path"]:
+        return _disk
+    directory = os.path.dirname(EMBED_CACHE_CONFIG["path"])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(EMBED_CACHE_CONFIG["path"], check_same_thread=False)
+    connection.executescript(
+        """
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY,
+            vector BLOB NOT NULL,
+            last_used INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS embeddings_last_used_idx ON embeddings (last_used);
+        CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """
+    )
+    row = connection.execute(
+        "SELECT value FROM meta WHERE name = 'signature'"
+    ).fetchone()
+    if row is None or row[0] != signature:
+        # A different model (or dimension / normalization) wrote these vectors
+        connection.execute("DELETE FROM embeddings")
+        connection.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('signature', ?)",
+            (signature,),
+        )
+        connection.commit()
+    _disk = connection
+    return _disk
+
+
+async def _on_disk_thread(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(
+        _disk_thread, function, *args
+    )
+
+
+def _flush_touched(disk: sqlite3.Connection):
+    """Write pending last_used updates; the caller commits"""
+    if _touched:
+        disk.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(used, key) for key, used in _touched.items()],
+        )
+        _touched.clear()
+
+
+def _read_disk(keys: list[str], signature: str) -> list[tuple[str, bytes]]:
+    disk = _open_disk(signature)
+    if disk is None:
+        return []
+    placeholders = ",".join("?" * len(keys))
+    rows = disk.execute(
+        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+        keys,
+    ).fetchall()
+    now = int(time.time())
+    for key, _ in rows:
+        _touched[key] = now
+    if len(_touched) >= _TOUCH_BATCH:
+        _flush_touched(disk)
+        disk.commit()
+    return rows
+
+
+def _remember(key: str, vector: np.ndarray):
+    _memory[key] = vector
+    _memory.move_to_end(key)
+    while len(_memory) > EMBED_CACHE_CONFIG["memory_entries"]:
+        _memory.popitem(last=False)
+
+
+async def get_cached(keys: list[str], signature: str) -> dict[str, np.ndarray]:
+    """
+    Cached vectors for the given keys, memory tier first, then disk (read on the
+    cache's worker thread). Disk hits refresh their last_used in batches.
+    """
+    found = {}
+    missing = []
+    for key in keys:
+        vector = _memory.get(key)
+        if vector is not None:
+            _memory.move_to_end(key)
+            found[key] = vector
+        else:
+            missing.append(key)
+    increment("embed_cache.memory_hits", len(found))
+
+    if missing and EMBED_CACHE_CONFIG["path"]:
+        rows = await _on_disk_thread(_read_disk, missing, signature)
+        for key, blob in rows:
+            vector = from_blob(blob)
+            _remember(key, vector)
+            found[key] = vector
+        increment("embed_cache.disk_hits", len(rows))
+
+    increment("embed_cache.misses", len(keys) - len(found))
+    return found
+
+
+def _write_disk(rows: list[tuple[str, bytes, int]], signature: str):
+    global _disk_writes
+
+    disk = _open_disk(signature)
+    if disk is None:
+        return
+    disk.executemany(
+        "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+        rows,
+    )
+    _flush_touched(disk)
+    _disk_writes += len(rows)
+    if _disk_writes >= _EVICT_EVERY:
+        _disk_writes = 0
+        evicted = disk.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used DESC
+                LIMIT -1 OFFSET ?
+            )
+            """,
+            (EMBED_CACHE_CONFIG["disk_entries"],),
+        ).rowcount
+        increment("embed_cache.evictions", evicted)
+    disk.commit()
+
+
+def _log_write_error(future: Future):
+    error = future.exception()
+    if error is not None:
+        logger.log_and_print(f"⚠️ Embedding cache write failed: {error}")
+
+
+def put_cached(entries: dict[str, np.ndarray], signature: str):
+    """
+    Store vectors in both tiers, evicting the least recently used beyond the limits.
+    The disk write is queued on the cache's worker thread; the caller does not wait.
+    """
+    for key, vector in entries.items():
+        _remember(key, vector)
+    if not entries or not EMBED_CACHE_CONFIG["path"]:
+        return
+    now = int(time.time())
+    rows = [(key, to_blob(vector), now) for key, vector in entries.items()]
+    _disk_thread.submit(_write_disk, rows, signature).add_done_callback(
+        _log_write_error
+    )
+
+
+def _clear_disk(signature: str) -> int:
+    disk = _open_disk(signature)
+    if disk is None:
+        return 0
+    _touched.clear()
+    deleted = disk.execute("DELETE FROM embeddings").rowcount
+    disk.commit()
+    return deleted
+
+
+async def invalidate_cache(signature: str) -> dict:
+    """Drop every cached vector from both tiers (e.g. after retraining the embed model)"""
+    memory_entries = len(_memory)
+    _memory.clear()
+    disk_entries = await _on_disk_thread(_clear_disk, signature)
+    return {"memory_entries": memory_entries, "disk_entries": disk_entries}
+
+
+def _count_disk() -> Optional[int]:
+    if _disk is None:
+        return None
+    return _disk.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+
+
+async def cache_stats() -> dict:
+    """Entry counts of both tiers and the configured limits"""
+    disk_entries = await _on_disk_thread(_count_disk)
+    return {
+        "memory_entries": len(_memory),
+        "memory_limit": EMBED_CACHE_CONFIG["memory_entries"],
+        "disk_entries": disk_entries,
+        "disk_limit": EMBED_CACHE_CONFIG["disk_entries"],
+        "path": EMBED_CACHE_CONFIG["path"] or None,
+    }
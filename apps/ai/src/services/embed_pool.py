@@ -0,0 +1,265 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Optional
+import openai
+from openai import AsyncOpenAI
+from services.logger import get_logger
+from services.metrics import increment
+
+logger = get_logger()
+
+# Successful request latencies kept for the hedge threshold, and how many are needed
+_LATENCY_WINDOW = 256
+_MIN_LATENCY_SAMPLES = 32
+
+
+class EmbedUnavailable(Exception):
+    """No embed server can answer now: all are ejected or the deadline passed"""
+
+
+class EmbedBackend:
+    """One embed server with its load and health bookkeeping"""
+
+    def __init__(self, url: str, max_retries: int, timeout: float):
+        self.url = url
+        self.client = AsyncOpenAI(
+            base_url=url, api_key="no-key", max_retries=max_retries, timeout=timeout
+        )
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        # Consecutive failures; reset by the first success
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def status(self) -> dict:
+        remaining = self.ejected_until - time.monotonic()
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+            "ejected_for_seconds": round(remaining, 1) if remaining > 0 else 0,
+        }
+
+
+def _backend_fault(error: Exception) -> bool:
+    # 4xx means the input itself was rejected: another server would reject it too
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+
+class _Call:
+    """Backends tried by one create_embeddings call, and those it is still awaiting"""
+
+    def __init__(self):
+        self.tried: list[EmbedBackend] = []
+        self.waiting: set[EmbedBackend] = set()
+
+
+class EmbedPool:
+    """
+    Spreads embeddings requests over several embed servers. Each request goes to
+    the available backend with the fewest outstanding requests. A backend that fails
+    eject_after times in a row is skipped for eject_seconds (doubling, up to 8x,
+    while it keeps failing once readmitted) and the request is retried on another
+    backend. A readmitted backend takes one request at a time until one succeeds.
+
+    Every call must finish within deadline_seconds. Once it outlasts the
+    hedge_percentile latency of recent requests, a duplicate goes to another backend
+    (or another slot of the same one) and the first answer wins; a backend that
+    loses to its hedge counts as failing, as does one past the deadline. While
+    every backend is ejected, calls fail at once with EmbedUnavailable instead of
+    waiting.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        inflight_per_backend: int,
+        eject_after: int,
+        eject_seconds: float,
+        deadline_seconds: float,
+        hedge_percentile: float,
+        hedge_min_seconds: float,
+    ):
+        # With a single server keep the client's own retries; otherwise fail over
+        max_retries = 2 if len(urls) == 1 else 0
+        self.backends = [
+            EmbedBackend(url, max_retries, deadline_seconds) for url in urls
+        ]
+        self.inflight_per_backend = max(1, inflight_per_backend)
+        self.eject_after = max(1, eject_after)
+        self.eject_seconds = eject_seconds
+        self.deadline_seconds = deadline_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self._ties = itertools.count()
+
+    def _available(self, backend: EmbedBackend, now: float) -> bool:
+        if now < backend.ejected_until:
+            return False
+        # Readmitted after ejection: one probe request at a time
+        return backend.failures < self.eject_after or backend.outstanding == 0
+
+    def _pick(
+        self, tried: list[EmbedBackend], repeat: bool = False
+    ) -> Optional[EmbedBackend]:
+        """Least loaded available backend not in tried (or any available, if repeat)"""
+        now = time.monotonic()
+        available = [
+            backend for backend in self.backends if self._available(backend, now)
+        ]
+        candidates = [backend for backend in available if backend not in tried]
+        if not candidates and repeat:
+            candidates = available
+        if not candidates:
+            return None
+        fewest = min(backend.outstanding for backend in candidates)
+        tied = [backend for backend in candidates if backend.outstanding == fewest]
+        return tied[next(self._ties) % len(tied)]
+
+    def capacity(self) -> int:
+        """Requests worth having in flight at once across the available backends"""
+        now = time.monotonic()
+        available = sum(self._available(backend, now) for backend in self.backends)
+        return max(1, available) * self.inflight_per_backend
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a call is hedged, or None until enough samples exist"""
+        if not self.hedge_percentile or len(self._latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return max(ordered[index], self.hedge_min_seconds)
+
+    def record_failure(self, backend: EmbedBackend, error: Exception):
+        """Count a failure; eject the backend after eject_after in a row"""
+        backend.errors += 1
+        backend.failures += 1
+        increment("embed.backend_errors")
+        if backend.failures < self.eject_after:
+            return
+        # Requests already in flight when it was ejected do not extend the cooldown
+        if time.monotonic() >= backend.ejected_until:
+            self.eject(backend, error)
+
+    def eject(self, backend: EmbedBackend, error: Exception):
+        """
+        Skip a backend until its cooldown ends. Its failure count is kept, so the
+        first failure after readmission ejects it again for twice as long.
+        """
+        backend.failures = max(backend.failures, self.eject_after)
+        cooldown = self.eject_seconds * min(2**backend.ejections, 8)
+        backend.ejections += 1
+        backend.ejected_until = time.monotonic() + cooldown
+        increment("embed.backend_ejections")
+        logger.log_and_print(
+            f"⚠️ Embed backend {backend.url} ejected for {cooldown:.0f}s: {error}"
+        )
+
+    def record_success(self, backend: EmbedBackend):
+        if backend.ejections:
+            logger.log_and_print(f"✅ Embed backend {backend.url} recovered")
+        backend.failures = 0
+        backend.ejections = 0
+
+    async def _attempt(self, kwargs: dict, call: _Call, hedge: bool = False):
+        """One backend after another until one answers or none is left to try"""
+        last_error: Optional[Exception] = None
+        while True:
+            backend = self._pick(call.tried, repeat=hedge)
+            if backend is None:
+                raise last_error or EmbedUnavailable("every embed backend is ejected")
+            call.tried.append(backend)
+            call.waiting.add(backend)
+            backend.outstanding += 1
+            backend.requests += 1
+            started = time.perf_counter()
+            try:
+                response = await backend.client.embeddings.create(**kwargs)
+            except asyncio.CancelledError:
+                # Lost a hedge race or hit the deadline; the caller decides which
+                raise
+            except Exception as e:
+                call.waiting.discard(backend)
+                if not _backend_fault(e):
+                    raise
+                self.record_failure(backend, e)
+                last_error = e
+                continue
+            finally:
+                backend.outstanding -= 1
+            call.waiting.discard(backend)
+            self._latencies.append(time.perf_counter() - started)
+            self.record_success(backend)
+            return response
+
+    def _record_lost_race(self, call: _Call, delay: float):
+        """
+        Count backends still working on a call their hedge already answered as
+        failing, so one that hangs without erroring is ejected rather than hedged
+        around forever. Any success in between resets the count.
+        """
+        error = TimeoutError(f"outlasted by a hedge sent after {delay:.2f}s")
+        for backend in call.waiting:
+            self.record_failure(backend, error)
+
+    async def _hedged(self, kwargs: dict, call: _Call):
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._attempt(kwargs, call))
+        if delay is None:
+            return await primary
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                increment("embed.hedges")
+                hedge = self._attempt(kwargs, call, hedge=True)
+                tasks.add(asyncio.ensure_future(hedge))
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            increment("embed.hedge_wins")
+                            self._record_lost_race(call, delay)
+                        return task.result()
+                    error = task.exception()
+                # The other attempt may still answer
+                if not tasks:
+                    raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def create_embeddings(self, **kwargs):
+        """embeddings.create through the pool: balanced, hedged and deadline-bounded"""
+        call = _Call()
+        try:
+            return await asyncio.wait_for(
+                self._hedged(kwargs, call), self.deadline_seconds
+            )
+        except asyncio.TimeoutError:
+            increment("embed.deadline_exceeded")
+            error = EmbedUnavailable(
+                f"no embeddings within {self.deadline_seconds:g}s"
+            )
+            # A backend that stalls past the deadline counts as failing
+            for backend in call.waiting:
+                self.record_failure(backend, error)
+            raise error from None
+
+    def status(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {**backend.status(), "available": self._available(backend, now)}
+            for backend in self.backends
+        ]
@@ -0,0 +1,444 @@
+import asyncio
+import math
+import sys
+import time
+from typing import Optional
+import numpy as np
+from services.logger import get_logger
+from services.metrics import increment, observe
+from services.vector import DTYPE, as_vector
+from utils.constants import HOT_INDEX_CONFIG
+
+logger = get_logger()
+
+# k-means iterations, and sampled rows per centroid used to train them
+_KMEANS_ITERATIONS = 10
+_SAMPLE_PER_LIST = 64
+# Rows scored per matrix product when assigning rows to lists
+_ASSIGN_CHUNK = 8192
+# A full matrix grows by this fraction (at least _MIN_GROWTH_ROWS rows), within budget
+_GROWTH = 0.25
+_MIN_GROWTH_ROWS = 256
+
+# Published index; replaced whole by a load, mutated in place only by inserts
+_index: Optional["HotIndex"] = None
+# Rows inserted while a load reads Postgres, replayed once it is swapped in
+_pending: Optional[list[tuple[int, str, np.ndarray]]] = None
+# In-memory retraining after growth, kept referenced so it is not garbage collected
+_retrain_task: Optional[asyncio.Task] = None
+_state = "disabled" if not HOT_INDEX_CONFIG["enabled"] else "empty"
+_last_load: Optional[dict] = None
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows (or a single vector) to unit length so inner product is cosine"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(DTYPE, copy=False)
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid of every row, scored a chunk at a time to bound memory"""
+    assignment = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), _ASSIGN_CHUNK):
+        scores = matrix[start : start + _ASSIGN_CHUNK] @ centroids.T
+        assignment[start : start + _ASSIGN_CHUNK] = np.argmax(scores, axis=1)
+    return assignment
+
+
+def train_lists(
+    matrix: np.ndarray, capacity: int, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Spherical k-means over a sample of the (unit) rows: about sqrt(rows) centroids.
+    Returns (centroids, bounds, order, grouped): grouped holds matrix[order] (rows
+    sorted by nearest centroid, list i at bounds[i]:bounds[i + 1]) in a new matrix
+    with room for `capacity` rows. CPU-bound; run it off the event loop on rows
+    nobody writes to.
+    """
+    rng = np.random.default_rng(seed)
+    lists = max(1, round(math.sqrt(len(matrix))))
+    sample_size = min(len(matrix), lists * _SAMPLE_PER_LIST)
+    sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        # A centroid that lost all its rows keeps its place
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _unit(sums)
+    assignment = _assign(matrix, centroids)
+    order = np.argsort(assignment, kind="stable")
+    bounds = np.searchsorted(assignment[order], np.arange(lists + 1))
+    grouped = np.empty((max(capacity, len(matrix)), matrix.shape[1]), dtype=DTYPE)
+    np.take(matrix, order, axis=0, out=grouped[: len(matrix)])
+    return centroids, bounds, order, grouped
+
+
+class HotIndex:
+    """
+    Knowledge vectors in one contiguous float32 matrix of unit rows, searched by
+    inner product. Untrained, every row is scored, which is exact. Once trained,
+    k-means centroids split the rows into inverted lists stored as contiguous runs
+    of the matrix, and a query scores only its `probes` nearest lists; rows added
+    after training sit at the end and are tracked per list until the next training.
+    With max_bytes set, add() refuses rows once memory_bytes() would exceed it and
+    never reserves more matrix rows than the budget could hold.
+    Mutated only from the event loop.
+    """
+
+    def __init__(
+        self, dim: int, capacity: int = 1024, max_bytes: Optional[int] = None
+    ):
+        self.dim = dim
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.messages: list[str] = []
+        self._matrix = np.empty((max(1, capacity), dim), dtype=DTYPE)
+        self._ids = np.empty(max(1, capacity), dtype=np.int64)
+        self._message_bytes = 0
+        self.centroids: Optional[np.ndarray] = None
+        self._bounds: Optional[np.ndarray] = None
+        self._tails: list[np.ndarray] = []
+        self.trained_rows = 0
+
+    def row_bytes(self, message: str = "") -> int:
+        """Memory one more row takes: vector, id, list entry, message and its slot"""
+        vector_bytes = self.dim * self._matrix.itemsize + self._ids.itemsize
+        return vector_bytes + 4 + sys.getsizeof(message) + 8
+
+    def _grow(self) -> bool:
+        """Enlarge the full matrix in proportion; False if the budget allows no more"""
+        capacity = len(self._matrix)
+        target = capacity + max(_MIN_GROWTH_ROWS, int(capacity * _GROWTH))
+        if self.max_bytes is not None:
+            per_row = self.dim * self._matrix.itemsize + self._ids.itemsize
+            target = min(target, self.max_bytes // per_row)
+        if target <= capacity:
+            return False
+        # Proportional growth keeps appends amortized O(1) and the matrix contiguous
+        self._matrix = np.resize(self._matrix, (target, self.dim))
+        self._ids = np.resize(self._ids, target)
+        return True
+
+    def add(self, row_id: int, message: str, vector) -> bool:
+        """Append a row; False (nothing added) when it would exceed max_bytes"""
+        if (
+            self.max_bytes is not None
+            and self.memory_bytes() + self.row_bytes(message) > self.max_bytes
+        ):
+            return False
+        if self.size == len(self._matrix) and not self._grow():
+            return False
+        self._matrix[self.size] = _unit(as_vector(vector))
+        self._ids[self.size] = row_id
+        self.messages.append(message)
+        self._message_bytes += sys.getsizeof(message)
+        if self.centroids is not None:
+            self._add_to_tail(self.size)
+        self.size += 1
+        return True
+
+    def _add_to_tail(self, position: int):
+        nearest = int(np.argmax(self.centroids @ self._matrix[position]))
+        self._tails[nearest] = np.append(self._tails[nearest], np.int32(position))
+
+    @property
+    def list_count(self) -> int:
+        return 0 if self._bounds is None else len(self._bounds) - 1
+
+    def rows(self) -> np.ndarray:
+        """View of the filled part of the matrix"""
+        return self._matrix[: self.size]
+
+    def ids(self) -> np.ndarray:
+        return self._ids[: self.size]
+
+    def install(
+        self,
+        centroids: np.ndarray,
+        bounds: np.ndarray,
+        order: np.ndarray,
+        grouped: np.ndarray,
+    ):
+        """
+        Switch to lists from train_lists over the first len(order) rows. Rows added
+        since are copied after them and assigned to their nearest list.
+        """
+        trained = len(order)
+        if len(grouped) < self.size:
+            grouped = np.resize(grouped, (len(self._matrix), self.dim))
+        grouped[trained : self.size] = self._matrix[trained : self.size]
+        ids = np.empty(len(grouped), dtype=np.int64)
+        ids[:trained] = self._ids[order]
+        ids[trained : self.size] = self._ids[trained : self.size]
+        self.messages = [self.messages[i] for i in order] + self.messages[trained:]
+        self._matrix = grouped
+        self._ids = ids
+        self.centroids = centroids
+        self._bounds = bounds
+        self._tails = [np.empty(0, dtype=np.int32) for _ in range(len(bounds) - 1)]
+        self.trained_rows = trained
+        for position in range(trained, self.size):
+            self._add_to_tail(position)
+
+    def _probe(self, query: np.ndarray, probes: int) -> tuple[np.ndarray, np.ndarray]:
+        """Scores and positions of the rows in the lists nearest to the query"""
+        centroid_scores = self.centroids @ query
+        if probes < len(centroid_scores):
+            nearest = np.argpartition(-centroid_scores, probes - 1)[:probes]
+        else:
+            nearest = range(len(centroid_scores))
+        scores = []
+        positions = []
+        for i in nearest:
+            start, end = self._bounds[i], self._bounds[i + 1]
+            if end > start:
+                scores.append(self._matrix[start:end] @ query)
+                positions.append(np.arange(start, end))
+            tail = self._tails[i]
+            if len(tail):
+                scores.append(self._matrix[tail] @ query)
+                positions.append(tail)
+        if not scores:
+            return np.empty(0, dtype=DTYPE), np.empty(0, dtype=np.int64)
+        return np.concatenate(scores), np.concatenate(positions)
+
+    def search(self, query, limit: int, probes: int) -> list[dict]:
+        """Top `limit` rows as {"message", "similarity"} (cosine distance)"""
+        return self.search_many([query], limit, probes)
+
+    def search_many(
+        self, queries: list, limit: int, probes: int, with_vectors: bool = False
+    ) -> list[dict]:
+        """
+        Fused top `limit` rows over several queries: a row matched by more than one
+        keeps its best similarity and appears once. with_vectors adds each row's
+        (unit length) vector as "embedding".
+        """
+        if self.size == 0 or limit <= 0 or not queries:
+            return []
+        matrix = _unit(np.stack([as_vector(query) for query in queries]))
+        if matrix.shape[1] != self.dim:
+            return []
+        if self.centroids is None or probes <= 0:
+            # One matrix product scores every row against every query
+            scores = (self.rows() @ matrix.T).max(axis=1)
+            positions = None
+        else:
+            probed = [self._probe(query, probes) for query in matrix]
+            scores = np.concatenate([part[0] for part in probed])
+            positions = np.concatenate([part[1] for part in probed])
+            if len(queries) > 1:
+                # Best score first within each row, then keep that first entry
+                order = np.lexsort((-scores, positions))
+                scores, positions = scores[order], positions[order]
+                first = np.ones(len(positions), dtype=bool)
+                first[1:] = positions[1:] != positions[:-1]
+                scores, positions = scores[first], positions[first]
+        k = min(limit, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = top if positions is None else positions[top]
+        hits = [
+            {"message": self.messages[row], "similarity": float(1.0 - scores[i])}
+            for row, i in zip(rows, top)
+        ]
+        if with_vectors:
+            for hit, row in zip(hits, rows):
+                # A copy: the matrix is reordered in place on retraining
+                hit["embedding"] = self._matrix[row].copy()
+        return hits
+
+    def memory_bytes(self) -> int:
+        """
+        Filled rows (vectors, ids), lists and message strings held by the index;
+        spare matrix capacity is not counted (see reserved_bytes)
+        """
+        per_row = self.dim * self._matrix.itemsize + self._ids.itemsize
+        total = self.size * per_row + self._message_bytes
+        total += sys.getsizeof(self.messages)
+        if self.centroids is not None:
+            total += self.centroids.nbytes + self._bounds.nbytes
+            total += sum(tail.nbytes for tail in self._tails)
+        return total
+
+    def reserved_bytes(self) -> int:
+        """Matrix and id capacity allocated, filled or not"""
+        return self._matrix.nbytes + self._ids.nbytes
+
+
+def _budget_bytes() -> int:
+    return int(HOT_INDEX_CONFIG["max_memory_mb"] * 1024 * 1024)
+
+
+def estimate_bytes(rows: int, dim: int, text_bytes: int) -> int:
+    """Footprint of an index of `rows` vectors and their texts, before loading it"""
+    # Vector, id, list entry and str object overhead per row
+    per_row = dim * np.dtype(DTYPE).itemsize + 8 + 4 + sys.getsizeof("")
+    return rows * per_row + text_bytes
+
+
+def hot_index_enabled() -> bool:
+    return HOT_INDEX_CONFIG["enabled"]
+
+
+def begin_hot_index_load():
+    """Start capturing inserts so rows written during the load are not lost"""
+    global _pending, _state
+
+    _pending = []
+    if _index is None:
+        _state = "loading"
+
+
+def abort_hot_index_load(reason: str):
+    global _pending, _state
+
+    _pending = None
+    if _index is None:
+        _state = reason
+
+
+async def finish_hot_index_load(index: HotIndex, seconds_reading: float):
+    """Train the freshly read index if it is large enough, then publish it"""
+    global _index, _pending, _state, _last_load
+
+    started = time.perf_counter()
+    if index.size >= HOT_INDEX_CONFIG["ivf_min_rows"]:
+        trained = await asyncio.to_thread(train_lists, index.rows(), index.size)
+        index.install(*trained)
+    loaded = set(index.ids().tolist())
+    replayed = 0
+    for row_id, message, vector in _pending or []:
+        if row_id not in loaded:
+            index.add(row_id, message, vector)
+            replayed += 1
+    _pending = None
+    if index.memory_bytes() > _budget_bytes():
+        _over_budget(index.memory_bytes())
+        return
+    index.max_bytes = _budget_bytes()
+    _index = index
+    _state = "ready"
+    _last_load = {
+        "rows": index.size,
+        "lists": index.list_count,
+        "replayed_inserts": replayed,
+        "read_seconds": round(seconds_reading, 3),
+        "train_seconds": round(time.perf_counter() - started, 3),
+        "finished_at": time.time(),
+    }
+    observe("hot_index.load", seconds_reading + time.perf_counter() - started)
+    logger.log_and_print(
+        f"🔥 Hot index ready: {index.size} knowledge vectors, "
+        f"{index.list_count or 'no'} IVF lists, "
+        f"{index.memory_bytes() / 1024 / 1024:.1f} MB."
+    )
+
+
+def _over_budget(needed: int):
+    global _index, _state
+
+    _index = None
+    _state = "over_budget"
+    logger.log_and_print(
+        f"⚠️ Hot index needs {needed / 1024 / 1024:.0f} MB, over "
+        f"HOT_INDEX_MAX_MEMORY_MB={HOT_INDEX_CONFIG['max_memory_mb']}; "
+        "knowledge search stays in Postgres."
+    )
+
+
+def fits_budget(rows: int, dim: int, text_bytes: int) -> bool:
+    """False (and the hot tier is off) when the knowledge set would exceed the budget"""
+    needed = estimate_bytes(rows, dim, text_bytes)
+    if needed > _budget_bytes():
+        _over_budget(needed)
+        return False
+    return True
+
+
+async def _retrain(index: HotIndex):
+    # Rows appended meanwhile land past this view, which therefore never changes
+    trained = await asyncio.to_thread(
+        train_lists, index.rows(), len(index._matrix)
+    )
+    if index is _index:
+        index.install(*trained)
+        increment("hot_index.retrains")
+
+
+def add_to_hot_index(rows: list[tuple[int, str, np.ndarray]]) -> bool:
+    """
+    Mirror committed knowledge inserts as (id, message, vector) rows. Returns False
+    when the index ran out of budget: it stops serving (search goes to Postgres)
+    and the caller should reload it, which re-checks the whole set against the
+    budget.
+    """
+    global _index, _retrain_task, _state
+
+    if not rows or not HOT_INDEX_CONFIG["enabled"]:
+        return True
+    if _pending is not None:
+        _pending.extend(rows)
+    if _index is None:
+        return True
+    for row_id, message, vector in rows:
+        if not _index.add(row_id, message, vector):
+            # Serving without the row would silently miss new knowledge
+            _index = None
+            _state = "reloading"
+            increment("hot_index.out_of_budget")
+            logger.log_and_print(
+                "⚠️ Hot index is full at "
+                f"HOT_INDEX_MAX_MEMORY_MB={HOT_INDEX_CONFIG['max_memory_mb']}; "
+                "reloading it."
+            )
+            return False
+    grown = _index.size >= max(
+        HOT_INDEX_CONFIG["ivf_min_rows"],
+        _index.trained_rows * HOT_INDEX_CONFIG["retrain_growth"],
+    )
+    if grown and (_retrain_task is None or _retrain_task.done()):
+        _retrain_task = asyncio.create_task(_retrain(_index))
+    return True
+
+
+def search_hot_index(
+    queries: list, limit: int, with_vectors: bool = False
+) -> Optional[list[dict]]:
+    """Fused knowledge hits for one or more query vectors, or None when not serving"""
+    if _index is None:
+        return None
+    started = time.perf_counter()
+    hits = _index.search_many(
+        queries, limit, HOT_INDEX_CONFIG["probes"], with_vectors=with_vectors
+    )
+    observe("hot_index.search", time.perf_counter() - started)
+    return hits
+
+
+def hot_index_status() -> dict:
+    status = {
+        "enabled": HOT_INDEX_CONFIG["enabled"],
+        "state": _state,
+        "loading": _pending is not None,
+        "max_memory_mb": HOT_INDEX_CONFIG["max_memory_mb"],
+        "last_load": _last_load,
+    }
+    if _index is not None:
+        status.update(
+            {
+                "rows": _index.size,
+                "lists": _index.list_count,
+                "trained_rows": _index.trained_rows,
+                "probes": HOT_INDEX_CONFIG["probes"],
+                "memory_mb": round(_index.memory_bytes() / 1024 / 1024, 2),
+                "reserved_mb": round(_index.reserved_bytes() / 1024 / 1024, 2),
+            }
+        )
+    return status
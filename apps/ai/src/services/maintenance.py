@@ -0,0 +1,408 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+import psycopg
+from psycopg import sql
+from services.db import (
+    CONVERSATION_TABLE,
+    KNOWLEDGE_TABLE,
+    get_db_connection,
+    open_maintenance_connection,
+    run_partition_maintenance,
+)
+from services.db_index import get_vector_index_status, vector_index_name
+from services.logger import get_logger
+from services.metrics import increment, observe
+from utils.constants import (
+    CONVERSATION_PARTITION_CONFIG,
+    MAINTENANCE_CONFIG,
+    VECTOR_INDEX_CONFIG,
+)
+
+MAINTAINED_TABLES = (KNOWLEDGE_TABLE, CONVERSATION_TABLE)
+
+# Background scheduler, kept referenced so it is not garbage collected
+_scheduler_task: Optional[asyncio.Task] = None
+# Serializes scheduled runs with runs triggered from the admin endpoint
+_run_lock = asyncio.Lock()
+# Set once enough rows were ingested, so they are analyzed before the next tick
+_wake = asyncio.Event()
+_pending_ingest_rows = 0
+_last_partition_run: Optional[float] = None
+_last_summary: Optional[dict] = None
+_log_table_ready = False
+
+logger = get_logger()
+
+
+def quiet_hours() -> Optional[tuple[int, int]]:
+    """
+    MAINTENANCE_QUIET_HOURS as (start, end) local hours, or None when unset.
+    Raises ValueError for anything but "start-end" with hours from 0 to 24.
+    """
+    window = MAINTENANCE_CONFIG["quiet_hours"]
+    if not window:
+        return None
+    try:
+        start, end = (int(hour) for hour in window.split("-"))
+    except ValueError:
+        raise ValueError(
+            f"Invalid MAINTENANCE_QUIET_HOURS: {window!r} (expected e.g. 1-5)"
+        ) from None
+    if not (0 <= start <= 24 and 0 <= end <= 24):
+        raise ValueError(f"Invalid MAINTENANCE_QUIET_HOURS: {window!r} (hours 0-24)")
+    return start, end
+
+
+def in_quiet_hours(now: Optional[datetime] = None) -> bool:
+    """
+    True inside MAINTENANCE_QUIET_HOURS ("start-end" local hours, may wrap midnight).
+    With no window configured every hour counts as quiet.
+    """
+    window = quiet_hours()
+    if window is None:
+        return True
+    start, end = window
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def notify_ingest(rows: int):
+    """Count rows written by a bulk load; wakes the scheduler once enough have landed"""
+    global _pending_ingest_rows
+
+    _pending_ingest_rows += rows
+    if _pending_ingest_rows >= MAINTENANCE_CONFIG["analyze_min_changes"]:
+        _wake.set()
+
+
+async def _ensure_log_table(connection: psycopg.AsyncConnection):
+    global _log_table_ready
+
+    if _log_table_ready:
+        return
+    await connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS db_maintenance_log (
+            task TEXT NOT NULL,
+            target TEXT NOT NULL,
+            finished_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            seconds DOUBLE PRECISION,
+            rows BIGINT,
+            PRIMARY KEY (task, target)
+        )
+        """
+    )
+    _log_table_ready = True
+
+
+async def _record(
+    connection: psycopg.AsyncConnection,
+    task: str,
+    target: str,
+    seconds: Optional[float],
+    rows: Optional[int],
+):
+    """Store the latest run of a task on a target (one row per task/target)"""
+    await connection.execute(
+        """
+        INSERT INTO db_maintenance_log (task, target, finished_at, seconds, rows)
+        VALUES (%s, %s, now(), %s, %s)
+        ON CONFLICT (task, target) DO UPDATE
+        SET finished_at = EXCLUDED.finished_at,
+            seconds = EXCLUDED.seconds,
+            rows = EXCLUDED.rows
+        """,
+        (task, target, seconds, rows),
+    )
+
+
+async def record_maintenance(
+    task: str, target: str, seconds: Optional[float], rows: Optional[int]
+):
+    """Log maintenance done elsewhere (e.g. an index built by a bulk load)"""
+    async with get_db_connection() as connection:
+        await _ensure_log_table(connection)
+        await _record(connection, task, target, seconds, rows)
+
+
+async def table_stats(connection: psycopg.AsyncConnection, table: str) -> dict:
+    """
+    Row, dead tuple and size statistics for a table, summed over its partitions,
+    with the most recent (auto)vacuum and (auto)analyze times.
+    """
+    cursor = await connection.execute(
+        """
+        SELECT count(*) FILTER (WHERE t.isleaf),
+               COALESCE(sum(s.n_live_tup), 0),
+               COALESCE(sum(s.n_dead_tup), 0),
+               COALESCE(sum(s.n_mod_since_analyze), 0),
+               COALESCE(sum(pg_total_relation_size(t.relid)), 0),
+               max(GREATEST(s.last_vacuum, s.last_autovacuum)),
+               max(GREATEST(s.last_analyze, s.last_autoanalyze))
+        FROM pg_partition_tree(to_regclass(%s)) t
+        LEFT JOIN pg_stat_user_tables s ON s.relid = t.relid
+        """,
+        (table,),
+    )
+    leaves, live, dead, modified, size, vacuumed, analyzed = await cursor.fetchone()
+    return {
+        "partitions": leaves,
+        "live_rows": live,
+        "dead_rows": dead,
+        "dead_ratio": round(dead / (live + dead), 4) if live + dead else 0.0,
+        "modified_since_analyze": modified,
+        "total_bytes": size,
+        "last_vacuum": vacuumed,
+        "last_analyze": analyzed,
+    }
+
+
+async def index_stats(connection: psycopg.AsyncConnection, table: str) -> list[dict]:
+    """Size, scan count and validity of each index on a table (summed over partitions)"""
+    cursor = await connection.execute(
+        """
+        SELECT c.relname, i.indisvalid,
+               (SELECT COALESCE(sum(pg_relation_size(p.relid)), 0)
+                FROM pg_partition_tree(i.indexrelid) p),
+               (SELECT COALESCE(sum(s.idx_scan), 0)
+                FROM pg_partition_tree(i.indexrelid) p
+                JOIN pg_stat_user_indexes s ON s.indexrelid = p.relid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s)
+        ORDER BY c.relname
+        """,
+        (table,),
+    )
+    return [
+        {"name": name, "valid": valid, "bytes": size, "scans": scans}
+        for name, valid, size, scans in await cursor.fetchall()
+    ]
+
+
+async def _analyze_tables(force: bool) -> list[str]:
+    """ANALYZE tables with enough changed rows since their last analyze"""
+    global _pending_ingest_rows
+
+    threshold = MAINTENANCE_CONFIG["analyze_min_changes"]
+    due = []
+    async with get_db_connection() as connection:
+        for table in MAINTAINED_TABLES:
+            stats = await table_stats(connection, table)
+            if force or stats["modified_since_analyze"] >= threshold:
+                due.append((table, stats["live_rows"]))
+    _pending_ingest_rows = 0
+    if not due:
+        return []
+
+    connection = await open_maintenance_connection()
+    try:
+        for table, rows in due:
+            started = time.perf_counter()
+            # Autovacuum never analyzes partitioned parents; this covers their partitions
+            await connection.execute(
+                sql.SQL("ANALYZE {}").format(sql.Identifier(table))
+            )
+            seconds = time.perf_counter() - started
+            observe("maintenance.analyze", seconds)
+            await _record(connection, "analyze", table, seconds, rows)
+            logger.log_and_print(f"Maintenance: analyzed {table} in {seconds:.2f}s.")
+    finally:
+        await connection.close()
+    return [table for table, _ in due]
+
+
+async def _reindex_vector_index(force: bool) -> Optional[str]:
+    """
+    Rebuild the knowledge ANN index concurrently once the table has grown by
+    MAINTENANCE_REINDEX_GROWTH since it was last built. Only runs in quiet hours
+    unless forced. The first time an index is seen its row count is recorded as the
+    baseline (a log entry without seconds).
+    """
+    if VECTOR_INDEX_CONFIG["type"] == "none":
+        return None
+
+    name = vector_index_name(KNOWLEDGE_TABLE)
+    async with get_db_connection() as connection:
+        status = await get_vector_index_status(connection, KNOWLEDGE_TABLE)
+        if not status["valid"] or status["build_progress"]:
+            return None
+        live = (await table_stats(connection, KNOWLEDGE_TABLE))["live_rows"]
+        cursor = await connection.execute(
+            "SELECT rows FROM db_maintenance_log WHERE task = 'reindex' AND target = %s",
+            (name,),
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            await _record(connection, "reindex", name, None, live)
+            return None
+
+    built_rows = row[0] or 0
+    if live < MAINTENANCE_CONFIG["reindex_min_rows"]:
+        return None
+    if live < built_rows * (1 + MAINTENANCE_CONFIG["reindex_growth"]):
+        return None
+    if not force and not in_quiet_hours():
+        logger.log_and_print(
+            f"Maintenance: {name} is due for a rebuild ({built_rows} -> {live} rows); "
+            "waiting for quiet hours."
+        )
+        return None
+
+    logger.log_and_print(
+        f"Maintenance: rebuilding {name} ({built_rows} -> {live} rows)..."
+    )
+    await rebuild_vector_index(live)
+    return name
+
+
+async def rebuild_vector_index(rows: Optional[int] = None) -> Optional[float]:
+    """
+    REINDEX the knowledge ANN index CONCURRENTLY: a fresh index is built next to the
+    old one and replaces it atomically, so searches never see a partial index.
+    Logs the run with `rows` (the table size it was built for). Returns seconds taken.
+    """
+    if VECTOR_INDEX_CONFIG["type"] == "none":
+        return None
+    name = vector_index_name(KNOWLEDGE_TABLE)
+    connection = await open_maintenance_connection()
+    try:
+        await connection.execute(
+            "SELECT set_config('maintenance_work_mem', %s, false)",
+            (VECTOR_INDEX_CONFIG["maintenance_work_mem"],),
+        )
+        started = time.perf_counter()
+        await connection.execute(
+            sql.SQL("REINDEX INDEX CONCURRENTLY {}").format(sql.Identifier(name))
+        )
+        seconds = time.perf_counter() - started
+        observe("maintenance.reindex", seconds)
+        await _ensure_log_table(connection)
+        await _record(connection, "reindex", name, seconds, rows)
+        logger.log_and_print(f"Maintenance: rebuilt {name} in {seconds:.1f}s.")
+    finally:
+        await connection.close()
+    return seconds
+
+
+async def run_maintenance(force: bool = False) -> dict:
+    """
+    One maintenance pass: partition upkeep (every CONVERSATION_PARTITION_CHECK_INTERVAL),
+    ANALYZE of tables with enough changes, and a concurrent vector index rebuild when due.
+    force analyzes every table and ignores quiet hours for the rebuild.
+    """
+    global _last_partition_run, _last_summary
+
+    summary = {
+        "started_at": datetime.now().astimezone(),
+        "analyzed": [],
+        "reindexed": None,
+    }
+    async with _run_lock:
+        try:
+            now = time.monotonic()
+            partitions_due = (
+                force
+                or _last_partition_run is None
+                or now - _last_partition_run
+                >= CONVERSATION_PARTITION_CONFIG["check_interval"]
+            )
+            if CONVERSATION_PARTITION_CONFIG["enabled"] and partitions_due:
+                summary["partitions"] = await run_partition_maintenance()
+                _last_partition_run = now
+
+            if force or MAINTENANCE_CONFIG["enabled"]:
+                async with get_db_connection() as connection:
+                    await _ensure_log_table(connection)
+                summary["analyzed"] = await _analyze_tables(force)
+                summary["reindexed"] = await _reindex_vector_index(force)
+                increment("maintenance.runs")
+        except psycopg.Error as e:
+            increment("maintenance.errors")
+            summary["error"] = str(e)
+            logger.log_and_print(f"Maintenance run failed: {e}")
+    summary["finished_at"] = datetime.now().astimezone()
+    _last_summary = summary
+    return summary
+
+
+async def get_maintenance_status() -> dict:
+    """Table/index bloat indicators and last maintenance timestamps for the admin endpoint"""
+    tables = {}
+    async with get_db_connection() as connection:
+        await _ensure_log_table(connection)
+        for table in MAINTAINED_TABLES:
+            tables[table] = await table_stats(connection, table)
+            tables[table]["indexes"] = await index_stats(connection, table)
+        cursor = await connection.execute(
+            """
+            SELECT task, target, finished_at, seconds, rows
+            FROM db_maintenance_log
+            ORDER BY finished_at DESC
+            """
+        )
+        columns = ("task", "target", "finished_at", "seconds", "rows")
+        history = [dict(zip(columns, row)) for row in await cursor.fetchall()]
+
+    return {
+        "scheduler": {
+            "enabled": MAINTENANCE_CONFIG["enabled"],
+            "running": _scheduler_task is not None and not _scheduler_task.done(),
+            "interval_seconds": MAINTENANCE_CONFIG["interval"],
+            "quiet_hours": MAINTENANCE_CONFIG["quiet_hours"] or None,
+            "in_quiet_hours": in_quiet_hours(),
+            "last_run": _last_summary,
+        },
+        "tables": tables,
+        "last_maintenance": history,
+    }
+
+
+async def _scheduler_loop():
+    while True:
+        # run_maintenance handles database errors; anything else must not end the loop
+        try:
+            await run_maintenance()
+        except Exception as e:
+            increment("maintenance.errors")
+            logger.log_and_print(f"Maintenance run failed unexpectedly: {e!r}")
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=MAINTENANCE_CONFIG["interval"])
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+
+def start_maintenance_scheduler():
+    """
+    Start the background maintenance loop. It also runs when MAINTENANCE_ENABLED is
+    false but partitioning is on, since upcoming conversation partitions must exist.
+    Raises ValueError for a malformed MAINTENANCE_QUIET_HOURS.
+    """
+    global _scheduler_task
+
+    if not (MAINTENANCE_CONFIG["enabled"] or CONVERSATION_PARTITION_CONFIG["enabled"]):
+        return
+    # Fail at startup rather than in every scheduled run
+    quiet_hours()
+    if _scheduler_task is not None and not _scheduler_task.done():
+        return
+    _scheduler_task = asyncio.create_task(_scheduler_loop())
+
+
+async def stop_maintenance_scheduler():
+    """Cancel the background maintenance loop, if running"""
+    global _scheduler_task
+
+    if _scheduler_task is None:
+        return
+    _scheduler_task.cancel()
+    try:
+        await _scheduler_task
+    except asyncio.CancelledError:
+        pass
+    _scheduler_task = None
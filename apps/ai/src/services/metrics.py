@@ -0,0 +1,105 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# In-process operational counters, timers and histograms, exposed on GET /metrics
+_counters: dict[str, int] = defaultdict(int)
+_timers: dict[str, dict] = {}
+_histograms: dict[str, dict] = {}
+# Counters of the request being handled (see track_request); None outside of one
+_request_counters: ContextVar[Optional[dict[str, int]]] = ContextVar(
+    "request_counters", default=None
+)
+
+# Default histogram bucket upper bounds (Prometheus-style, cumulative "le" buckets)
+LATENCY_MS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def increment(name: str, value: int = 1):
+    """Add value to the named counter (and to the current request's, if tracked)"""
+    _counters[name] += value
+    scoped = _request_counters.get()
+    if scoped is not None:
+        scoped[name] = scoped.get(name, 0) + value
+
+
+def track_request() -> dict[str, int]:
+    """
+    Start counting increments made from the current context (and tasks it spawns)
+    separately. Returns the per-request counter dict, filled in as work proceeds.
+    """
+    counters: dict[str, int] = {}
+    _request_counters.set(counters)
+    return counters
+
+
+def get_counter(name: str) -> int:
+    """Current value of the named counter (0 if never incremented)"""
+    return _counters.get(name, 0)
+
+
+def observe(name: str, seconds: float):
+    """Record one timed occurrence of the named operation"""
+    timer = _timers.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+    elapsed_ms = seconds * 1000
+    timer["count"] += 1
+    timer["total_ms"] += elapsed_ms
+    timer["max_ms"] = max(timer["max_ms"], elapsed_ms)
+
+
+def histogram(name: str, value: float, buckets: tuple = LATENCY_MS_BUCKETS):
+    """Record value into the named histogram (buckets fixed by the first call)"""
+    hist = _histograms.setdefault(
+        name,
+        {"buckets": buckets, "counts": [0] * len(buckets), "count": 0, "sum": 0.0},
+    )
+    hist["count"] += 1
+    hist["sum"] += value
+    for i, bound in enumerate(hist["buckets"]):
+        if value <= bound:
+            hist["counts"][i] += 1
+            break
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Time the enclosed block (including awaits) into the named timer"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def snapshot() -> dict:
+    """All metrics as a JSON-serialisable dict"""
+    timers = {
+        name: {
+            "count": t["count"],
+            "avg_ms": round(t["total_ms"] / t["count"], 3) if t["count"] else 0.0,
+            "max_ms": round(t["max_ms"], 3),
+            "total_ms": round(t["total_ms"], 3),
+        }
+        for name, t in sorted(_timers.items())
+    }
+    histograms = {}
+    for name, h in sorted(_histograms.items()):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(h["buckets"], h["counts"]):
+            cumulative += count
+            buckets[f"le_{bound}"] = cumulative
+        buckets["le_inf"] = h["count"]
+        histograms[name] = {
+            "count": h["count"],
+            "avg": round(h["sum"] / h["count"], 3) if h["count"] else 0.0,
+            "buckets": buckets,
+        }
+    return {
+        "counters": dict(sorted(_counters.items())),
+        "timers": timers,
+        "histograms": histograms,
+    }
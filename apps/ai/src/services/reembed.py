@@ -0,0 +1,291 @@
+import asyncio
+import time
+from typing import Optional
+import psycopg
+from services.db import KNOWLEDGE_TABLE, get_db_connection, start_hot_index_load
+from services.hot_index import add_to_hot_index
+from services.embed import embed_texts
+from services.logger import get_logger
+from services.maintenance import rebuild_vector_index, table_stats
+from services.metrics import increment, observe
+from utils.constants import EMBED_MODEL_ID, REEMBED_CONFIG
+
+# Background re-embed job, kept referenced so it is not garbage collected
+_job_task: Optional[asyncio.Task] = None
+_last_error: Optional[str] = None
+_progress_table_ready = False
+
+logger = get_logger()
+
+
+class _BatchFailed(Exception):
+    """No row of a batch could be embedded: the embed server is likely down"""
+
+
+async def _ensure_progress_table(connection: psycopg.AsyncConnection):
+    global _progress_table_ready
+
+    if _progress_table_ready:
+        return
+    await connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reembed_progress (
+            target_model TEXT PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0,
+            rows_done BIGINT NOT NULL DEFAULT 0,
+            rows_failed BIGINT NOT NULL DEFAULT 0,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        )
+        """
+    )
+    _progress_table_ready = True
+
+
+async def _checkpoint_start(connection: psycopg.AsyncConnection) -> int:
+    """
+    Resume an interrupted run for EMBED_MODEL_ID from its last checkpoint, or start a
+    new pass from the beginning if the previous one finished. Returns the last id done.
+    """
+    await _ensure_progress_table(connection)
+    cursor = await connection.execute(
+        """
+        INSERT INTO reembed_progress AS p (target_model) VALUES (%s)
+        ON CONFLICT (target_model) DO UPDATE SET
+            last_id = CASE WHEN p.finished_at IS NULL THEN p.last_id ELSE 0 END,
+            rows_done = CASE WHEN p.finished_at IS NULL THEN p.rows_done ELSE 0 END,
+            rows_failed = CASE WHEN p.finished_at IS NULL THEN p.rows_failed ELSE 0 END,
+            started_at = CASE WHEN p.finished_at IS NULL THEN p.started_at ELSE now() END,
+            finished_at = NULL
+        RETURNING last_id
+        """,
+        (EMBED_MODEL_ID,),
+    )
+    (last_id,) = await cursor.fetchone()
+    return last_id
+
+
+async def _reembed_batch(last_id: int) -> Optional[int]:
+    """
+    Re-embed the next batch of stale knowledge rows after last_id and checkpoint it
+    in the same transaction. Returns the new last id, or None when none are left.
+    Raises _BatchFailed, without checkpointing, when every row failed; rows failing
+    on their own are counted and retried on the next run.
+    """
+    async with get_db_connection() as connection:
+        cursor = await connection.execute(
+            """
+            SELECT id, message FROM knowledge_chunks
+            WHERE id > %s AND embedding_model IS DISTINCT FROM %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_id, EMBED_MODEL_ID, REEMBED_CONFIG["batch_size"]),
+        )
+        rows = await cursor.fetchall()
+    if not rows:
+        return None
+
+    # Embed without holding a pooled connection; old texts would only churn the cache
+    results = await embed_texts([message for _, message in rows], use_cache=False)
+    updates = [
+        (result["embedding"], EMBED_MODEL_ID, row_id, EMBED_MODEL_ID)
+        for (row_id, _), result in zip(rows, results)
+        if "error" not in result
+    ]
+    failed = len(rows) - len(updates)
+    if not updates:
+        raise _BatchFailed(results[0]["error"])
+    next_id = rows[-1][0]
+
+    async with get_db_connection() as connection:
+        await connection.cursor().executemany(
+            """
+            UPDATE knowledge_chunks SET embedding = %b, embedding_model = %s
+            WHERE id = %s AND embedding_model IS DISTINCT FROM %s
+            """,
+            updates,
+        )
+        await connection.execute(
+            """
+            UPDATE reembed_progress
+            SET last_id = %s, rows_done = rows_done + %s,
+                rows_failed = rows_failed + %s, updated_at = now()
+            WHERE target_model = %s
+            """,
+            (next_id, len(updates), failed, EMBED_MODEL_ID),
+        )
+    # Rows of the new model become searchable in the hot index right away
+    reembedded = [
+        (row_id, message, result["embedding"])
+        for (row_id, message), result in zip(rows, results)
+        if "error" not in result
+    ]
+    if not add_to_hot_index(reembedded):
+        start_hot_index_load()
+    increment("reembed.rows", len(updates))
+    if failed:
+        increment("reembed.failed_rows", failed)
+    return next_id
+
+
+async def _run_job():
+    global _last_error
+
+    _last_error = None
+    try:
+        async with get_db_connection() as connection:
+            last_id = await _checkpoint_start(connection)
+        logger.log_and_print(
+            f"Re-embedding knowledge with {EMBED_MODEL_ID} "
+            f"(resuming after id {last_id})..."
+        )
+        started = time.perf_counter()
+        retries = 0
+        while True:
+            batch_started = time.perf_counter()
+            try:
+                next_id = await _reembed_batch(last_id)
+            except _BatchFailed as e:
+                if retries == REEMBED_CONFIG["max_retries"]:
+                    raise
+                delay = REEMBED_CONFIG["retry_seconds"] * 2**retries
+                retries += 1
+                increment("reembed.retries")
+                logger.log_and_print(
+                    f"Re-embed batch after id {last_id} failed ({e}); "
+                    f"retrying in {delay:.0f}s."
+                )
+                await asyncio.sleep(delay)
+                continue
+            retries = 0
+            if next_id is None:
+                break
+            last_id = next_id
+            # Pace batches so the job stays under REEMBED_ROWS_PER_SECOND
+            budget = REEMBED_CONFIG["batch_size"] / REEMBED_CONFIG["rows_per_second"]
+            elapsed = time.perf_counter() - batch_started
+            await asyncio.sleep(max(0.0, budget - elapsed))
+
+        async with get_db_connection() as connection:
+            cursor = await connection.execute(
+                """
+                UPDATE reembed_progress SET finished_at = now(), updated_at = now()
+                WHERE target_model = %s
+                RETURNING rows_done, rows_failed
+                """,
+                (EMBED_MODEL_ID,),
+            )
+            rows_done, rows_failed = await cursor.fetchone()
+            live = (await table_stats(connection, KNOWLEDGE_TABLE))["live_rows"]
+        seconds = time.perf_counter() - started
+        observe("reembed.run", seconds)
+        logger.log_and_print(
+            f"Re-embedded {rows_done} knowledge rows with {EMBED_MODEL_ID} in "
+            f"{seconds:.1f}s ({rows_failed} failed; retried on the next run)."
+        )
+        if rows_done:
+            # Every vector changed: swap in a freshly built ANN index and hot index
+            start_hot_index_load()
+            await rebuild_vector_index(live)
+    except _BatchFailed as e:
+        # Unfinished: the next run resumes from the checkpoint
+        _last_error = f"embedding failed: {e}"
+        increment("reembed.errors")
+        logger.log_and_print(
+            f"Re-embed job stopped after id {last_id}: embedding keeps failing ({e})"
+        )
+    except psycopg.Error as e:
+        _last_error = str(e)
+        increment("reembed.errors")
+        logger.log_and_print(f"Re-embed job failed: {e}")
+
+
+def start_reembed() -> bool:
+    """
+    Start re-embedding knowledge stored by other models with EMBED_MODEL_ID in the
+    background. Returns False if the job is already running.
+    """
+    global _job_task
+
+    if _job_task is not None and not _job_task.done():
+        return False
+    _job_task = asyncio.create_task(_run_job())
+    return True
+
+
+async def start_reembed_if_stale():
+    """On startup: resume or start the job when knowledge from another model exists"""
+    if not REEMBED_CONFIG["auto_start"]:
+        return
+    try:
+        async with get_db_connection() as connection:
+            cursor = await connection.execute(
+                """
+                SELECT EXISTS (
+                    SELECT 1 FROM knowledge_chunks
+                    WHERE embedding_model IS DISTINCT FROM %s
+                )
+                """,
+                (EMBED_MODEL_ID,),
+            )
+            (stale,) = await cursor.fetchone()
+    except psycopg.Error as e:
+        logger.log_and_print(f"Could not check for stale embeddings: {e}")
+        return
+    if stale:
+        start_reembed()
+
+
+async def stop_reembed() -> bool:
+    """Cancel the job; it resumes from its last checkpoint when started again"""
+    global _job_task
+
+    if _job_task is None or _job_task.done():
+        return False
+    _job_task.cancel()
+    try:
+        await _job_task
+    except asyncio.CancelledError:
+        pass
+    _job_task = None
+    return True
+
+
+async def get_reembed_status() -> dict:
+    """Knowledge row counts per embedding model and the job's checkpoint"""
+    async with get_db_connection() as connection:
+        await _ensure_progress_table(connection)
+        cursor = await connection.execute(
+            "SELECT embedding_model, count(*) FROM knowledge_chunks GROUP BY 1"
+        )
+        rows_by_model = {model: count for model, count in await cursor.fetchall()}
+        cursor = await connection.execute(
+            """
+            SELECT last_id, rows_done, rows_failed, started_at, updated_at, finished_at
+            FROM reembed_progress WHERE target_model = %s
+            """,
+            (EMBED_MODEL_ID,),
+        )
+        row = await cursor.fetchone()
+
+    columns = (
+        "last_id",
+        "rows_done",
+        "rows_failed",
+        "started_at",
+        "updated_at",
+        "finished_at",
+    )
+    return {
+        "model": EMBED_MODEL_ID,
+        "running": _job_task is not None and not _job_task.done(),
+        "rows_by_model": rows_by_model,
+        "stale_rows": sum(
+            count for model, count in rows_by_model.items() if model != EMBED_MODEL_ID
+        ),
+        "rows_per_second": REEMBED_CONFIG["rows_per_second"],
+        "checkpoint": dict(zip(columns, row)) if row else None,
+        "error": _last_error,
+    }
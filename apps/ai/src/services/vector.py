@@ -0,0 +1,68 @@
+import base64
+import struct
+import numpy as np
+import psycopg
+from pgvector import Vector
+from psycopg.adapt import Dumper
+from psycopg.pq import Format
+
+# Embeddings are contiguous float32 arrays from response parsing to the database
+DTYPE = np.float32
+
+# pgvector's binary wire format: big-endian dimension count, unused word, float4 values
+_WIRE_HEADER = struct.Struct(">HH")
+_WIRE_DTYPE = np.dtype(">f4")
+
+
+def as_vector(values) -> np.ndarray:
+    """A float32 array view of `values` (copies only when the dtype or layout differs)"""
+    if isinstance(values, Vector):
+        return values.to_numpy()
+    return np.ascontiguousarray(values, dtype=DTYPE).reshape(-1)
+
+
+def decode_base64(data: str) -> np.ndarray:
+    """Decode a response item sent with encoding_format="base64" (little-endian float32)"""
+    return np.frombuffer(base64.b64decode(data), dtype="<f4").astype(DTYPE, copy=False)
+
+
+def normalize_vector(vector: np.ndarray) -> np.ndarray:
+    """Scale a vector to unit length so inner product equals cosine similarity"""
+    norm = float(np.linalg.norm(vector))
+    if norm == 0:
+        return vector
+    return vector / DTYPE(norm)
+
+
+def to_blob(vector: np.ndarray) -> bytes:
+    """Raw float32 bytes for local storage (see from_blob)"""
+    return as_vector(vector).tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=DTYPE)
+
+
+def to_binary(vector: np.ndarray) -> bytes:
+    """Encode a vector in pgvector's binary format with one vectorized byte swap"""
+    return _WIRE_HEADER.pack(len(vector), 0) + vector.astype(_WIRE_DTYPE).tobytes()
+
+
+class _NdarrayBinaryDumper(Dumper):
+    format = Format.BINARY
+
+    def dump(self, obj) -> bytes:
+        if isinstance(obj, Vector):
+            return obj.to_binary()
+        return to_binary(as_vector(obj))
+
+
+def register_vector_dumper(connection: psycopg.AsyncConnection):
+    """
+    Send numpy arrays to vector parameters and COPY columns without going through
+    pgvector.Vector (which rebuilds a Python array and swaps bytes element-wise).
+    Call after register_vector_async, which registers the vector type.
+    """
+    info = connection.adapters.types.get("vector")
+    dumper = type("", (_NdarrayBinaryDumper,), {"oid": info.oid})
+    connection.adapters.register_dumper(np.ndarray, dumper)
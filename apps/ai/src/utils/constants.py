@@ -16,3 +16,208 @@ MODEL_PORT = {
     "main": os.getenv("PORT_MODEL_MM", "http://localhost:9001/v1") if os.getenv("INFERENCE_MODE") != "lmstudio" else os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1"),
     "embed": os.getenv("PORT_MODEL_EMBED", "http://localhost:9002/v1") if os.getenv("INFERENCE_MODE") != "lmstudio" else os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1"),
 }
+
+DB_POOL_CONFIG = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    # Seconds a caller waits for a free connection before failing
+    "acquire_timeout": float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10")),
+    # Connections are recycled after this many seconds
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+    # Idle connections above min_size are closed after this many seconds
+    "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    # Cap on DB operations running at once across all requests
+    "max_concurrent_operations": int(os.getenv("DB_MAX_CONCURRENT_OPERATIONS", "8")),
+    # Prepare hot queries server-side once per pooled connection
+    "prepare_statements": os.getenv("DB_PREPARE_STATEMENTS", "true").lower() == "true",
+}
+
+VECTOR_INDEX_CONFIG = {
+    # Approximate nearest neighbour index on knowledge embeddings: hnsw | ivfflat | none
+    "type": os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower(),
+    # HNSW build parameters
+    "m": int(os.getenv("VECTOR_INDEX_HNSW_M", "16")),
+    "ef_construction": int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "64")),
+    # IVFFlat build parameter (roughly rows / 1000 up to 1M rows, sqrt(rows) above)
+    "lists": int(os.getenv("VECTOR_INDEX_IVFFLAT_LISTS", "100")),
+    # Default per-query search parameters (overridable per request)
+    "ef_search": int(os.getenv("VECTOR_INDEX_HNSW_EF_SEARCH", "40")),
+    "probes": int(os.getenv("VECTOR_INDEX_IVFFLAT_PROBES", "10")),
+    # Memory granted to index builds; HNSW builds are much faster when the graph fits
+    "maintenance_work_mem": os.getenv("VECTOR_INDEX_MAINTENANCE_WORK_MEM", "512MB"),
+}
+
+VECTOR_STORAGE_CONFIG = {
+    # How knowledge vectors are indexed: full (float32) | halfvec (float16) | binary (1 bit/dim)
+    # | truncated (leading dimensions only, for Matryoshka-trained models)
+    "mode": os.getenv("VECTOR_STORAGE_MODE", "full").lower(),
+    # Quantized modes fetch limit * overfetch candidates, then re-rank with full vectors
+    "overfetch": int(os.getenv("VECTOR_STORAGE_OVERFETCH", "4")),
+    # Leading dimensions kept in the generated column searched by the truncated mode
+    "truncated_dim": int(os.getenv("VECTOR_TRUNCATED_DIM", "256")),
+    # Unit-normalize embeddings so the index can use inner product instead of cosine
+    "normalize": os.getenv("VECTOR_NORMALIZE", "true").lower() == "true",
+}
+
+HOT_INDEX_CONFIG = {
+    # Serve knowledge similarity search from an in-process copy of the vectors, loaded
+    # at startup and kept in step with inserts (Postgres stays the source of truth;
+    # hybrid queries still run in SQL)
+    "enabled": os.getenv("HOT_INDEX_ENABLED", "false").lower() == "true",
+    # The hot tier is skipped (search stays in Postgres) if it would need more memory
+    "max_memory_mb": float(os.getenv("HOT_INDEX_MAX_MEMORY_MB", "512")),
+    # Below this many rows every vector is scored; above, about sqrt(rows) k-means
+    # lists are built and each query scores only the rows of the nearest few
+    "ivf_min_rows": int(os.getenv("HOT_INDEX_IVF_MIN_ROWS", "20000")),
+    "probes": int(os.getenv("HOT_INDEX_PROBES", "16")),
+    # Lists are retrained in memory once the index grows by this factor
+    "retrain_growth": float(os.getenv("HOT_INDEX_RETRAIN_GROWTH", "1.5")),
+}
+
+HYBRID_SEARCH_CONFIG = {
+    # Fuse full-text and vector rankings with reciprocal rank fusion
+    "enabled": os.getenv("HYBRID_SEARCH_ENABLED", "false").lower() == "true",
+    "vector_weight": float(os.getenv("HYBRID_SEARCH_VECTOR_WEIGHT", "1.0")),
+    "lexical_weight": float(os.getenv("HYBRID_SEARCH_LEXICAL_WEIGHT", "1.0")),
+    # RRF damping constant: score = weight / (rrf_k + rank)
+    "rrf_k": int(os.getenv("HYBRID_SEARCH_RRF_K", "60")),
+    # Candidates taken from each ranking before fusion
+    "candidates": int(os.getenv("HYBRID_SEARCH_CANDIDATES", "20")),
+    # Postgres text search configuration for the generated tsvector column
+    "text_search_config": os.getenv("HYBRID_SEARCH_TEXT_CONFIG", "english"),
+}
+
+CONTEXT_CONFIG = {
+    # Knowledge candidates retrieved per request before context assembly picks some
+    "candidates": int(os.getenv("CONTEXT_CANDIDATES", "12")),
+    # Most chunks placed in the prompt, and the token budget they share
+    "max_chunks": int(os.getenv("CONTEXT_MAX_CHUNKS", "6")),
+    "token_budget": int(os.getenv("CONTEXT_TOKEN_BUDGET", "768")),
+    # Maximal Marginal Relevance trade-off: 1 ranks by relevance only, 0 by novelty
+    "mmr_lambda": float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+    # Candidates this cosine-similar to a chunk already chosen count as duplicates
+    "duplicate_similarity": float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.95")),
+    # Candidates less cosine-similar than this to the query are dropped
+    "min_similarity": float(os.getenv("CONTEXT_MIN_SIMILARITY", "0.25")),
+}
+
+CONVERSATION_PARTITION_CONFIG = {
+    # Range-partition conversation_messages by created_at (existing tables are converted)
+    "enabled": os.getenv("CONVERSATION_PARTITIONING", "true").lower() == "true",
+    # Partition width: day | week | month
+    "interval": os.getenv("CONVERSATION_PARTITION_INTERVAL", "month").lower(),
+    # Future partitions created ahead of time so inserts never miss a partition
+    "premake": int(os.getenv("CONVERSATION_PARTITION_PREMAKE", "2")),
+    # Partitions entirely older than this are retired; 0 keeps history forever
+    "retention_days": int(os.getenv("CONVERSATION_RETENTION_DAYS", "0")),
+    # detach (keep as a standalone table for archiving) | drop
+    "retention_action": os.getenv("CONVERSATION_RETENTION_ACTION", "detach").lower(),
+    # Seconds between partition maintenance runs
+    "check_interval": float(os.getenv("CONVERSATION_PARTITION_CHECK_INTERVAL", "3600")),
+}
+
+MAINTENANCE_CONFIG = {
+    # In-process scheduler for ANALYZE, vector index rebuilds and partition upkeep
+    "enabled": os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true",
+    # Seconds between scheduler checks
+    "interval": float(os.getenv("MAINTENANCE_INTERVAL", "300")),
+    # "start-end" local hours (e.g. 1-5, may wrap midnight) when index rebuilds may run;
+    # empty allows them at any hour. ANALYZE is cheap and is never deferred.
+    "quiet_hours": os.getenv("MAINTENANCE_QUIET_HOURS", "").strip(),
+    # ANALYZE a table once this many rows changed since its last analyze
+    "analyze_min_changes": int(os.getenv("MAINTENANCE_ANALYZE_MIN_CHANGES", "1000")),
+    # Rebuild the vector index once the table grew by this fraction since the last build
+    "reindex_growth": float(os.getenv("MAINTENANCE_REINDEX_GROWTH", "0.5")),
+    # ...and only when the table holds at least this many rows
+    "reindex_min_rows": int(os.getenv("MAINTENANCE_REINDEX_MIN_ROWS", "10000")),
+}
+
+BULK_LOAD_CONFIG = {
+    # Memory and parallel workers for the index builds that finish a bulk load
+    "maintenance_work_mem": os.getenv("BULK_LOAD_MAINTENANCE_WORK_MEM", "1GB"),
+    "parallel_workers": int(os.getenv("BULK_LOAD_PARALLEL_WORKERS", "2")),
+}
+
+# Model served on the embed port. Stored with every vector: retrieval only compares
+# vectors of this model, and changing it re-embeds knowledge and invalidates the cache
+EMBED_MODEL_ID = os.getenv("EMBED_MODEL_ID", "nomic-embed-text-v1.5")
+
+# "base64" ships float32 bytes decoded straight into arrays; "float" sends JSON numbers
+EMBED_ENCODING_FORMAT = os.getenv("EMBED_ENCODING_FORMAT", "base64")
+
+EMBED_BATCH_CONFIG = {
+    # Estimated tokens per embeddings request; keep under the embed server batch size
+    "max_batch_tokens": int(os.getenv("EMBED_MAX_BATCH_TOKENS", "4096")),
+    # Upper bound on texts per embeddings request
+    "max_batch_size": int(os.getenv("EMBED_MAX_BATCH_SIZE", "32")),
+}
+
+EMBED_COALESCE_CONFIG = {
+    # Merge concurrent single-text embed calls from different requests into batches
+    "enabled": os.getenv("EMBED_COALESCE_ENABLED", "true").lower() == "true",
+    # How long the first waiting text may wait for company before its batch is sent
+    "window_ms": float(os.getenv("EMBED_COALESCE_WINDOW_MS", "5")),
+    "max_batch_size": int(os.getenv("EMBED_COALESCE_MAX_BATCH_SIZE", "32")),
+    # Batches sent to each embed server at the same time
+    "max_inflight": int(os.getenv("EMBED_COALESCE_MAX_INFLIGHT", "2")),
+}
+
+EMBED_POOL_CONFIG = {
+    # Embed servers sharing the work (comma-separated); defaults to PORT_MODEL_EMBED
+    "urls": [
+        url.strip() for url in os.getenv("EMBED_BACKENDS", "").split(",") if url.strip()
+    ]
+    or [MODEL_PORT["embed"]],
+    # Batches of one embed_texts call in flight per server; large calls are split
+    # across all healthy servers
+    "inflight_per_backend": int(os.getenv("EMBED_BACKEND_INFLIGHT", "2")),
+    # Consecutive failures before a server is skipped, and for how long (doubles
+    # while it keeps failing after readmission)
+    "eject_after_failures": int(os.getenv("EMBED_BACKEND_EJECT_AFTER", "3")),
+    "eject_seconds": float(os.getenv("EMBED_BACKEND_EJECT_SECONDS", "30")),
+    # Longest an embeddings call may take, failover and hedging included
+    "deadline_seconds": float(os.getenv("EMBED_REQUEST_DEADLINE_SECONDS", "10")),
+    # Send a duplicate request once a call outlasts this percentile of recent
+    # latencies (0 disables hedging), but never sooner than EMBED_HEDGE_MIN_MS
+    "hedge_percentile": float(os.getenv("EMBED_HEDGE_PERCENTILE", "95")),
+    "hedge_min_seconds": float(os.getenv("EMBED_HEDGE_MIN_MS", "50")) / 1000,
+}
+
+EMBED_CACHE_CONFIG = {
+    # Reuse vectors for texts embedded before (keyed by normalized text + model)
+    "enabled": os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true",
+    # Entries kept in the in-process LRU tier
+    "memory_entries": int(os.getenv("EMBED_CACHE_MEMORY_ENTRIES", "10000")),
+    # Persistent SQLite tier (empty disables it) and its entry limit
+    "path": os.getenv("EMBED_CACHE_PATH", "cache/embeddings.sqlite3"),
+    "disk_entries": int(os.getenv("EMBED_CACHE_DISK_ENTRIES", "500000")),
+}
+
+CHUNKER_CONFIG = {
+    # Tokenizer of the embedding model: a local tokenizer.json path (preferred, no
+    # network) or a Hugging Face model id, downloaded once at startup; empty or
+    # unloadable means token counts are estimated
+    "tokenizer": os.getenv("EMBED_TOKENIZER", "nomic-ai/nomic-embed-text-v1.5"),
+    # Most tokens the embed server accepts per input; llama.cpp rejects inputs
+    # longer than its --ubatch-size (512 in docker-compose.yml)
+    "context_tokens": int(os.getenv("EMBED_CONTEXT_TOKENS", "512")),
+    # Target chunk size and overlap between consecutive chunks, in tokens
+    "max_tokens": int(os.getenv("EMBED_CHUNK_TOKENS", "256")),
+    "overlap_tokens": int(os.getenv("EMBED_CHUNK_OVERLAP_TOKENS", "32")),
+    # Token counts memoized per distinct string
+    "count_cache_size": int(os.getenv("EMBED_TOKEN_COUNT_CACHE", "8192")),
+}
+
+REEMBED_CONFIG = {
+    # Re-embed knowledge stored by other models in the background after startup
+    "auto_start": os.getenv("REEMBED_AUTO_START", "true").lower() == "true",
+    # Rows read, embedded and updated per transaction (and per checkpoint)
+    "batch_size": int(os.getenv("REEMBED_BATCH_SIZE", "32")),
+    # Ceiling on texts re-embedded per second so live requests keep the embed server
+    "rows_per_second": float(os.getenv("REEMBED_ROWS_PER_SECOND", "20")),
+    # A batch that fails entirely (embed server down) is retried after this many
+    # seconds, doubling each time; after max_retries in a row the run stops and
+    # resumes from its checkpoint next time
+    "retry_seconds": float(os.getenv("REEMBED_RETRY_SECONDS", "10")),
+    "max_retries": int(os.getenv("REEMBED_MAX_RETRIES", "6")),
+}
@@ -0,0 +1,67 @@
+import asyncio
+import random
+import sys
+import os
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services.db import close_db_pool, get_db_connection, save_messages_bulk
+
+# Compare per-row INSERT + commit (the save_message path) against one COPY transaction.
+# Vectors are random so only database write cost is measured, not the embed server.
+ROWS = int(os.getenv("BENCH_ROWS", "2000"))
+DIM = 768
+# Rows are written as knowledge so the ANN index maintenance cost is included
+BENCH_TAG = f"[bench {uuid.uuid4().hex[:8]}]"
+
+
+def random_vector() -> list[float]:
+    return [random.uniform(-1.0, 1.0) for _ in range(DIM)]
+
+
+async def per_row_insert(rows: list[tuple]) -> float:
+    started = time.perf_counter()
+    for message, role, session_id, vector in rows:
+        async with get_db_connection() as connection:
+            await connection.execute(
+                """
+                INSERT INTO knowledge_chunks (message, embedding)
+                VALUES (%s, %s::vector);
+                """,
+                (message, vector),
+            )
+    return time.perf_counter() - started
+
+
+async def cleanup():
+    async with get_db_connection() as connection:
+        await connection.execute(
+            "DELETE FROM knowledge_chunks WHERE message LIKE %s",
+            (f"{BENCH_TAG}%",),
+        )
+
+
+async def main():
+    rows = [
+        (f"{BENCH_TAG} chunk {i}", "system", None, random_vector())
+        for i in range(ROWS)
+    ]
+    try:
+        await cleanup()
+        per_row_seconds = await per_row_insert(rows)
+        await cleanup()
+        bulk = await save_messages_bulk(rows)
+        await cleanup()
+    finally:
+        await close_db_pool()
+
+    per_row_rate = ROWS / per_row_seconds
+    print(f"\nRows: {ROWS} (dim {DIM})")
+    print(f"per-row INSERT : {per_row_seconds:8.3f}s  {per_row_rate:10.1f} rows/sec")
+    print(f"bulk COPY      : {bulk['seconds']:8.3f}s  {bulk['rows_per_sec']:10.1f} rows/sec")
+    print(f"speedup        : {bulk['rows_per_sec'] / per_row_rate:8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
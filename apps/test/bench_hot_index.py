@@ -0,0 +1,155 @@
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import psycopg
+
+# The hot index only loads when enabled; the benchmark always wants it
+os.environ.setdefault("HOT_INDEX_ENABLED", "true")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services import hot_index
+from services.db import (
+    close_db_pool,
+    get_db_connection,
+    get_embeddings_from_db,
+    load_hot_index,
+)
+from services.db_index import EMBEDDING_DIM
+from services.hot_index import HotIndex, train_lists
+from utils.constants import VECTOR_STORAGE_CONFIG
+
+# p50/p99 latency and recall@k of top-k knowledge search served by the in-process hot
+# index versus the SQL path. Part one runs offline on synthetic clustered vectors
+# (exact scan and IVF at several probe counts); part two, if Postgres is reachable,
+# loads knowledge_chunks and compares get_embeddings_from_db on both paths.
+ROWS = int(os.getenv("BENCH_ROWS", "50000"))
+QUERIES = int(os.getenv("BENCH_QUERIES", "500"))
+K = int(os.getenv("BENCH_K", "3"))
+PROBES = [int(p) for p in os.getenv("BENCH_PROBES", "4,8,16,32").split(",")]
+# Synthetic topics: knowledge chunks cluster around the pages they were crawled from
+TOPICS = int(os.getenv("BENCH_TOPICS", "500"))
+
+
+def unit(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+
+
+def synthetic(rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    topics = unit(rng.standard_normal((TOPICS, EMBEDDING_DIM), dtype=np.float32))
+    # Noise scaled by 1/sqrt(dim) has norm ~scale whatever the embedding size
+    noise = 1 / np.sqrt(EMBEDDING_DIM)
+    rows = topics[rng.integers(0, TOPICS, ROWS)]
+    rows = unit(rows + 0.6 * noise * rng.standard_normal(rows.shape, dtype=np.float32))
+    picks = rows[rng.integers(0, ROWS, QUERIES)]
+    queries = unit(
+        picks + 0.2 * noise * rng.standard_normal(picks.shape, dtype=np.float32)
+    )
+    return rows.astype(np.float32), queries.astype(np.float32)
+
+
+def percentiles(latencies: list[float]) -> tuple[float, float]:
+    latencies = sorted(latencies)
+    return (
+        statistics.median(latencies),
+        latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    )
+
+
+def measure(index: HotIndex, queries: np.ndarray, probes: int) -> tuple[list, list]:
+    latencies = []
+    found = []
+    for query in queries:
+        started = time.perf_counter()
+        hits = index.search(query, K, probes)
+        latencies.append((time.perf_counter() - started) * 1e6)
+        found.append({hit["message"] for hit in hits})
+    return latencies, found
+
+
+def offline():
+    rng = np.random.default_rng(int(os.getenv("BENCH_SEED", "0")))
+    rows, queries = synthetic(rng)
+    index = HotIndex(EMBEDDING_DIM, capacity=ROWS)
+    for row_id, vector in enumerate(rows):
+        index.add(row_id, str(row_id), vector)
+
+    exact_latencies, truth = measure(index, queries, 0)
+    started = time.perf_counter()
+    trained = train_lists(index.rows(), index.size)
+    train_seconds = time.perf_counter() - started
+    index.install(*trained)
+
+    print(
+        f"{ROWS} synthetic vectors x {EMBEDDING_DIM} dims, {QUERIES} queries, "
+        f"{index.list_count} IVF lists trained in {train_seconds:.2f}s, "
+        f"{index.memory_bytes() / 1024 / 1024:.1f} MB"
+    )
+    print(f"\n{'search':<12} {'p50 µs':>9} {'p99 µs':>9} {'recall@' + str(K):>9}")
+    p50, p99 = percentiles(exact_latencies)
+    print(f"{'exact scan':<12} {p50:9.1f} {p99:9.1f} {1.0:9.3f}")
+    for probes in PROBES:
+        latencies, found = measure(index, queries, probes)
+        recall = statistics.mean(
+            len(hits & expected) / K for hits, expected in zip(found, truth)
+        )
+        p50, p99 = percentiles(latencies)
+        print(f"{'probes ' + str(probes):<12} {p50:9.1f} {p99:9.1f} {recall:9.3f}")
+
+
+async def against_sql():
+    await load_hot_index()
+    if hot_index.hot_index_status()["state"] != "ready":
+        print("\nHot index did not load (see log); skipping the SQL comparison")
+        return
+    async with get_db_connection() as connection:
+        cursor = await connection.execute(
+            "SELECT embedding FROM knowledge_chunks ORDER BY random() LIMIT %s",
+            (QUERIES,),
+        )
+        queries = [row[0].to_numpy() for row in await cursor.fetchall()]
+
+    mode = VECTOR_STORAGE_CONFIG["mode"]
+    timings = {"sql": [], "hot": []}
+    overlap = []
+    for query in queries:
+        embedding = {"embedding": query}
+        started = time.perf_counter()
+        # An explicit storage_mode sends the query to Postgres
+        sql_hits = await get_embeddings_from_db(embedding, storage_mode=mode, limit=K)
+        timings["sql"].append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        hot_hits = await get_embeddings_from_db(embedding, limit=K)
+        timings["hot"].append((time.perf_counter() - started) * 1000)
+        expected = {hit["message"] for hit in sql_hits}
+        if expected:
+            found = {hit["message"] for hit in hot_hits}
+            overlap.append(len(expected & found) / len(expected))
+
+    status = hot_index.hot_index_status()
+    print(
+        f"\nknowledge_chunks: {status['rows']} rows, {status['lists']} IVF lists, "
+        f"{status['memory_mb']} MB in process"
+    )
+    print(f"{'path':<14} {'p50 ms':>8} {'p99 ms':>8}")
+    for path, label in (("sql", f"SQL ({mode})"), ("hot", "hot index")):
+        p50, p99 = percentiles(timings[path])
+        print(f"{label:<14} {p50:8.3f} {p99:8.3f}")
+    if overlap:
+        print(f"top-{K} agreement with SQL: {statistics.mean(overlap):.3f}")
+
+
+async def main():
+    offline()
+    try:
+        await against_sql()
+    except psycopg.OperationalError as e:
+        print(f"\nPostgres unavailable ({e}); skipping the SQL comparison")
+    finally:
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+import asyncio
+import random
+import re
+import statistics
+import sys
+import os
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services.db import close_db_pool, get_db_connection, get_embeddings_from_db
+from services.embed import embed_texts
+
+# Known-item benchmark: each query is a short fragment of a stored knowledge chunk,
+# preferring fragments with exact identifiers (API names, versions, error codes).
+# A hit means that chunk is in the top-k. Needs the embed server and a populated DB.
+QUERIES = int(os.getenv("BENCH_QUERIES", "100"))
+K = int(os.getenv("BENCH_K", "3"))
+FRAGMENT_WORDS = 6
+
+# Tokens with digits, dots, underscores or inner capitals look like identifiers
+IDENTIFIER = re.compile(r"\S*(\d|_|\.\w|[a-z][A-Z])\S*")
+
+
+def make_fragment(text: str) -> str:
+    words = text.split()
+    anchors = [i for i, w in enumerate(words) if IDENTIFIER.fullmatch(w)]
+    if anchors:
+        center = random.choice(anchors)
+    else:
+        center = random.randrange(len(words))
+    start = max(0, center - FRAGMENT_WORDS // 2)
+    return " ".join(words[start : start + FRAGMENT_WORDS])
+
+
+async def sample_targets() -> list[tuple[str, str]]:
+    async with get_db_connection() as connection:
+        cursor = await connection.execute(
+            """
+            SELECT message FROM knowledge_chunks
+            WHERE length(message) > 200
+            ORDER BY random()
+            LIMIT %s
+            """,
+            (QUERIES,),
+        )
+        rows = await cursor.fetchall()
+    return [(row[0], make_fragment(row[0])) for row in rows]
+
+
+async def run(targets, vectors, hybrid: bool) -> dict:
+    latencies = []
+    hits = 0
+    for (message, fragment), embedding in zip(targets, vectors):
+        started = time.perf_counter()
+        results = await get_embeddings_from_db(
+            embedding, limit=K, query_text=fragment, hybrid=hybrid
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += any(r["message"] == message for r in results)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "recall": hits / len(targets),
+    }
+
+
+async def main():
+    try:
+        targets = await sample_targets()
+        if not targets:
+            print("knowledge_chunks is empty; run the crawler first.")
+            return
+        vectors = await embed_texts([fragment for _, fragment in targets])
+        vector_only = await run(targets, vectors, hybrid=False)
+        hybrid = await run(targets, vectors, hybrid=True)
+    finally:
+        await close_db_pool()
+
+    print(f"\nKnown-item queries: {len(targets)}, k={K}")
+    print(f"{'mode':<12} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(K):>9}")
+    for name, r in (("vector-only", vector_only), ("hybrid", hybrid)):
+        print(f"{name:<12} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} {r['recall']:9.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
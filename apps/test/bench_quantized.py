@@ -0,0 +1,158 @@
+import asyncio
+import json
+import math
+import random
+import statistics
+import sys
+import os
+import time
+
+from pgvector import Vector
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services.db import close_db_pool, get_db_connection
+from services.db_index import (
+    EMBEDDING_DIM,
+    STORAGE_MODES,
+    apply_search_tuning,
+    knowledge_search_sql,
+    truncated_column_sql,
+    vector_index_name,
+    vector_index_sql,
+)
+from utils.constants import VECTOR_STORAGE_CONFIG
+
+# Compare index size, query latency and recall@k of the full / halfvec / binary /
+# truncated storage modes on a scratch copy of knowledge_chunks (padded with random vectors).
+ROWS = int(os.getenv("BENCH_ROWS", "20000"))
+QUERIES = int(os.getenv("BENCH_QUERIES", "200"))
+K = int(os.getenv("BENCH_K", "3"))
+BENCH_TABLE = "bench_quantized"
+
+
+def random_unit_vector() -> list[float]:
+    vector = [random.gauss(0.0, 1.0) for _ in range(EMBEDDING_DIM)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+def jitter(vector: list[float], scale: float = 0.02) -> list[float]:
+    noisy = [x + random.gauss(0.0, scale) for x in vector]
+    norm = math.sqrt(sum(x * x for x in noisy))
+    return [x / norm for x in noisy]
+
+
+async def prepare_table() -> list[list[float]]:
+    async with get_db_connection() as connection:
+        await connection.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        await connection.execute(
+            f"""
+            CREATE TABLE {BENCH_TABLE} AS
+            SELECT id::text AS message, embedding
+            FROM knowledge_chunks
+            WHERE embedding IS NOT NULL
+            LIMIT %s
+            """,
+            (ROWS,),
+        )
+        cursor = await connection.execute(f"SELECT count(*) FROM {BENCH_TABLE}")
+        (existing,) = await cursor.fetchone()
+
+        cursor = connection.cursor()
+        async with cursor.copy(f"COPY {BENCH_TABLE} (message, embedding) FROM STDIN") as copy:
+            for i in range(ROWS - existing):
+                vector = random_unit_vector()
+                await copy.write_row((f"random-{i}", json.dumps(vector)))
+
+        await connection.execute(truncated_column_sql(BENCH_TABLE))
+        await connection.execute(f"ANALYZE {BENCH_TABLE}")
+        cursor = await connection.execute(
+            f"SELECT embedding::text FROM {BENCH_TABLE} ORDER BY random() LIMIT %s",
+            (QUERIES,),
+        )
+        rows = await cursor.fetchall()
+
+    print(f"Bench table: {ROWS} rows ({existing} from knowledge_chunks)")
+    return [jitter(json.loads(row[0])) for row in rows]
+
+
+async def exact_top_k(queries: list[list[float]]) -> list[set[str]]:
+    truth = []
+    async with get_db_connection() as connection:
+        await connection.execute("SET LOCAL enable_indexscan = off")
+        for query in queries:
+            cursor = await connection.execute(
+                f"""
+                SELECT message FROM {BENCH_TABLE}
+                ORDER BY embedding <=> %s::vector
+                LIMIT %s
+                """,
+                (query, K),
+            )
+            truth.append({row[0] for row in await cursor.fetchall()})
+    return truth
+
+
+async def bench_mode(mode: str, queries: list[list[float]], truth: list[set[str]]) -> dict:
+    index_name = vector_index_name(BENCH_TABLE, storage_mode=mode)
+    async with get_db_connection() as connection:
+        await connection.execute(vector_index_sql(BENCH_TABLE, storage_mode=mode))
+        cursor = await connection.execute(
+            "SELECT pg_relation_size(%s::regclass), pg_total_relation_size(%s::regclass)",
+            (index_name, BENCH_TABLE),
+        )
+        index_bytes, table_bytes = await cursor.fetchone()
+
+    latencies = []
+    recalls = []
+    search = knowledge_search_sql(BENCH_TABLE, storage_mode=mode, match_model=False)
+    for query, expected in zip(queries, truth):
+        async with get_db_connection() as connection:
+            await apply_search_tuning(connection)
+            started = time.perf_counter()
+            cursor = await connection.execute(
+                search,
+                {
+                    "query": Vector(query),
+                    "limit": K,
+                    "candidates": K * VECTOR_STORAGE_CONFIG["overfetch"],
+                },
+            )
+            found = {row[0] for row in await cursor.fetchall()}
+            latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(found & expected) / K)
+
+    async with get_db_connection() as connection:
+        await connection.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "index_mb": index_bytes / 1024 / 1024,
+        "table_mb": table_bytes / 1024 / 1024,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "recall": statistics.mean(recalls),
+    }
+
+
+async def main():
+    try:
+        queries = await prepare_table()
+        truth = await exact_top_k(queries)
+        results = [await bench_mode(mode, queries, truth) for mode in STORAGE_MODES]
+        async with get_db_connection() as connection:
+            await connection.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    finally:
+        await close_db_pool()
+
+    print(f"\n{'mode':<9} {'index MB':>9} {'table+idx MB':>13} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(K):>9}")
+    for r in results:
+        print(
+            f"{r['mode']:<9} {r['index_mb']:9.1f} {r['table_mb']:13.1f} "
+            f"{r['p50_ms']:8.2f} {r['p99_ms']:8.2f} {r['recall']:9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
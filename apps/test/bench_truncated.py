@@ -0,0 +1,187 @@
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services.db import close_db_pool, get_db_connection
+from services.db_index import (
+    EMBEDDING_DIM,
+    apply_search_tuning,
+    knowledge_search_sql,
+    truncated_column,
+    truncated_column_sql,
+    vector_index_name,
+    vector_index_sql,
+)
+from services.vector import normalize_vector
+from utils.constants import VECTOR_STORAGE_CONFIG
+
+# Index size, query latency and recall@k of the truncated (Matryoshka) storage mode
+# for several leading-dimension counts, against the full-vector index, on a scratch
+# copy of knowledge_chunks. Padding rows are synthetic with variance decaying over
+# the dimensions, like Matryoshka-trained embeddings; only real rows show how much
+# a given model actually loses.
+ROWS = int(os.getenv("BENCH_ROWS", "20000"))
+QUERIES = int(os.getenv("BENCH_QUERIES", "200"))
+K = int(os.getenv("BENCH_K", "3"))
+DIMS = [int(d) for d in os.getenv("BENCH_DIMS", "64,128,256,384,512").split(",")]
+BENCH_TABLE = "bench_truncated"
+
+# Per-dimension scale of the synthetic vectors: leading dimensions carry most energy
+_SCALE = 1.0 / np.sqrt(np.arange(1, EMBEDDING_DIM + 1, dtype=np.float32))
+
+
+def synthetic_vector(rng: np.random.Generator) -> np.ndarray:
+    return normalize_vector(rng.standard_normal(EMBEDDING_DIM, dtype=np.float32) * _SCALE)
+
+
+def jitter(vector: np.ndarray, rng: np.random.Generator, scale: float = 0.02) -> np.ndarray:
+    noise = rng.standard_normal(EMBEDDING_DIM, dtype=np.float32) * _SCALE * scale
+    return normalize_vector(vector + noise)
+
+
+async def prepare_table(rng: np.random.Generator) -> list[np.ndarray]:
+    async with get_db_connection() as connection:
+        await connection.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+        await connection.execute(
+            f"""
+            CREATE TABLE {BENCH_TABLE} AS
+            SELECT id::text AS message, embedding
+            FROM knowledge_chunks
+            WHERE embedding IS NOT NULL
+            LIMIT %s
+            """,
+            (ROWS,),
+        )
+        cursor = await connection.execute(f"SELECT count(*) FROM {BENCH_TABLE}")
+        (existing,) = await cursor.fetchone()
+
+        cursor = connection.cursor()
+        async with cursor.copy(
+            f"COPY {BENCH_TABLE} (message, embedding) FROM STDIN (FORMAT BINARY)"
+        ) as copy:
+            copy.set_types(["text", "vector"])
+            for i in range(ROWS - existing):
+                await copy.write_row((f"synthetic-{i}", synthetic_vector(rng)))
+
+        await connection.execute(f"ANALYZE {BENCH_TABLE}")
+        cursor = await connection.execute(
+            f"SELECT embedding FROM {BENCH_TABLE} ORDER BY random() LIMIT %s",
+            (QUERIES,),
+        )
+        rows = await cursor.fetchall()
+
+    print(f"Bench table: {ROWS} rows ({existing} from knowledge_chunks)")
+    return [jitter(row[0].to_numpy(), rng) for row in rows]
+
+
+async def exact_top_k(queries: list[np.ndarray]) -> list[set[str]]:
+    truth = []
+    async with get_db_connection() as connection:
+        await connection.execute("SET LOCAL enable_indexscan = off")
+        for query in queries:
+            cursor = await connection.execute(
+                f"""
+                SELECT message FROM {BENCH_TABLE}
+                ORDER BY embedding <=> %b::vector
+                LIMIT %s
+                """,
+                (query, K),
+            )
+            truth.append({row[0] for row in await cursor.fetchall()})
+    return truth
+
+
+async def run_queries(
+    search, queries: list[np.ndarray], truth: list[set[str]], candidates: int
+) -> tuple[list[float], float]:
+    latencies = []
+    recalls = []
+    for query, expected in zip(queries, truth):
+        async with get_db_connection() as connection:
+            await apply_search_tuning(connection)
+            started = time.perf_counter()
+            cursor = await connection.execute(
+                search, {"query": query, "limit": K, "candidates": candidates}
+            )
+            found = {row[0] for row in await cursor.fetchall()}
+            latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(found & expected) / K)
+    return sorted(latencies), statistics.mean(recalls)
+
+
+async def bench_dims(
+    dims: Optional[int], queries: list[np.ndarray], truth: list[set[str]]
+) -> dict:
+    """dims=None benchmarks the full-vector index as the baseline"""
+    mode = "full" if dims is None else "truncated"
+    index_name = vector_index_name(BENCH_TABLE, storage_mode=mode, dims=dims)
+    async with get_db_connection() as connection:
+        if dims is not None:
+            await connection.execute(truncated_column_sql(BENCH_TABLE, dims=dims))
+        await connection.execute(
+            vector_index_sql(BENCH_TABLE, storage_mode=mode, dims=dims)
+        )
+        cursor = await connection.execute(
+            "SELECT pg_relation_size(%s::regclass)", (index_name,)
+        )
+        (index_bytes,) = await cursor.fetchone()
+
+    search = knowledge_search_sql(
+        BENCH_TABLE, storage_mode=mode, match_model=False, dims=dims
+    )
+    # First stage alone: with K candidates the re-rank only reorders them
+    _, first_stage_recall = await run_queries(search, queries, truth, K)
+    latencies, recall = await run_queries(
+        search, queries, truth, K * VECTOR_STORAGE_CONFIG["overfetch"]
+    )
+
+    async with get_db_connection() as connection:
+        await connection.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+        if dims is not None:
+            await connection.execute(
+                f'ALTER TABLE {BENCH_TABLE} DROP COLUMN "{truncated_column(dims=dims)}"'
+            )
+
+    return {
+        "dims": dims or EMBEDDING_DIM,
+        "index_mb": index_bytes / 1024 / 1024,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "first_stage_recall": first_stage_recall,
+        "recall": recall,
+    }
+
+
+async def main():
+    rng = np.random.default_rng(int(os.getenv("BENCH_SEED", "0")))
+    try:
+        queries = await prepare_table(rng)
+        truth = await exact_top_k(queries)
+        results = [await bench_dims(None, queries, truth)]
+        for dims in DIMS:
+            results.append(await bench_dims(dims, queries, truth))
+        async with get_db_connection() as connection:
+            await connection.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    finally:
+        await close_db_pool()
+
+    overfetch = VECTOR_STORAGE_CONFIG["overfetch"]
+    print(
+        f"\n{'dims':>5} {'index MB':>9} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'recall@' + str(K):>9} {'+rerank x' + str(overfetch):>11}"
+    )
+    for r in results:
+        print(
+            f"{r['dims']:>5} {r['index_mb']:9.1f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} "
+            f"{r['first_stage_recall']:9.3f} {r['recall']:11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
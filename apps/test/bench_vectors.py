@@ -0,0 +1,81 @@
+import base64
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from pgvector import Vector
+from services.vector import decode_base64, normalize_vector, to_binary
+
+# Per-vector cost of turning an embeddings response item into query/COPY bytes.
+# Runs offline: responses are synthesized in both wire formats from the same values.
+DIM = int(os.getenv("BENCH_DIM", "768"))
+VECTORS = int(os.getenv("BENCH_VECTORS", "2000"))
+
+
+def make_items() -> tuple[list[str], list[str]]:
+    json_items = []
+    base64_items = []
+    for _ in range(VECTORS):
+        values = np.array([random.gauss(0, 1) for _ in range(DIM)], dtype=np.float32)
+        json_items.append(json.dumps({"embedding": values.tolist()}))
+        base64_items.append(
+            json.dumps({"embedding": base64.b64encode(values.astype("<f4")).decode()})
+        )
+    return json_items, base64_items
+
+
+def list_path(item: str, binary: bool) -> bytes:
+    """Previous path: JSON floats -> Python list -> pure-Python normalize -> Vector"""
+    vector = json.loads(item)["embedding"]
+    norm = math.sqrt(sum(x * x for x in vector))
+    vector = [x / norm for x in vector]
+    if binary:
+        return Vector(vector).to_binary()
+    return Vector._to_db(vector).encode()
+
+
+def array_path(item: str) -> bytes:
+    """Current path: base64 -> float32 buffer -> vectorized normalize -> binary wire"""
+    vector = decode_base64(json.loads(item)["embedding"])
+    return to_binary(normalize_vector(vector))
+
+
+def measure(label: str, fn, items: list[str]) -> float:
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    per_vector = (time.perf_counter() - started) / len(items) * 1e6
+    print(f"{label:<42} {per_vector:>9.1f} µs/vector")
+    return per_vector
+
+
+def main():
+    json_items, base64_items = make_items()
+
+    # Both paths must put the same bytes on the wire
+    expected = Vector.from_binary(list_path(json_items[0], binary=True)).to_numpy()
+    actual = Vector.from_binary(array_path(base64_items[0])).to_numpy()
+    assert np.allclose(expected, actual, atol=1e-6), "binary encodings differ"
+
+    print(f"{VECTORS} vectors x {DIM} dims, parse + normalize + serialize")
+    text = measure(
+        "float list -> text (%s::vector)", lambda i: list_path(i, False), json_items
+    )
+    binary = measure(
+        "float list -> pgvector.Vector binary", lambda i: list_path(i, True), json_items
+    )
+    current = measure("base64 -> float32 array -> binary", array_path, base64_items)
+    print(f"speedup vs text: {text / current:.1f}x, vs list binary: {binary / current:.1f}x")
+    print(
+        f"response bytes per vector: float {len(json_items[0])}, base64 {len(base64_items[0])}"
+    )
+
+
+if __name__ == "__main__":
+    main()
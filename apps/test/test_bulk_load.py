@@ -0,0 +1,118 @@
+import asyncio
+import os
+import sys
+import uuid
+
+import psycopg
+import pytest
+
+# Estimated token counts: deterministic and no tokenizer download
+os.environ["EMBED_TOKENIZER"] = ""
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services import bulk_load
+from services.bulk_load import HASH_KEY, begin_bulk_load, finish_bulk_load
+from services.db import (
+    KNOWLEDGE_TABLE,
+    close_db_pool,
+    get_db_connection,
+    initialize_database,
+    open_maintenance_connection,
+)
+from services.embed import content_hash
+
+# Runs bulk loads against the configured database (DB_HOST, ...), like the benches:
+# every load swaps in a new knowledge table holding the same rows. Skipped when
+# Postgres is unreachable.
+
+
+async def _reachable() -> bool:
+    try:
+        connection = await open_maintenance_connection()
+    except psycopg.OperationalError:
+        return False
+    await connection.close()
+    return True
+
+
+@pytest.fixture(scope="module")
+def database():
+    if not asyncio.run(_reachable()):
+        pytest.skip("Postgres unavailable")
+
+
+def run(scenario):
+    """Run a scenario on a fresh event loop (the pool is bound to the loop)"""
+
+    async def wrapped():
+        try:
+            await initialize_database()
+            return await scenario()
+        finally:
+            await close_db_pool()
+
+    return asyncio.run(wrapped())
+
+
+async def bulk_load_once(during=None) -> dict:
+    """Begin and finish one bulk load, running `during` while it is open"""
+    session = await begin_bulk_load()
+    assert session["status"] == "success", session
+    if during is not None:
+        await during()
+    await finish_bulk_load(session["session_id"])
+    await bulk_load._finish_task
+    finished = bulk_load.get_bulk_load(session["session_id"])
+    assert finished["state"] == "done", finished["error"]
+    return finished
+
+
+async def unique_hash_indexes() -> list[str]:
+    async with get_db_connection() as connection:
+        cursor = await connection.execute(
+            """
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+            WHERE i.indrelid = to_regclass(%s) AND i.indisunique
+              AND i.indnatts = 1 AND a.attname = 'content_hash'
+            """,
+            (KNOWLEDGE_TABLE,),
+        )
+        return [row[0] for row in await cursor.fetchall()]
+
+
+def test_consecutive_loads_keep_one_content_hash_key(database):
+    async def scenario():
+        await bulk_load_once()
+        await bulk_load_once()
+        return await unique_hash_indexes()
+
+    assert run(scenario) == [HASH_KEY]
+
+
+def test_rows_deleted_during_a_load_stay_deleted(database):
+    message = f"bulk load test row {uuid.uuid4().hex}"
+
+    async def delete_row():
+        async with get_db_connection() as connection:
+            await connection.execute(
+                f"DELETE FROM {KNOWLEDGE_TABLE} WHERE content_hash = %s",
+                (content_hash(message),),
+            )
+
+    async def scenario():
+        async with get_db_connection() as connection:
+            await connection.execute(
+                f"INSERT INTO {KNOWLEDGE_TABLE} (message, content_hash) VALUES (%s, %s)",
+                (message, content_hash(message)),
+            )
+        await bulk_load_once(during=delete_row)
+        async with get_db_connection() as connection:
+            cursor = await connection.execute(
+                f"SELECT count(*) FROM {KNOWLEDGE_TABLE} WHERE content_hash = %s",
+                (content_hash(message),),
+            )
+            return (await cursor.fetchone())[0]
+
+    assert run(scenario) == 0
@@ -0,0 +1,81 @@
+import os
+import sys
+
+# Estimated token counts: deterministic and no tokenizer download
+os.environ["EMBED_TOKENIZER"] = ""
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services.chunker import chunk_text, count_tokens, fit_to_limit, token_limit
+from services.embed import pack_batches
+
+SENTENCES = [f"Sentence number {i} talks about topic {i % 7}." for i in range(200)]
+TEXT = " ".join(SENTENCES)
+
+
+def test_chunks_stay_within_max_tokens():
+    chunks = chunk_text(TEXT, max_tokens=64, overlap_tokens=16)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 64 for chunk in chunks)
+
+
+def test_chunks_end_on_sentence_boundaries_and_cover_the_text():
+    chunks = chunk_text(TEXT, max_tokens=64, overlap_tokens=0)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks) == TEXT
+
+
+def test_consecutive_chunks_overlap():
+    chunks = chunk_text(TEXT, max_tokens=64, overlap_tokens=16)
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = previous.rsplit(". ", 1)[-1]
+        assert current.startswith(last_sentence)
+
+
+def test_chunks_never_exceed_the_embed_context():
+    limit = token_limit()
+    chunks = chunk_text(TEXT, max_tokens=limit * 4)
+    assert all(count_tokens(chunk) <= limit for chunk in chunks)
+
+
+def test_oversized_sentence_is_split():
+    sentence = " ".join(f"word{i}" for i in range(500))
+    chunks = chunk_text(sentence, max_tokens=50, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+
+
+def test_oversized_word_is_split():
+    blob = "x" * 2000
+    chunks = chunk_text(blob, max_tokens=50, overlap_tokens=0)
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    assert "".join(chunks) == blob
+
+
+def test_fit_to_limit():
+    assert fit_to_limit("short text") == "short text"
+    truncated = fit_to_limit(TEXT * 3)
+    assert count_tokens(truncated) <= token_limit()
+    assert (TEXT * 3).startswith(truncated)
+
+
+def test_pack_batches_respects_token_and_size_limits():
+    # One token per single-letter word under the estimate
+    texts = [" ".join(["a"] * n) for n in (10, 10, 10, 30, 5, 5, 5, 5)]
+    batches = pack_batches(texts, max_batch_tokens=30, max_batch_size=3)
+    assert [position for batch in batches for position in batch] == list(range(8))
+    for batch in batches:
+        assert len(batch) <= 3
+        assert sum(count_tokens(texts[position]) for position in batch) <= 30
+    assert batches == [[0, 1, 2], [3], [4, 5, 6], [7]]
+
+
+def test_pack_batches_gives_an_oversized_text_its_own_batch():
+    texts = ["small", " ".join(["big"] * 100), "small"]
+    assert pack_batches(texts, max_batch_tokens=20, max_batch_size=10) == [
+        [0],
+        [1],
+        [2],
+    ]
+
+
+def test_pack_batches_empty():
+    assert pack_batches([], max_batch_tokens=10, max_batch_size=2) == []
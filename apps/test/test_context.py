@@ -0,0 +1,136 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Estimated token counts: deterministic and no tokenizer download
+os.environ["EMBED_TOKENIZER"] = ""
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services.chunker import count_tokens
+from services.context import assemble_context, mmr_order
+from utils.constants import CONTEXT_CONFIG
+
+
+def hit(message: str, similarity: float, embedding=None) -> dict:
+    """A knowledge hit as retrieval returns it: similarity is cosine distance"""
+    result = {"message": message, "similarity": similarity}
+    if embedding is not None:
+        result["embedding"] = np.asarray(embedding, dtype=np.float32)
+    return result
+
+
+@pytest.fixture
+def context_config(monkeypatch):
+    """Context settings under test, restored afterwards"""
+
+    def configure(**settings):
+        for name, value in settings.items():
+            monkeypatch.setitem(CONTEXT_CONFIG, name, value)
+
+    configure(
+        max_chunks=6,
+        token_budget=10_000,
+        mmr_lambda=0.7,
+        duplicate_similarity=0.95,
+        min_similarity=0.0,
+    )
+    return configure
+
+
+def test_mmr_prefers_a_diverse_chunk_over_a_near_copy():
+    hits = [
+        hit("best", 0.10, [1.0, 0.0, 0.0]),
+        hit("near copy of best", 0.12, [0.9, 0.3, 0.0]),
+        hit("different topic", 0.20, [0.0, 1.0, 0.0]),
+    ]
+    ordered, duplicates = mmr_order(hits, mmr_lambda=0.5, duplicate_similarity=0.99)
+    assert [h["message"] for h in ordered] == [
+        "best",
+        "different topic",
+        "near copy of best",
+    ]
+    assert duplicates == 0
+
+
+def test_mmr_with_lambda_one_is_relevance_order():
+    hits = [
+        hit("third", 0.30, [0.0, 1.0]),
+        hit("first", 0.10, [1.0, 0.0]),
+        hit("second", 0.20, [0.99, 0.1]),
+    ]
+    ordered, _ = mmr_order(hits, mmr_lambda=1.0, duplicate_similarity=1.1)
+    assert [h["message"] for h in ordered] == ["first", "second", "third"]
+
+
+def test_mmr_drops_duplicates_of_picked_chunks():
+    hits = [
+        hit("original", 0.10, [1.0, 0.0]),
+        hit("duplicate", 0.11, [2.0, 0.01]),
+        hit("other", 0.40, [0.0, 1.0]),
+    ]
+    ordered, duplicates = mmr_order(hits, mmr_lambda=0.7, duplicate_similarity=0.95)
+    assert [h["message"] for h in ordered] == ["original", "other"]
+    assert duplicates == 1
+
+
+def test_mmr_without_vectors_keeps_relevance_order():
+    hits = [hit("b", 0.3), hit("a", 0.1), hit("c", 0.5, [1.0, 0.0])]
+    ordered, duplicates = mmr_order(hits, mmr_lambda=0.5, duplicate_similarity=0.95)
+    assert [h["message"] for h in ordered] == ["a", "b", "c"]
+    assert duplicates == 0
+
+
+def test_mmr_handles_empty_and_single_inputs():
+    assert mmr_order([], 0.7, 0.95) == ([], 0)
+    single = [hit("only", 0.2, [1.0, 0.0])]
+    assert mmr_order(single, 0.7, 0.95) == (single, 0)
+
+
+def test_assemble_context_drops_duplicates_and_counts_them(context_config):
+    hits = [
+        hit("alpha facts", 0.10, [1.0, 0.0]),
+        hit("alpha facts again", 0.11, [1.0, 0.001]),
+        hit("beta facts", 0.30, [0.0, 1.0]),
+    ]
+    text, stats = assemble_context(hits)
+    assert text.splitlines() == ["- alpha facts", "- beta facts"]
+    assert stats["duplicates"] == 1
+    assert stats["chunks"] == 2
+
+
+def test_assemble_context_filters_by_min_similarity(context_config):
+    context_config(min_similarity=0.5)
+    hits = [hit("relevant", 0.2), hit("unrelated", 0.8)]
+    text, stats = assemble_context(hits)
+    assert text == "- relevant"
+    assert stats["below_similarity"] == 1
+
+
+def test_assemble_context_skips_chunks_over_the_budget(context_config):
+    long_chunk = " ".join(["word"] * 60)
+    hits = [hit("short one", 0.10), hit(long_chunk, 0.15), hit("short two", 0.20)]
+    budget = count_tokens("- short one") + count_tokens("- short two")
+    context_config(token_budget=budget)
+
+    text, stats = assemble_context(hits)
+    # The long chunk does not fit, but the shorter one after it still does
+    assert text.splitlines() == ["- short one", "- short two"]
+    assert stats["tokens"] == budget
+    assert stats["tokens_saved"] == count_tokens(f"- {long_chunk}")
+
+
+def test_assemble_context_caps_chunk_count(context_config):
+    context_config(max_chunks=2)
+    hits = [hit(f"chunk {i}", 0.1 * i) for i in range(1, 5)]
+    text, stats = assemble_context(hits)
+    assert text.splitlines() == ["- chunk 1", "- chunk 2"]
+    assert stats["chunks"] == 2
+    assert stats["tokens_saved"] == 0
+
+
+def test_assemble_context_without_hits(context_config):
+    text, stats = assemble_context([])
+    assert text == ""
+    assert stats["chunks"] == 0
+    assert stats["tokens"] == 0
@@ -0,0 +1,167 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
+from services.hot_index import HotIndex, train_lists
+
+DIM = 32
+
+
+def clustered(rows: int, clusters: int = 16, seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around a few random centers, like real embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    vectors = centers[rng.integers(clusters, size=rows)]
+    vectors = vectors + 0.3 * rng.normal(size=(rows, DIM))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def build(vectors: np.ndarray, max_bytes=None) -> HotIndex:
+    index = HotIndex(DIM, capacity=len(vectors), max_bytes=max_bytes)
+    for row_id, vector in enumerate(vectors):
+        assert index.add(row_id, f"chunk {row_id}", vector)
+    return index
+
+
+def exact_top(vectors: np.ndarray, query: np.ndarray, limit: int) -> list[str]:
+    scores = vectors @ (query / np.linalg.norm(query))
+    return [f"chunk {i}" for i in np.argsort(-scores)[:limit]]
+
+
+def trained(vectors: np.ndarray) -> HotIndex:
+    index = build(vectors)
+    index.install(*train_lists(index.rows(), len(vectors), seed=1))
+    return index
+
+
+def messages(hits: list[dict]) -> list[str]:
+    return [hit["message"] for hit in hits]
+
+
+def test_exact_search_matches_brute_force():
+    vectors = clustered(500)
+    index = build(vectors)
+    query = clustered(1, seed=7)[0]
+    hits = index.search(query, limit=10, probes=0)
+    assert messages(hits) == exact_top(vectors, query, 10)
+    # similarity is cosine distance, best first
+    distances = [hit["similarity"] for hit in hits]
+    assert distances == sorted(distances)
+    best = vectors @ (query / np.linalg.norm(query))
+    assert distances[0] == pytest.approx(1 - best.max(), abs=1e-5)
+
+
+def test_exact_search_ignores_vector_scale():
+    vectors = clustered(200)
+    index = HotIndex(DIM)
+    for row_id, vector in enumerate(vectors):
+        index.add(row_id, f"chunk {row_id}", vector * (row_id + 1))
+    query = vectors[42] * 10
+    assert index.search(query, limit=1, probes=0)[0]["message"] == "chunk 42"
+
+
+def test_ivf_probing_every_list_is_exact():
+    vectors = clustered(2000)
+    index = trained(vectors)
+    assert index.list_count > 1
+    query = clustered(1, seed=3)[0]
+    hits = index.search(query, limit=10, probes=index.list_count)
+    assert messages(hits) == exact_top(vectors, query, 10)
+
+
+def test_ivf_recall_with_few_probes():
+    vectors = clustered(2000)
+    index = trained(vectors)
+    queries = clustered(50, seed=5)
+    found = 0
+    for query in queries:
+        expected = set(exact_top(vectors, query, 10))
+        found += len(expected & set(messages(index.search(query, 10, probes=8))))
+    assert found / (10 * len(queries)) >= 0.9
+
+
+def test_rows_added_after_training_are_searchable():
+    vectors = clustered(1000)
+    index = trained(vectors)
+    extra = clustered(20, seed=11)
+    for offset, vector in enumerate(extra):
+        index.add(1000 + offset, f"new {offset}", vector)
+    for offset, vector in enumerate(extra):
+        hit = index.search(vector, limit=1, probes=1)[0]
+        assert hit["message"] == f"new {offset}"
+        assert hit["similarity"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_search_many_keeps_each_row_once_with_its_best_similarity():
+    vectors = clustered(300)
+    for index in (build(vectors), trained(vectors)):
+        probes = index.list_count
+        queries = [vectors[3], vectors[3] * 0.5 + vectors[4] * 0.5, vectors[4]]
+        hits = index.search_many(queries, limit=5, probes=probes)
+        assert len(set(messages(hits))) == len(hits)
+        assert messages(hits)[:2] in (["chunk 3", "chunk 4"], ["chunk 4", "chunk 3"])
+        assert hits[0]["similarity"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_search_many_with_vectors_returns_unit_rows():
+    vectors = clustered(100)
+    hits = build(vectors).search_many([vectors[9]], 3, 0, with_vectors=True)
+    assert np.allclose(hits[0]["embedding"], vectors[9], atol=1e-6)
+
+
+def test_search_edge_cases():
+    index = HotIndex(DIM)
+    assert index.search(np.ones(DIM), limit=3, probes=0) == []
+    index.add(1, "only", np.ones(DIM))
+    assert index.search(np.ones(DIM + 1), limit=3, probes=0) == []
+    assert messages(index.search(np.ones(DIM), limit=3, probes=0)) == ["only"]
+
+
+def test_growth_is_proportional_not_doubling():
+    index = HotIndex(DIM, capacity=2048)
+    vectors = clustered(2049)
+    for row_id, vector in enumerate(vectors):
+        index.add(row_id, "x", vector)
+    per_row = DIM * 4 + 8
+    reserved_rows = index.reserved_bytes() // per_row
+    assert 2049 <= reserved_rows <= 2048 * 1.25 + 1
+
+
+def test_memory_counts_filled_rows_only():
+    index = HotIndex(DIM, capacity=10_000)
+    empty = index.memory_bytes()
+    assert index.reserved_bytes() >= 10_000 * DIM * 4
+    assert empty < index.reserved_bytes() / 100
+    index.add(1, "hello", np.ones(DIM))
+    added = index.memory_bytes() - empty
+    assert 0 < added <= index.row_bytes("hello") + 64
+
+
+def test_add_refuses_rows_beyond_the_budget():
+    budget = HotIndex(DIM).memory_bytes() + 50 * HotIndex(DIM).row_bytes("chunk 00")
+    index = HotIndex(DIM, capacity=8, max_bytes=budget)
+    vectors = clustered(200)
+    added = 0
+    for row_id, vector in enumerate(vectors):
+        if not index.add(row_id, f"chunk {row_id:02d}", vector):
+            break
+        added += 1
+    assert 40 <= added < 200
+    assert index.size == added
+    assert index.memory_bytes() <= budget
+    # Capacity never outgrows what the budget could hold
+    assert index.reserved_bytes() <= budget
+
+
+def test_budget_counts_rows_not_reserved_capacity():
+    vectors = clustered(100)
+    index = HotIndex(DIM, capacity=100_000)
+    index.max_bytes = index.memory_bytes() + 200 * index.row_bytes("chunk 000")
+    # Reserved capacity alone is far over the budget, yet rows still fit
+    assert index.reserved_bytes() > index.max_bytes
+    for row_id, vector in enumerate(vectors):
+        assert index.add(row_id, f"chunk {row_id:03d}", vector)
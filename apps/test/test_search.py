@@ -25,6 +25,8 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ai", "src")))
 from controller.embed import insert_embedding_logic
+from services.chunker import count_tokens, iter_chunks, token_limit
+from utils.constants import CHUNKER_CONFIG
 
 # ===============================
 # Config
@@ -43,8 +45,6 @@ HEADERS = {
 }
 MAX_BYTES = 2_000_000
 DEFAULT_PER_HOST_DELAY = 3.0
-EMBED_MAX_TOKENS = 650
-EMBED_OVERLAP = 100
 SUMMARIZE_BEFORE_EMBED = False
 
 # Quality knobs
@@ -249,53 +249,6 @@ def tokenish_len(s: str) -> int:
     return len(re.findall(r"\S+", s))
 
 
-def chunk_text(
-    text: str, max_tokens: int = EMBED_MAX_TOKENS, overlap: int = EMBED_OVERLAP
-) -> list[str]:
-    paras = [p.strip() for p in text.split("\n\n") if p.strip()]
-    chunks: list[str] = []
-    cur_tokens: list[str] = []
-    cur_len = 0
-    step = max(1, max_tokens - overlap)
-
-    def flush():
-        nonlocal cur_tokens, cur_len
-        if cur_tokens:
-            chunks.append(" ".join(cur_tokens))
-        cur_tokens = []
-        cur_len = 0
-
-    for p in paras:
-        words = p.split()
-        wlen = len(words)
-        if wlen > max_tokens:
-            # Flush accumulated buffer then sliding-window this large paragraph.
-            flush()
-            i = 0
-            step = max(1, max_tokens - overlap)
-            while i < len(words):
-                piece = " ".join(words[i : i + max_tokens])
-                chunks.append(piece)
-                i += step
-            continue
-
-        if cur_len + wlen <= max_tokens:
-            cur_tokens.extend(words)
-            cur_len += wlen
-        else:
-            if cur_tokens:
-                # Add overlap tail into new buffer start.
-                tail = cur_tokens[-overlap:] if overlap and len(cur_tokens) > overlap else []
-                flush()
-                cur_tokens.extend(tail)
-                cur_len = len(tail)
-            cur_tokens.extend(words)
-            cur_len += wlen
-
-    flush()
-    return chunks
-
-
 def sha256_text(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
@@ -710,40 +663,18 @@ async def process_url(client: httpx.AsyncClient, url: str, query: str):
         f"{query.upper()} — {title} — {url}\n"
         f"PUBLISHED: {published_at or 'unknown'}\n\n"
     )
-    header_tokens = tokenish_len(header)
-    body_budget = max(1, EMBED_HARD_LIMIT - header_tokens)
-
-    chunks = chunk_text(text, max_tokens=EMBED_CHUNK_TOKENS, overlap=EMBED_OVERLAP)
-
-    async def emit_with_header(body: str):
-        # First break the body into pieces that fit under the body budget (no overlap inside header stage)
-        body_pieces = chunk_text(body, max_tokens=body_budget, overlap=0)
-        for piece in body_pieces:
-            payload = header + piece
-            # Enforce absolute cap: may still overflow due to header tokens.
-            capped = clip_to_tokens(payload, EMBED_HARD_LIMIT)
-            # Final safety split if approximation underestimated tokenization.
-            est_bpe_tokens = int(tokenish_len(capped) * BPE_EXPANSION_FACTOR)
-            if est_bpe_tokens > EMBED_HARD_LIMIT:
-                # Pre-emptive split using stricter limit derived from expansion
-                adjusted_limit = max(50, EMBED_HARD_LIMIT - int(EMBED_HARD_LIMIT * 0.15))
-                final_segments = split_if_over_limit(
-                    capped,
-                    hard_limit=adjusted_limit,
-                    overlap=EMBED_OVERLAP,
-                )
-            else:
-                final_segments = split_if_over_limit(
-                    capped, hard_limit=EMBED_HARD_LIMIT, overlap=EMBED_OVERLAP
-                )
-            for seg_idx, segment in enumerate(final_segments):
-                print(f"[emit] payload segment {seg_idx+1}/{len(final_segments)} length {tokenish_len(segment)} tokens for {url}")
-                await insert_embedding_logic([segment])
-                print(f"[sleeping] 2 seconds")
-                await asyncio.sleep(2.0)
-
-    if SUMMARIZE_BEFORE_EMBED:
-        for chunk in chunks:
+    # Every chunk carries the header, so the body gets what is left of the budget
+    body_budget = max(
+        1,
+        min(CHUNKER_CONFIG["max_tokens"], token_limit() - count_tokens(header) - 1),
+    )
+
+    # Collected for the page and written in one bulk insert at the end
+    pending: list[str] = []
+    chunks = 0
+    for chunk in iter_chunks(text, max_tokens=body_budget):
+        chunks += 1
+        if SUMMARIZE_BEFORE_EMBED:
             sid = str(uuid.uuid4())
             summary = await ai_chat(
                 client,
@@ -751,41 +682,16 @@ async def process_url(client: httpx.AsyncClient, url: str, query: str):
                 f"Summarize for RAG:\n{chunk}",
                 sid,
             )
-            for piece in chunk_text(summary, max_tokens=650, overlap=0):
-                decorated = (
-                    f"{query.upper()} — {title} — {url}\n"
-                    f"PUBLISHED: {published_at or 'unknown'}\n\n"
-                    f"{piece}"
-                )
-                if tokenish_len(decorated) <= EMBED_MAX_TOKENS:
-                    await insert_embedding_logic([decorated])
-                else:
-                    # If still too large, split further and insert each
-                    subchunks = chunk_text(
-                        decorated, max_tokens=EMBED_MAX_TOKENS, overlap=0
-                    )
-                    for sub in subchunks:
-                        if tokenish_len(sub) <= EMBED_MAX_TOKENS:
-                            await insert_embedding_logic([sub])
-    else:
-        for i, chunk in enumerate(chunks):
-            decorated = (
-                f"{query.upper()} — {title} — {url}\n"
-                f"PUBLISHED: {published_at or 'unknown'}\n\n"
-                f"{chunk}"
+            pending.extend(
+                header + piece for piece in iter_chunks(summary, max_tokens=body_budget)
             )
-            if tokenish_len(decorated) <= EMBED_MAX_TOKENS:
-                await insert_embedding_logic([decorated])
-            else:
-                # If still too large, split further and insert each
-                subchunks = chunk_text(
-                    decorated, max_tokens=EMBED_MAX_TOKENS, overlap=0
-                )
-                for sub in subchunks:
-                    if tokenish_len(sub) <= EMBED_MAX_TOKENS:
-                        await insert_embedding_logic([sub])
+        else:
+            pending.append(header + chunk)
 
-    print(f"[indexed] {url} ({len(chunks)} chunks)")
+    if pending:
+        result = await insert_embedding_logic(pending)
+        print(f"[bulk] {result.get('rows', 0)} rows at {result.get('rows_per_sec', 0):.1f} rows/sec")
+    print(f"[indexed] {url} ({chunks} chunks)")
 
 
 # ===============================